@@ -0,0 +1,188 @@
+"""
+Análises financeiras (services/analytics.py) para um usuário com muitas transações.
+
+Popula um SQLite temporário com N linhas de um único dono espalhadas por
+dois anos, reconstrói o rollup diário e mede cada análise (por categoria,
+mês contra mês, saldo acumulado, orçamento e projeção) contra a versão
+ingênua: ler as transações cruas do período e agregar em Python linha a
+linha. Antes de medir, confere que as duas versões chegam nos mesmos totais.
+
+Uso: python -m benchmarks.analytics --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+CATEGORIES = ["Alimentacao", "Transporte", "Moradia", "Saude", "Educacao", "Lazer", "Outros", "Salario"]
+OWNER = "5511999990000"
+
+
+def populate(path: str, rows: int, end: date, seed: int = 5) -> None:
+    rng = random.Random(seed)
+    start = datetime.combine(end - timedelta(days=730), datetime.min.time())
+    span = int(timedelta(days=730).total_seconds())
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    batch_size = 100_000
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for _ in range(min(batch_size, rows - offset)):
+            categoria = rng.choice(CATEGORIES)
+            batch.append(
+                (
+                    OWNER,
+                    "receita" if categoria == "Salario" else "despesa",
+                    round(rng.uniform(1, 500), 2),
+                    "sintetica",
+                    categoria,
+                    categoria.lower(),
+                    (start + timedelta(seconds=rng.randrange(span))).isoformat(sep=" "),
+                )
+            )
+        connection.executemany(
+            'INSERT INTO "transaction" (owner, tipo, valor, descricao, categoria, categoria_key, data_criacao)'
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        connection.commit()
+    connection.close()
+
+
+def naive_rows(session, start: date, end: date):
+    from sqlmodel import select
+
+    from database import models
+    from services.dates import utc_range
+
+    utc_start, utc_end = utc_range(start, end)
+    transaction = models.Transaction
+    return session.exec(
+        select(transaction.data_criacao, transaction.tipo, transaction.categoria_key, transaction.valor).where(
+            transaction.owner == OWNER, transaction.data_criacao >= utc_start, transaction.data_criacao < utc_end
+        )
+    ).all()
+
+
+def naive_breakdown(session, start: date, end: date) -> dict[str, float]:
+    totals: dict[str, float] = defaultdict(float)
+    for _, tipo, categoria_key, valor in naive_rows(session, start, end):
+        if tipo == "despesa":
+            totals[categoria_key] += valor
+    return totals
+
+
+def naive_balance(session, start: date, end: date) -> list[float]:
+    from database.models import local_day
+
+    opening = 0.0
+    for _, tipo, _, valor in naive_rows(session, date(1900, 1, 1), start - timedelta(days=1)):
+        opening += -valor if tipo == "despesa" else valor
+    daily: dict[date, float] = defaultdict(float)
+    for data_criacao, tipo, _, valor in naive_rows(session, start, end):
+        daily[local_day(data_criacao)] += -valor if tipo == "despesa" else valor
+    balances, balance = [], opening
+    day = start
+    while day <= end:
+        balance += daily[day]
+        balances.append(balance)
+        day += timedelta(days=1)
+    return balances
+
+
+def naive_month_over_month(session, reference: date) -> tuple[float, float]:
+    from services.analytics import month_bounds
+
+    current_start, _ = month_bounds(reference)
+    previous_start, _ = month_bounds(current_start - timedelta(days=1))
+    current = sum(naive_breakdown(session, current_start, reference).values())
+    previous = sum(naive_breakdown(session, previous_start, current_start - timedelta(days=1)).values())
+    return current, previous
+
+
+def timed(function, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-analytics-"))
+
+    from sqlmodel import Session
+
+    from database.database import engine
+    from database.migrations import run_migrations
+    from database.rollups import rebuild_rollups
+    from services import analytics
+    from services.dates import local_today
+
+    today = local_today()
+    run_migrations(engine)
+    engine.dispose()
+    started = time.perf_counter()
+    populate("assistente_financeiro.db", args.rows, today)
+    rebuild_rollups(engine)
+    print(f"{args.rows:,} linhas + rollup em {time.perf_counter() - started:.1f}s")
+
+    year_start = today - timedelta(days=364)
+    month_start = today.replace(day=1)
+    with Session(engine) as session:
+        breakdown = analytics.category_breakdown(analytics.load_daily(session, OWNER, year_start, today))
+        naive = naive_breakdown(session, year_start, today)
+        if abs(breakdown["total"] - sum(naive.values())) > 0.05:
+            raise SystemExit(f"Totais por categoria divergem: {breakdown['total']} != {sum(naive.values()):.2f}")
+        balance = analytics.running_balance(session, OWNER, month_start, today)
+        if abs(balance["closing_balance"] - naive_balance(session, month_start, today)[-1]) > 0.05:
+            raise SystemExit("Saldo acumulado diverge da soma das transações")
+        comparison = analytics.month_over_month(session, OWNER, today)
+        if abs(comparison["current_total"] - naive_month_over_month(session, today)[0]) > 0.05:
+            raise SystemExit("Comparação mês a mês diverge da soma das transações")
+
+        cases = [
+            (
+                "por categoria (12 meses)",
+                lambda: analytics.category_breakdown(analytics.load_daily(session, OWNER, year_start, today)),
+                lambda: naive_breakdown(session, year_start, today),
+            ),
+            (
+                "mes contra mes",
+                lambda: analytics.month_over_month(session, OWNER, today),
+                lambda: naive_month_over_month(session, today),
+            ),
+            (
+                "saldo acumulado (mes)",
+                lambda: analytics.running_balance(session, OWNER, month_start, today),
+                lambda: naive_balance(session, month_start, today),
+            ),
+            ("orcamento", lambda: analytics.budget_burndown(session, OWNER, 50_000, today), None),
+            ("projecao", lambda: analytics.forecast_month(session, OWNER, today), None),
+        ]
+        for label, vectorized, row_by_row in cases:
+            fast = statistics.median(timed(vectorized, args.repeat))
+            line = f"{label:<26} rollup+numpy {fast:8.2f}ms"
+            if row_by_row is not None:
+                slow = statistics.median(timed(row_by_row, max(1, args.repeat // 5)))
+                line += f"   linha a linha {slow:9.2f}ms   ({slow / fast:,.0f}x)"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
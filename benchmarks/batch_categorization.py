@@ -0,0 +1,96 @@
+"""
+Categorização em lote (services.categorizer) contra o caminho de uma
+descrição por chamada (main.extract_transaction_details), ambos contra a
+OpenAI falsa com latência configurável. A OpenAI falsa também devolve uma
+fração de itens inválidos nos lotes, para exercitar as retentativas.
+
+Uso: python -m benchmarks.batch_categorization --descriptions 1000 --latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_upstreams import create_fake_openai, run_server
+
+OPENAI_PORT = 18031
+WORDS = ["Uber", "Posto", "Mercado", "Ifood", "Padaria", "Aluguel", "Farmacia", "Netflix", "Curso", "Loja"]
+
+
+def synthetic_descriptions(count: int, seed: int = 5) -> list[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(WORDS)} {index}" for index in range(count)]
+
+
+async def one_at_a_time(app_module, descriptions: list[str], concurrency: int) -> dict[str, str]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(descricao: str) -> tuple[str, str]:
+        async with semaphore:
+            details = await app_module.extract_transaction_details(descricao)
+        return descricao, details["categoria"]
+
+    return dict(await asyncio.gather(*(one(descricao) for descricao in descriptions)))
+
+
+async def batched(categorizer, descriptions: list[str]) -> dict[str, str]:
+    return await categorizer.categorize(descriptions)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--descriptions", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.3, help="latência da OpenAI falsa, em segundos")
+    parser.add_argument("--malformed-rate", type=float, default=0.02, help="fração de itens inválidos nos lotes")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+            # Só o cache em memória, zerado entre as execuções: a camada
+            # compartilhada entregaria à segunda execução as respostas da primeira
+            "LLM_CACHE_SHARED": "0",
+        }
+    )
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-categorize-"))
+
+    import main as app_module
+    from services import cache, llm_gateway
+    from services.categorizer import BatchCategorizer
+
+    fake_openai = create_fake_openai(latency=args.latency, malformed_rate=args.malformed_rate)
+    run_server(fake_openai, OPENAI_PORT)
+    descriptions = synthetic_descriptions(args.descriptions)
+
+    runs = {
+        "uma por chamada": lambda: one_at_a_time(app_module, descriptions, args.concurrency),
+        "em lote": lambda: batched(BatchCategorizer(args.batch_size, args.concurrency), descriptions),
+    }
+    results = {}
+    for label, run in runs.items():
+        cache._llm_cache = None
+        llm_gateway._gateway = None
+        calls_before = fake_openai.state.calls
+        started = time.perf_counter()
+        results[label] = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        calls = fake_openai.state.calls - calls_before
+        print(
+            f"{label:<16} descricoes={len(descriptions)} chamadas_llm={calls:<5} "
+            f"tempo={elapsed:6.2f}s descricoes/s={len(descriptions) / elapsed:8.1f}"
+        )
+
+    agreement = sum(results["em lote"][d] == results["uma por chamada"][d] for d in descriptions)
+    print(f"mesma categoria nos dois caminhos: {agreement}/{len(descriptions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Importação em massa de extratos (POST /transactions/import).
+
+Gera um CSV sintético de N linhas e importa via services.statement_import,
+reportando linhas/s. Em seguida reimporta o mesmo arquivo (tudo deve virar
+duplicata) e, para comparação, grava uma amostra linha a linha pelo ORM com um
+commit por linha, como faz POST /transactions/. Antes confere a leitura de
+valores em formato brasileiro e americano (AMOUNT_CASES; None = linha inválida).
+
+Uso: python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+DESCRIPTIONS = [
+    "Uber *trip", "Ifood *restaurante", "Supermercado Dia", "Netflix.com", "Posto Shell gasolina",
+    "Farmacia Pague Menos", "Padaria Real", "Pix recebido", "Aluguel", "Loja 123",
+]
+
+AMOUNT_CASES = {
+    "1.234,56": 1234.56,
+    "1,234.56": 1234.56,
+    "-12,50": -12.5,
+    "-12.50": -12.5,
+    "(52,90)": -52.9,
+    "R$ 1.234.567,89": 1234567.89,
+    "1,000,000.25": 1000000.25,
+    "1,000": None,
+    "1.500": None,
+    "1.234.56": None,
+}
+
+
+def check_amounts() -> None:
+    from services.statement_import import parse_signed_amount
+
+    for value, expected in AMOUNT_CASES.items():
+        try:
+            amount = parse_signed_amount(value)
+        except ValueError:
+            amount = None
+        if amount != expected:
+            raise SystemExit(f"valor {value!r} lido como {amount}, esperado {expected}")
+    print(f"leitura de valores: {len(AMOUNT_CASES)} casos conferidos")
+
+
+def write_csv(path: str, rows: int, seed: int = 11) -> None:
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("Data;Histórico;Valor\n")
+        for index in range(rows):
+            day = start + timedelta(days=rng.randrange(365))
+            descricao = f"{rng.choice(DESCRIPTIONS)} {index % 997}"
+            valor = rng.uniform(1, 900) * (1 if descricao.startswith("Pix") else -1)
+            file.write(f"{day:%d/%m/%Y};{descricao};{valor:.2f}".replace(".", ",") + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--orm-sample", type=int, default=2_000, help="linhas gravadas uma a uma para comparação")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-import-"))
+
+    from sqlmodel import Session
+
+    from database import models
+    from database.database import engine
+    from database.migrations import run_migrations
+    from database.rollups import check_rollups
+    from services.statement_import import import_statement
+
+    check_amounts()
+    run_migrations(engine)
+    write_csv("extrato.csv", args.rows)
+
+    for label in ("primeira importacao", "reimportacao"):
+        with open("extrato.csv", encoding="utf-8", newline="") as stream:
+            result = import_statement("5511999990000", stream)
+        print(
+            f"{label:<20} lidas={result.rows_read} inseridas={result.inserted} duplicadas={result.duplicates} "
+            f"invalidas={result.invalid} {result.seconds:.2f}s {result.rows_per_second:,.0f} linhas/s"
+        )
+
+    if check_rollups(engine):
+        raise SystemExit("O rollup ficou inconsistente após a importação")
+
+    started = time.perf_counter()
+    for index in range(args.orm_sample):
+        with Session(engine) as session:
+            session.add(
+                models.Transaction(
+                    owner="5511999990001", tipo="despesa", valor=10.0 + index, descricao="linha a linha", categoria="Outros"
+                )
+            )
+            session.commit()
+    elapsed = time.perf_counter() - started
+    print(f"{'linha a linha (ORM)':<20} {args.orm_sample} linhas {elapsed:.2f}s {args.orm_sample / elapsed:,.0f} linhas/s")
+
+
+if __name__ == "__main__":
+    main()
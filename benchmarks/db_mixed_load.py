@@ -0,0 +1,153 @@
+"""
+Carga mista de leitura e escrita no SQLite.
+
+Threads escritoras gravam transações (como o webhook e o POST /transactions)
+enquanto threads leitoras fazem as consultas do dashboard e do chatbot
+(listagem paginada e soma do mês). Compara as configurações:
+- legacy: sem PRAGMAs (journal de rollback), cada escrita com commit próprio;
+- wal: perfil de PRAGMAs padrão, cada escrita com commit próprio;
+- wal+writer: perfil padrão com o DatabaseWriter (escritor único + group commit);
+- durable / durable+writer: o mesmo com synchronous=FULL (um fsync por commit),
+  onde o group commit mais aparece.
+
+Uso: python -m benchmarks.db_mixed_load --seconds 10 --writers 8 --readers 8
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def seed(engine, rows: int, owners: int) -> None:
+    from database import models
+    from database.rollups import rebuild_rollups
+
+    rng = random.Random(3)
+    start = datetime.utcnow() - timedelta(days=120)
+    records = []
+    for _ in range(rows):
+        categoria = rng.choice(["Alimentacao", "Transporte", "Lazer", "Outros"])
+        records.append({
+            "owner": f"owner-{rng.randrange(owners)}",
+            "tipo": "despesa",
+            "valor": round(rng.uniform(1, 300), 2),
+            "descricao": "seed",
+            "categoria": categoria,
+            "categoria_key": categoria.lower(),
+            "data_criacao": start + timedelta(seconds=rng.randrange(120 * 86400)),
+        })
+    with engine.begin() as connection:
+        connection.execute(models.Transaction.__table__.insert(), records)
+    rebuild_rollups(engine)
+
+
+def run_config(label: str, path: str, profile: str, serialized: bool, args) -> None:
+    from sqlmodel import Session, SQLModel
+
+    from database import models, rollups
+    from database.database import DatabaseWriter, DirectWriter, create_db_engine
+    from routers.transactions import TransactionFilters, filtered_statement
+    from services.dates import local_today, utc_range
+
+    engine = create_db_engine(f"sqlite:///{path}", profile, pool_size=args.writers + args.readers)
+    SQLModel.metadata.create_all(engine)
+    seed(engine, args.rows, args.owners)
+    writer = DatabaseWriter(engine) if serialized else DirectWriter(engine)
+
+    stop = threading.Event()
+    counters = {"writes": 0, "reads": 0, "errors": 0}
+    write_latencies: list[float] = []
+    read_latencies: list[float] = []
+    lock = threading.Lock()
+    month_start, month_end = utc_range(local_today().replace(day=1), local_today())
+
+    def write_loop(worker: int) -> None:
+        rng = random.Random(worker)
+        while not stop.is_set():
+            owner = f"owner-{rng.randrange(args.owners)}"
+
+            def job(session: Session) -> None:
+                session.add(models.Transaction(
+                    owner=owner, tipo="despesa", valor=round(rng.uniform(1, 300), 2),
+                    descricao="carga", categoria=rng.choice(["Alimentacao", "Transporte"]),
+                ))
+
+            started = time.perf_counter()
+            try:
+                writer.write(job)
+            except Exception:
+                with lock:
+                    counters["errors"] += 1
+                continue
+            with lock:
+                counters["writes"] += 1
+                write_latencies.append((time.perf_counter() - started) * 1000)
+
+    def read_loop(worker: int) -> None:
+        rng = random.Random(1000 + worker)
+        while not stop.is_set():
+            owner = f"owner-{rng.randrange(args.owners)}"
+            started = time.perf_counter()
+            try:
+                with Session(engine) as session:
+                    session.exec(filtered_statement(TransactionFilters(owner=owner)).limit(50)).all()
+                    rollups.sum_transactions(session, owner=owner, start=month_start, end=month_end, tipo="despesa")
+            except Exception:
+                with lock:
+                    counters["errors"] += 1
+                continue
+            with lock:
+                counters["reads"] += 1
+                read_latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=write_loop, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=read_loop, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    engine.dispose()
+
+    def p95(samples: list[float]) -> float:
+        return statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else 0.0
+
+    print(
+        f"{label:<15} escritas/s={counters['writes'] / args.seconds:8.1f} (p95 {p95(write_latencies):7.1f}ms) "
+        f"leituras/s={counters['reads'] / args.seconds:8.1f} (p95 {p95(read_latencies):7.1f}ms) "
+        f"erros={counters['errors']}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--owners", type=int, default=2_000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-db-mixed-"))
+
+    for label, profile, serialized in (
+        ("legacy", "legacy", False),
+        ("wal", "balanced", False),
+        ("wal+writer", "balanced", True),
+        ("durable", "durable", False),
+        ("durable+writer", "durable", True),
+    ):
+        run_config(label, f"{label.replace('+', '_')}.db", profile, serialized, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Servidores falsos da OpenAI e da Zenvia para benchmarks locais.
+Ambos aceitam latência e taxa de erro configuráveis.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+FAKE_CATEGORIES = {
+    "uber": "Transporte", "posto": "Transporte", "mercado": "Alimentacao", "ifood": "Alimentacao",
+    "padaria": "Alimentacao", "aluguel": "Moradia", "farmacia": "Saude", "netflix": "Lazer", "curso": "Educacao",
+}
+
+
+def _fake_category(description: str) -> str:
+    lowered = description.lower()
+    return next((category for keyword, category in FAKE_CATEGORIES.items() if keyword in lowered), "Outros")
+
+
+def _fake_reply(messages: list[dict], malformed_rate: float = 0.0) -> str:
+    """
+    Gera uma resposta plausível a partir do prompt de sistema, imitando o
+    formato que cada função de main.py espera. `malformed_rate` troca itens
+    das respostas em lote por null.
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    if "categoriza descricoes" in system:
+        categories = [
+            None if random.random() < malformed_rate else _fake_category(description)
+            for description in json.loads(user)
+        ]
+        return json.dumps({"categorias": categories})
+    lowered = user.lower()
+    is_query = lowered.startswith(("quanto", "liste", "listar", "quais", "últimas", "ultimas", "total"))
+    amount_match = re.search(r"\d+(?:[.,]\d+)?", user)
+    amount = float(amount_match.group().replace(",", ".")) if amount_match else 0.0
+    transaction = {
+        "tipo": "receita" if "recebi" in lowered else "despesa",
+        "valor": amount,
+        "descricao": user[:40],
+        "categoria": _fake_category(user),
+    }
+    query_plan = {"aggregation": "list" if lowered.startswith(("liste", "listar", "quais")) else "sum", "filters": {}}
+
+    if '"intent"' in system:
+        if is_query:
+            return json.dumps({"intent": "query_transactions", "query_plan": query_plan})
+        return json.dumps({"intent": "new_transaction", "transaction": transaction})
+    if "classificador de intenções" in system:
+        return "query_transactions" if is_query else "new_transaction"
+    if "plano de consulta" in system or "aggregation" in system:
+        return json.dumps(query_plan)
+    return json.dumps(transaction)
+
+
+def create_fake_openai(latency: float = 0.0, error_rate: float = 0.0, malformed_rate: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.latency = latency
+    app.state.error_rate = error_rate
+    app.state.malformed_rate = malformed_rate
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.calls += 1
+        body = await request.json()
+        await asyncio.sleep(app.state.latency)
+        if random.random() < app.state.error_rate:
+            return JSONResponse({"error": {"message": "fake upstream error"}}, status_code=503)
+        content = _fake_reply(body.get("messages", []), app.state.malformed_rate)
+        return {
+            "id": f"chatcmpl-fake-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            ],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }
+
+    return app
+
+
+def create_fake_zenvia(latency: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0.0) -> FastAPI:
+    """
+    `rate_limit` > 0 responde 429 (com Retry-After) acima dessa taxa por
+    segundo, em janelas de um segundo por canal, como o limite do provedor.
+    `sent_at` guarda o instante (perf_counter) de cada item de `sent`.
+    """
+    app = FastAPI()
+    app.state.sent = []
+    app.state.sent_at = []
+    app.state.latency = latency
+    app.state.error_rate = error_rate
+    app.state.rate_limit = rate_limit
+    app.state.rejected = 0
+    windows: dict[str, list[float]] = {}
+
+    @app.post("/v2/channels/{channel}/messages")
+    async def send_message(channel: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(app.state.latency)
+        if app.state.rate_limit:
+            now = time.monotonic()
+            window = [moment for moment in windows.get(channel, []) if now - moment < 1.0]
+            if len(window) >= app.state.rate_limit:
+                windows[channel] = window
+                app.state.rejected += 1
+                return JSONResponse({"message": "rate limit"}, status_code=429, headers={"Retry-After": "1"})
+            windows[channel] = window + [now]
+        if random.random() < app.state.error_rate:
+            return JSONResponse({"message": "fake upstream error"}, status_code=503)
+        app.state.sent.append({**body, "channel": channel})
+        app.state.sent_at.append(time.perf_counter())
+        return {"id": f"zenvia-fake-{len(app.state.sent)}"}
+
+    return app
+
+
+def run_server(app: FastAPI, port: int) -> uvicorn.Server:
+    """
+    Sobe o app em uma thread daemon e espera o servidor aceitar conexões.
+    """
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
@@ -0,0 +1,99 @@
+"""
+Orçamento de tempo de import de main.py (cold start de cada processo novo).
+
+Importa main em --runs processos novos, a partir de um diretório vazio, e
+mostra a mediana do tempo de import e os imports diretos mais caros
+(python -X importtime). Falha com código 1 se a mediana passar de
+--budget-ms, se um módulo que deve ser carregado só no primeiro uso (openai,
+numpy, dialeto do PostgreSQL) aparecer em sys.modules, ou se o import criar
+arquivos no diretório (banco, fila: DDL e conexões ficam para o startup e
+para `python -m database.migrations`).
+
+Uso: python -m benchmarks.import_time --runs 7 --budget-ms 1200
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LAZY_MODULES = ("openai", "numpy", "sqlalchemy.dialects.postgresql")
+
+SNIPPET = f"""
+import json, sys, time
+sys.path.insert(0, {str(ROOT)!r})
+started = time.perf_counter()
+import main
+print(json.dumps({{
+    "ms": (time.perf_counter() - started) * 1000,
+    "loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def import_once(workdir: str, profile: bool = False) -> tuple[dict, str]:
+    command = [sys.executable] + (["-X", "importtime"] if profile else []) + ["-c", SNIPPET]
+    result = subprocess.run(command, cwd=workdir, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def direct_imports(importtime: str, top: int) -> list[tuple[str, float]]:
+    """
+    Imports feitos diretamente por main, pelo tempo acumulado.
+    """
+    entries = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name[1:]
+        # Dois espaços de recuo: importado pelo próprio main
+        if name.startswith("   ") or not name.startswith("  ") or not cumulative.strip().isdigit():
+            continue
+        entries.append((name.strip(), int(cumulative) / 1000))
+    return sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=1200.0)
+    parser.add_argument("--top", type=int, default=10, help="imports diretos mais caros a mostrar")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-import-")
+    # Primeira execução descartada: aquece o cache de bytecode e o page cache
+    import_once(workdir)
+    timings = []
+    loaded: set[str] = set()
+    for _ in range(args.runs):
+        result, _ = import_once(workdir)
+        timings.append(result["ms"])
+        loaded.update(result["loaded"])
+    _, importtime = import_once(workdir, profile=True)
+
+    median = statistics.median(timings)
+    print(f"import main: mediana={median:.0f}ms min={min(timings):.0f}ms max={max(timings):.0f}ms ({args.runs} processos)")
+    print("imports diretos mais caros (com -X importtime):")
+    for name, elapsed in direct_imports(importtime, args.top):
+        print(f"  {name:<40} {elapsed:8.1f}ms")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"mediana {median:.0f}ms acima do orçamento de {args.budget_ms:.0f}ms")
+    if loaded:
+        failures.append(f"módulos carregados no import: {', '.join(sorted(loaded))}")
+    created = os.listdir(workdir)
+    if created:
+        failures.append(f"o import criou arquivos: {', '.join(sorted(created))}")
+    if failures:
+        raise SystemExit("; ".join(failures))
+    print(f"dentro do orçamento de {args.budget_ms:.0f}ms, sem módulos pesados nem arquivos criados no import")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Exercita o LLMGateway contra a OpenAI falsa: retentativas com erros
+intermitentes, abertura do circuit breaker com o provedor fora do ar,
+recuperação depois do cooldown e uma chamada de teste (meio aberto)
+cancelada, que não pode deixar o circuito recusando tudo. Falha com código 1
+se o gateway não se recuperar.
+
+Uso: python -m benchmarks.llm_gateway_resilience --calls 200 --error-rate 0.3
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fake_upstreams import create_fake_openai, run_server
+
+OPENAI_PORT = 18011
+
+
+async def burst(gateway, calls: int) -> tuple[int, int, float]:
+    from services.llm_gateway import CircuitOpenError
+
+    ok = failed = 0
+    started = time.perf_counter()
+
+    async def one() -> None:
+        nonlocal ok, failed
+        try:
+            await gateway.chat(messages=[{"role": "user", "content": "gastei 10 no uber"}], temperature=0)
+            ok += 1
+        except CircuitOpenError:
+            failed += 1
+        except Exception:
+            failed += 1
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return ok, failed, (time.perf_counter() - started) * 1000
+
+
+async def run(args: argparse.Namespace, fake_openai) -> None:
+    from services.llm_gateway import LLMGateway
+
+    gateway = LLMGateway(max_concurrency=args.concurrency)
+    phases = (
+        (f"erros intermitentes {args.error_rate:.0%}", args.error_rate),
+        ("provedor fora do ar", 1.0),
+        ("circuito aberto", 1.0),
+    )
+    for label, error_rate in phases:
+        fake_openai.state.error_rate = error_rate
+        calls_before = fake_openai.state.calls
+        ok, failed, elapsed = await burst(gateway, args.calls)
+        print(
+            f"{label:<28} ok={ok:<4} falhas={failed:<4} chamadas_upstream={fake_openai.state.calls - calls_before:<5} "
+            f"tempo={elapsed:8.1f}ms breaker={gateway.breaker.state} stats={gateway.stats}"
+        )
+
+    fake_openai.state.error_rate = 0.0
+    await asyncio.sleep(gateway.breaker.cooldown)
+    ok, failed, elapsed = await burst(gateway, 1)
+    ok2, failed2, _ = await burst(gateway, args.calls)
+    print(f"{'apos cooldown':<28} ok={ok + ok2:<4} falhas={failed + failed2:<4} breaker={gateway.breaker.state}")
+    recovered = gateway.breaker.state == "closed"
+
+    # Abre o circuito, espera o cooldown e cancela a chamada de teste no meio,
+    # como o visibility timeout do WorkerPool faria
+    fake_openai.state.error_rate = 1.0
+    await burst(gateway, args.calls)
+    fake_openai.state.error_rate = 0.0
+    await asyncio.sleep(gateway.breaker.cooldown)
+    fake_openai.state.latency = 5.0
+    try:
+        await asyncio.wait_for(gateway.chat(messages=[{"role": "user", "content": "gastei 10 no uber"}]), 0.2)
+    except asyncio.TimeoutError:
+        pass
+    fake_openai.state.latency = 0.0
+    ok, failed, _ = await burst(gateway, 1)
+    print(f"{'teste cancelado':<28} ok={ok:<4} falhas={failed:<4} breaker={gateway.breaker.state}")
+    await gateway.close()
+    if not recovered or ok != 1:
+        raise SystemExit("o circuit breaker não se recuperou")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+            "LLM_BACKOFF_BASE": "0.01",
+            "LLM_BREAKER_COOLDOWN": "1",
+        }
+    )
+    fake_openai = create_fake_openai()
+    run_server(fake_openai, OPENAI_PORT)
+    asyncio.run(run(args, fake_openai))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Carga ponta a ponta: webhook -> fila -> workers -> OpenAI -> SQLite -> outbox -> Zenvia.
+
+Sobe a OpenAI e a Zenvia falsas (latência e taxa de erro configuráveis) e a
+API com os workers, popula o SQLite com --seed-rows transações espalhadas
+entre os remetentes e reproduz webhooks em /webhook/zenvia em carga aberta,
+a uma ou mais taxas (--rate 10 20 40 roda uma fase por taxa). As mensagens
+são sintéticas, tiradas de benchmarks/data/rule_parser_corpus.jsonl com
+valores sorteados, ou gravadas: --payloads aponta para um JSONL com um corpo
+de webhook da Zenvia por linha, repetido até --messages.
+
+Para cada fase mostra a vazão (mensagens respondidas/s), p50/p95/p99 da
+aceitação do webhook e da latência ponta a ponta (envio do webhook até a
+resposta chegar na Zenvia falsa) e as chamadas à OpenAI por mensagem, e
+compara com o baseline em benchmarks/data/load_baseline.json: uma métrica
+pior que o baseline além de --tolerance (e de 25 ms, nas latências) é
+regressão e o comando sai com código 1. --save-baseline grava o resultado
+como novo baseline. Acima de ZENVIA_RATE_PER_SECOND (20/s por padrão) a vazão
+fica presa no limite de envio do outbox e a latência ponta a ponta cresce com
+a fila de respostas; as taxas padrão ficam uma abaixo e outra acima dele.
+Os números dependem da máquina: grave o baseline na mesma máquina em que vai
+comparar.
+
+Uso: python -m benchmarks.load_suite --messages 500 --rate 10 30 --seed-rows 100000
+     python -m benchmarks.load_suite --payloads webhooks.jsonl --openai-latency 0.4 --openai-error-rate 0.05
+     python -m benchmarks.load_suite --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_upstreams import create_fake_openai, create_fake_zenvia, run_server
+from benchmarks.webhook_latency import percentile
+
+APP_PORT = 18050
+OPENAI_PORT = 18051
+ZENVIA_PORT = 18052
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+CORPUS_PATH = DATA_DIR / "rule_parser_corpus.jsonl"
+BASELINE_PATH = DATA_DIR / "load_baseline.json"
+
+CATEGORIES = ["Alimentacao", "Transporte", "Moradia", "Saude", "Educacao", "Lazer", "Outros", "Salario"]
+AMOUNT = re.compile(r"\d+(?:[.,]\d+)*")
+# Vazão é melhor quando maior; as demais métricas, quando menores
+HIGHER_IS_BETTER = {"throughput"}
+# Diferenças de latência abaixo disso são ruído de escalonamento, não regressão
+MIN_LATENCY_DELTA_MS = 25.0
+
+
+def sender_number(index: int) -> str:
+    return f"55119{index:08d}"
+
+
+def seed_database(engine, rows: int, senders: int, seed: int = 11) -> None:
+    """
+    Grava `rows` transações dos últimos 400 dias entre os remetentes da carga
+    e recalcula o rollup diário.
+    """
+    from database import models
+    from database.rollups import rebuild_rollups
+
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=400)
+    span = 400 * 86400
+    batch_size = 50_000
+    for offset in range(0, rows, batch_size):
+        records = []
+        for _ in range(min(batch_size, rows - offset)):
+            categoria = rng.choice(CATEGORIES)
+            records.append({
+                "owner": sender_number(rng.randrange(senders)),
+                "tipo": "receita" if categoria == "Salario" else "despesa",
+                "valor": round(rng.uniform(1, 500), 2),
+                "descricao": "seed",
+                "categoria": categoria,
+                "categoria_key": categoria.lower(),
+                "data_criacao": start + timedelta(seconds=rng.randrange(span)),
+            })
+        with engine.begin() as connection:
+            connection.execute(models.Transaction.__table__.insert(), records)
+    rebuild_rollups(engine)
+
+
+def synthetic_payloads(total: int, senders: int, prefix: str, rng: random.Random) -> list[dict]:
+    """
+    Mensagens do corpus do parser de regras. Lançamentos recebem um valor
+    sorteado, como na vida real; consultas se repetem e podem cair no cache.
+    """
+    corpus = [json.loads(line) for line in CORPUS_PATH.read_text(encoding="utf-8").splitlines() if line.strip()]
+    payloads = []
+    for index in range(total):
+        entry = rng.choice(corpus)
+        text = entry["text"]
+        if entry["intent"] == "new_transaction":
+            amount = f"{rng.uniform(1, 500):.2f}".replace(".", ",")
+            text = AMOUNT.sub(amount, text, count=1)
+        payloads.append({
+            "message": {
+                "id": f"{prefix}-{index}",
+                "from": sender_number(rng.randrange(senders)),
+                "contents": [{"type": "text", "text": text}],
+            }
+        })
+    return payloads
+
+
+def recorded_payloads(path: str, total: int, prefix: str) -> list[dict]:
+    """
+    Repete os webhooks gravados até `total`. Cada repetição ganha um id novo
+    para não ser descartada como reenvio; eventos sem texto ficam de fora,
+    porque não geram resposta.
+    """
+    recorded = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        body = json.loads(line)
+        message = body.get("message", {})
+        if message.get("contents", [{}])[0].get("text", "").strip():
+            recorded.append(body)
+    if not recorded:
+        raise SystemExit(f"Nenhum webhook com texto em {path}")
+    payloads = []
+    for index in range(total):
+        body = json.loads(json.dumps(recorded[index % len(recorded)]))
+        message = body["message"]
+        message["id"] = f"{prefix}-{message.get('id') or 'gravado'}-{index}"
+        payloads.append(body)
+    return payloads
+
+
+async def fire(payloads: list[dict], rate: float) -> list[tuple[str, float, float, int]]:
+    """
+    Carga aberta: o webhook i sai em i/rate segundos, mesmo que os anteriores
+    ainda não tenham respondido. Devolve (remetente, instante do envio,
+    latência de aceitação em ms, status) por webhook.
+    """
+    sent: list[tuple[str, float, float, int]] = []
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", timeout=60.0) as client:
+
+        async def one(payload: dict) -> None:
+            started = time.perf_counter()
+            try:
+                status = (await client.post("/webhook/zenvia", json=payload)).status_code
+            except httpx.HTTPError:
+                status = 0
+            sent.append((payload["message"]["from"], started, (time.perf_counter() - started) * 1000, status))
+
+        tasks = []
+        origin = time.perf_counter()
+        for index, payload in enumerate(payloads):
+            delay = origin + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(payload)))
+        await asyncio.gather(*tasks)
+
+    return sent
+
+
+def wait_replies(fake_zenvia, expected: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while len(fake_zenvia.state.sent) < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def end_to_end(sent: list[tuple[str, float, float, int]], fake_zenvia) -> list[float]:
+    """
+    Cada mensagem aceita gera exatamente uma resposta para o mesmo remetente:
+    pareia, por remetente, o k-ésimo webhook com a k-ésima resposta.
+    """
+    requests = defaultdict(list)
+    for sender, started, _, status in sent:
+        if status == 200:
+            requests[sender].append(started)
+    replies = defaultdict(list)
+    for body, arrived in zip(fake_zenvia.state.sent, fake_zenvia.state.sent_at):
+        replies[body["to"]].append(arrived)
+    latencies = []
+    for sender, starts in requests.items():
+        for started, arrived in zip(sorted(starts), sorted(replies[sender])):
+            latencies.append((arrived - started) * 1000)
+    return latencies
+
+
+def run_phase(payloads: list[dict], rate: float, fake_openai, fake_zenvia, drain_timeout: float) -> dict:
+    fake_openai.state.calls = 0
+    fake_zenvia.state.sent.clear()
+    fake_zenvia.state.sent_at.clear()
+
+    started = time.perf_counter()
+    sent = asyncio.run(fire(payloads, rate))
+    accepted = sum(1 for *_, status in sent if status == 200)
+    wait_replies(fake_zenvia, accepted, drain_timeout)
+    replies = len(fake_zenvia.state.sent)
+    finished = fake_zenvia.state.sent_at[-1] if fake_zenvia.state.sent_at else time.perf_counter()
+
+    accept_ms = [latency for _, _, latency, _ in sent]
+    e2e_ms = end_to_end(sent, fake_zenvia) or [float("nan")]
+    results = {
+        "accepted": accepted,
+        "replies": replies,
+        "throughput": replies / (finished - started),
+        "llm_calls_per_message": fake_openai.state.calls / max(accepted, 1),
+    }
+    for label, values in (("accept", accept_ms), ("e2e", e2e_ms)):
+        for pct in (50, 95, 99):
+            results[f"{label}_p{pct}_ms"] = percentile(values, pct)
+    return results
+
+
+def report(rate: float, results: dict, messages: int) -> None:
+    print(
+        f"taxa {rate:>6.1f}/s  aceitas={results['accepted']}/{messages} respostas={results['replies']} "
+        f"vazao={results['throughput']:6.1f} msg/s  llm/msg={results['llm_calls_per_message']:.2f}"
+    )
+    for label, name in (("accept", "aceitação"), ("e2e", "ponta a ponta")):
+        print(
+            f"  {name:<14} p50={results[f'{label}_p50_ms']:8.1f}ms p95={results[f'{label}_p95_ms']:8.1f}ms "
+            f"p99={results[f'{label}_p99_ms']:8.1f}ms"
+        )
+
+
+def compare(phases: dict[str, dict], baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compara cada fase com a fase de mesma taxa do baseline e devolve as regressões.
+    """
+    regressions = []
+    for rate, results in phases.items():
+        reference = baseline["phases"].get(rate)
+        if reference is None:
+            print(f"taxa {rate}/s: sem fase correspondente no baseline")
+            continue
+        print(f"taxa {rate}/s contra o baseline:")
+        for metric, value in results.items():
+            if metric in ("accepted", "replies") or metric not in reference:
+                continue
+            before = reference[metric]
+            change = (value - before) / before if before else 0.0
+            if metric in HIGHER_IS_BETTER:
+                regressed = value < before * (1 - tolerance)
+            else:
+                regressed = value > before * (1 + tolerance)
+                if metric.endswith("_ms") and value - before < MIN_LATENCY_DELTA_MS:
+                    regressed = False
+            status = "REGRESSÃO" if regressed else "ok"
+            print(f"  {metric:<24} baseline={before:10.2f} atual={value:10.2f} ({change:+.0%}) {status}")
+            if regressed:
+                regressions.append(f"{rate}/s {metric}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300, help="webhooks por fase")
+    parser.add_argument("--rate", type=float, nargs="+", default=[10.0, 30.0], help="webhooks/s, uma fase por taxa")
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--seed-rows", type=int, default=50_000, help="transações gravadas antes da carga")
+    parser.add_argument("--payloads", help="JSONL com corpos de webhook gravados (padrão: mensagens sintéticas)")
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--zenvia-latency", type=float, default=0.05)
+    parser.add_argument("--zenvia-error-rate", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="espera máxima pelas respostas (s)")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="piora relativa aceita antes de acusar regressão")
+    parser.add_argument("--save-baseline", action="store_true", help="grava o resultado como novo baseline")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+            "ZENVIA_API_URL": f"http://127.0.0.1:{ZENVIA_PORT}/v2/channels/{{channel}}/messages",
+            "ZENVIA_API_TOKEN": "fake",
+            "ZENVIA_SENDER_ID": "fake",
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        }
+    )
+    baseline_path = Path(args.baseline).resolve()
+    payloads_path = str(Path(args.payloads).resolve()) if args.payloads else None
+    # Banco, fila e outbox são criados no diretório atual: isola a carga em um diretório temporário
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-load-"))
+
+    import main as app_module
+    from database.database import engine
+    from database.migrations import run_migrations
+
+    run_migrations(engine)
+
+    started = time.perf_counter()
+    seed_database(engine, args.seed_rows, args.senders)
+    print(f"{args.seed_rows} transações gravadas em {time.perf_counter() - started:.1f}s")
+
+    fake_openai = create_fake_openai(args.openai_latency, args.openai_error_rate)
+    fake_zenvia = create_fake_zenvia(args.zenvia_latency, args.zenvia_error_rate)
+    run_server(fake_openai, OPENAI_PORT)
+    run_server(fake_zenvia, ZENVIA_PORT)
+    run_server(app_module.app, APP_PORT)
+
+    rng = random.Random(5)
+    phases: dict[str, dict] = {}
+    for phase, rate in enumerate(args.rate):
+        prefix = f"load{phase}"
+        if payloads_path:
+            payloads = recorded_payloads(payloads_path, args.messages, prefix)
+        else:
+            payloads = synthetic_payloads(args.messages, args.senders, prefix, rng)
+        results = run_phase(payloads, rate, fake_openai, fake_zenvia, args.drain_timeout)
+        report(rate, results, args.messages)
+        phases[f"{rate:g}"] = results
+
+    config = {
+        key: getattr(args, key)
+        for key in (
+            "messages", "senders", "seed_rows", "openai_latency", "openai_error_rate",
+            "zenvia_latency", "zenvia_error_rate",
+        )
+    }
+    config["payloads"] = Path(payloads_path).name if payloads_path else "sintetico"
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps({"config": config, "phases": phases}, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline gravado em {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"sem baseline em {baseline_path}; rode com --save-baseline para criar")
+        return
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline["config"] != config:
+        print(f"aviso: configuração diferente da do baseline: {baseline['config']}")
+    regressions = compare(phases, baseline, args.tolerance)
+    if regressions:
+        raise SystemExit(f"Regressões em relação ao baseline: {', '.join(regressions)}")
+    print("sem regressões em relação ao baseline")
+
+
+if __name__ == "__main__":
+    main()
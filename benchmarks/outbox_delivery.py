@@ -0,0 +1,132 @@
+"""
+Entrega de respostas pelo outbox contra uma Zenvia falsa com limite de taxa e erros.
+
+Sobe a Zenvia falsa respondendo 429 acima de --provider-limit envios/s por
+canal e 503 em --error-rate das chamadas, e compara:
+- envio direto: um POST por resposta, sem retentativa (o send_reply antigo);
+  conta quantas respostas se perdem;
+- outbox: as respostas são gravadas no outbox e entregues pelo ReplyDispatcher
+  com token bucket e retentativas. No meio da entrega o dispatcher é parado e
+  um novo é criado sobre o mesmo arquivo, como em um restart.
+No fim confere que todas as respostas chegaram, uma vez e em ordem por destinatário.
+
+Uso: python -m benchmarks.outbox_delivery --replies 1000 --rate 40 --provider-limit 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ZENVIA_PORT = 18041
+
+
+async def direct(replies: list[tuple[str, str]]) -> int:
+    from services.zenvia_service import DeliveryError, close_http_client, deliver
+
+    async def one(recipient: str, text: str) -> bool:
+        try:
+            await deliver(recipient, text)
+        except DeliveryError:
+            return False
+        return True
+
+    results = await asyncio.gather(*(one(recipient, text) for recipient, text in replies))
+    # O cliente HTTP compartilhado fica preso a este event loop
+    await close_http_client()
+    return results.count(False)
+
+
+async def through_outbox(replies: list[tuple[str, str]], args, fake_zenvia) -> None:
+    from services.outbox import Outbox, ReplyDispatcher
+    from services.zenvia_service import close_http_client
+
+    started = time.perf_counter()
+    dispatcher = ReplyDispatcher(Outbox("outbox.db"), rate_per_second=args.rate, burst=args.burst)
+    for recipient, text in replies:
+        await dispatcher.enqueue(recipient, text)
+    dispatcher.start()
+    while len(fake_zenvia.state.sent) < len(replies) // 2:
+        await asyncio.sleep(0.05)
+    await dispatcher.stop()
+    before_restart = dict(dispatcher.stats)
+    dispatcher.outbox.close()
+    print(f"restart com {dispatcher.outbox.path}: {len(fake_zenvia.state.sent)} entregues até aqui")
+
+    dispatcher = ReplyDispatcher(Outbox("outbox.db"), rate_per_second=args.rate, burst=args.burst)
+    dispatcher.start()
+    while True:
+        metrics = dispatcher.outbox.metrics()
+        if metrics["pending"] + metrics["sending"] == 0:
+            break
+        await asyncio.sleep(0.05)
+    await dispatcher.stop()
+    elapsed = time.perf_counter() - started
+    await close_http_client()
+
+    stats = {key: before_restart[key] + dispatcher.stats[key] for key in ("sent", "retried", "given_up", "batches")}
+    print(
+        f"{'outbox':<14} entregues={stats['sent']} retentativas={stats['retried']} desistencias={stats['given_up']} "
+        f"lotes={stats['batches']} 429={fake_zenvia.state.rejected} {elapsed:.1f}s "
+        f"({stats['sent'] / elapsed:.1f} envios/s)"
+    )
+
+    delivered = defaultdict(list)
+    for body in fake_zenvia.state.sent:
+        delivered[body["to"]].append(int(body["contents"][0]["text"].rsplit(" ", 1)[1]))
+    expected = defaultdict(list)
+    for recipient, text in replies:
+        expected[recipient].append(int(text.rsplit(" ", 1)[1]))
+    if delivered != expected:
+        raise SystemExit("Entregas faltando, duplicadas ou fora de ordem por destinatário")
+    print("todas as respostas entregues uma vez e em ordem por destinatário")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=1000)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=40.0, help="envios/s do token bucket")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--provider-limit", type=float, default=50.0, help="envios/s aceitos pela Zenvia falsa")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "ZENVIA_API_URL": f"http://127.0.0.1:{ZENVIA_PORT}/v2/channels/{{channel}}/messages",
+            "ZENVIA_API_TOKEN": "fake",
+            "ZENVIA_SENDER_ID": "fake",
+            "OUTBOX_BACKOFF_BASE": "0.2",
+            "OUTBOX_BACKOFF_MAX": "5",
+            "OUTBOX_POLL_INTERVAL": "0.1",
+        }
+    )
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-outbox-"))
+
+    from benchmarks.fake_upstreams import create_fake_zenvia, run_server
+
+    fake_zenvia = create_fake_zenvia(args.latency, args.error_rate, args.provider_limit)
+    run_server(fake_zenvia, ZENVIA_PORT)
+    replies = [(f"55119{index % args.recipients:08d}", f"resposta {index}") for index in range(args.replies)]
+
+    started = time.perf_counter()
+    lost = asyncio.run(direct(replies))
+    print(
+        f"{'envio direto':<14} entregues={len(replies) - lost} perdidas={lost} "
+        f"429={fake_zenvia.state.rejected} {time.perf_counter() - started:.1f}s"
+    )
+
+    fake_zenvia.state.sent.clear()
+    fake_zenvia.state.sent_at.clear()
+    fake_zenvia.state.rejected = 0
+    asyncio.run(through_outbox(replies, args, fake_zenvia))
+
+
+if __name__ == "__main__":
+    main()
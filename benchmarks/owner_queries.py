@@ -0,0 +1,162 @@
+"""
+Consultas por remetente sobre uma tabela grande de transações.
+
+Popula um SQLite temporário com N linhas sintéticas espalhadas entre muitos
+donos e mede, via main.query_database, a soma do mês e a listagem das
+últimas transações de um usuário, com e sem os índices (owner, ...), e as
+somas lidas do rollup diário contra as lidas direto de transaction.
+Antes de medir, mostra o EXPLAIN QUERY PLAN de cada plano e falha se algum
+deles precisar varrer a tabela inteira.
+
+Uso: python -m benchmarks.owner_queries --rows 10000000 --owners 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+CATEGORIES = ["Alimentacao", "Transporte", "Moradia", "Saude", "Educacao", "Lazer", "Outros", "Salario"]
+
+
+def populate(path: str, rows: int, owners: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    span = int(timedelta(days=800).total_seconds())
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    batch_size = 100_000
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for _ in range(min(batch_size, rows - offset)):
+            categoria = rng.choice(CATEGORIES)
+            batch.append(
+                (
+                    f"5511{rng.randrange(owners):08d}",
+                    "receita" if categoria == "Salario" else "despesa",
+                    round(rng.uniform(1, 500), 2),
+                    "sintetica",
+                    categoria,
+                    categoria.lower(),
+                    (start + timedelta(seconds=rng.randrange(span))).isoformat(sep=" "),
+                )
+            )
+        connection.executemany(
+            'INSERT INTO "transaction" (owner, tipo, valor, descricao, categoria, categoria_key, data_criacao)'
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        connection.commit()
+    connection.close()
+
+
+def explain(connection, statement) -> list[str]:
+    compiled = statement.compile(dialect=connection.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def timed(function, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--owners", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--skip-full-scan", action="store_true", help="não mede a versão sem índices")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-owner-"))
+
+    import main as app_module
+    from sqlmodel import Session
+
+    from database.database import engine
+    from database.migrations import run_migrations
+    from database.rollups import rebuild_rollups
+
+    index_names = [index.name for index in app_module.models.Transaction.__table__.indexes]
+    started = time.perf_counter()
+    # O import não cria mais as tabelas: o schema vem das migrações
+    run_migrations(engine)
+    # Carga sem índices e criação no final (bem mais rápido que manter os índices a cada insert)
+    with engine.begin() as connection:
+        for index in index_names:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+    # O pool do engine mantém conexões em WAL abertas; sem fechá-las o
+    # populate não consegue trocar o journal_mode ("database is locked")
+    engine.dispose()
+    populate("assistente_financeiro.db", args.rows, args.owners)
+    # Recria os índices removidos
+    run_migrations(engine)
+    print(f"{args.rows} linhas / {args.owners} donos populadas em {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    # A carga usa sqlite3 direto, sem os eventos do ORM: o rollup é recalculado no final
+    print(f"{rebuild_rollups(engine)} linhas de rollup em {time.perf_counter() - started:.1f}s")
+
+    owner = "551100000042"
+    plans = {
+        "soma do mes": {"aggregation": "sum", "filters": {"tipo": "despesa", "date_start": "2025-06-01", "date_end": "2025-06-30"}},
+        "soma por categoria": {"aggregation": "sum", "filters": {"tipo": "despesa", "categoria": "Transporte"}},
+        "categoria no mes": {"aggregation": "sum", "filters": {"categoria": "transporte", "date_start": "2025-06-01", "date_end": "2025-06-30"}},
+        "ultimas 10": {"aggregation": "list", "filters": {}, "limit": 10},
+        "receitas do mes": {"aggregation": "list", "filters": {"tipo": "receita", "date_start": "2025-06-01", "date_end": "2025-06-30"}},
+    }
+
+    with engine.connect() as connection:
+        for name, plan in plans.items():
+            steps = explain(connection, app_module.build_query_statement(plan, owner))
+            print(f"plano {name:<20} {' | '.join(steps)}")
+            if any(step.startswith("SCAN") and "INDEX" not in step for step in steps):
+                raise SystemExit(f"O plano '{name}' varre a tabela inteira")
+
+    with Session(engine) as session:
+        for name, plan in plans.items():
+            if plan["aggregation"] != "sum":
+                continue
+            app_module.ROLLUPS_ENABLED = False
+            raw = app_module.query_database(plan, session, owner=owner)
+            app_module.ROLLUPS_ENABLED = True
+            rolled = app_module.query_database(plan, session, owner=owner)
+            if abs(raw - rolled) > 0.01:
+                raise SystemExit(f"O rollup diverge em '{name}': {rolled} != {raw}")
+
+    def run(label: str, repeat: int, rollups_enabled: bool = True) -> None:
+        app_module.ROLLUPS_ENABLED = rollups_enabled
+        with Session(engine) as session:
+            for name, plan in plans.items():
+                if not rollups_enabled and plan["aggregation"] != "sum":
+                    continue
+                samples = timed(lambda: app_module.query_database(plan, session, owner=owner), repeat)
+                print(
+                    f"{label:<12} {name:<20} p50={statistics.median(samples):9.2f}ms "
+                    f"max={max(samples):9.2f}ms"
+                )
+
+    run("com indices", args.repeat)
+    run("sem rollup", args.repeat, rollups_enabled=False)
+
+    if not args.skip_full_scan:
+        with engine.begin() as connection:
+            for index in index_names:
+                connection.exec_driver_sql(f"DROP INDEX {index}")
+        run("sem indices", 3, rollups_enabled=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Mede quantas chamadas à OpenAI o pré-classificador evita em tráfego repetitivo.
+
+Gera mensagens sintéticas a partir de poucos templates com valores
+aleatórios e passa todas por main.resolve_message, com e sem o
+pré-classificador, contando as chamadas recebidas pela OpenAI falsa.
+
+Uso: python -m benchmarks.preclassifier_llm_calls --messages 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_upstreams import create_fake_openai, run_server
+
+OPENAI_PORT = 18021
+
+TEMPLATES = [
+    "gastei {v} no uber",
+    "gastei {v} reais no mercado",
+    "Paguei R$ {v} de luz",
+    "recebi {v} do salario",
+    "gastei {v} com farmacia",
+    "paguei {v} de internet",
+    "quanto gastei hoje?",
+    "bom dia",
+]
+
+
+def synthetic_messages(total: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(total):
+        amount = rng.randint(5, 500)
+        cents = rng.choice(["", f",{rng.randint(10, 99)}"])
+        messages.append(rng.choice(TEMPLATES).format(v=f"{amount}{cents}"))
+    return messages
+
+
+async def replay(app_module, messages: list[str]) -> dict[str, int]:
+    modes: dict[str, int] = {}
+    for message in messages:
+        result = await app_module.resolve_message(message, {})
+        modes[result["mode"]] = modes.get(result["mode"], 0) + 1
+    return modes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+            # Só o cache em memória, zerado entre as execuções: a camada
+            # compartilhada entregaria à segunda execução as respostas da primeira
+            "LLM_CACHE_SHARED": "0",
+        }
+    )
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-preclassifier-"))
+
+    import main as app_module
+    from services import cache, llm_gateway, preclassifier
+
+    fake_openai = create_fake_openai()
+    run_server(fake_openai, OPENAI_PORT)
+    messages = synthetic_messages(args.messages)
+
+    for enabled in (False, True):
+        cache._llm_cache = None
+        preclassifier._preclassifier = None
+        llm_gateway._gateway = None
+        app_module.PRECLASSIFIER_ENABLED = enabled
+        # As regras locais responderiam quase todo o tráfego sintético sozinhas
+        app_module.RULE_PARSER_ENABLED = False
+        calls_before = fake_openai.state.calls
+        started = time.perf_counter()
+        modes = asyncio.run(replay(app_module, messages))
+        elapsed = time.perf_counter() - started
+        calls = fake_openai.state.calls - calls_before
+        print(
+            f"pre-classificador={'on ' if enabled else 'off'} mensagens={len(messages)} "
+            f"chamadas_llm={calls:<5} llm/msg={calls / len(messages):.3f} "
+            f"tempo={elapsed:.2f}s modos={modes}"
+        )
+
+
+if __name__ == "__main__":
+    main()
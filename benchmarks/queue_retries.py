@@ -0,0 +1,141 @@
+"""
+Retentativas e dead-letter da fila com falhas injetadas no banco.
+
+Enfileira três mensagens e processa com o WorkerPool e o process_message de
+verdade, trocando o save_transaction por um que levanta
+sqlite3.OperationalError("database is locked"):
+- para o remetente "transitório" nas --transient-failures primeiras chamadas:
+  a mensagem deve ser tentada de novo e gravada uma única vez, com a resposta
+  de sucesso;
+- para o remetente "permanente" em todas as chamadas: depois de
+  --max-attempts tentativas a mensagem deve ir para a dead-letter e o usuário
+  deve receber uma única resposta de erro;
+- para o remetente "lento" a primeira chamada grava a transação e demora mais
+  que o visibility timeout: o worker é cancelado entre o commit e o ack, e a
+  nova tentativa não pode gravar a transação de novo.
+As respostas saem pelo outbox para uma Zenvia falsa. Falha com código 1 se
+alguma das condições não for atendida.
+
+Uso: python -m benchmarks.queue_retries --max-attempts 3 --transient-failures 2
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+ZENVIA_PORT = 18061
+TRANSIENT = "5511900000001"
+PERMANENT = "5511900000002"
+SLOW = "5511900000003"
+VISIBILITY_TIMEOUT = 1.0
+
+
+async def run(args, fake_zenvia) -> list[str]:
+    import main
+    from database.migrations import run_migrations
+    from services.outbox import get_dispatcher
+    from services.work_queue import WorkerPool, get_work_queue
+
+    run_migrations(main.engine)
+    save_transaction = main.save_transaction
+    calls: Counter = Counter()
+
+    def failing_save_transaction(details: dict, owner: str, message_key: str | None = None):
+        calls[owner] += 1
+        if owner == PERMANENT or (owner == TRANSIENT and calls[owner] <= args.transient_failures):
+            raise sqlite3.OperationalError("database is locked")
+        transaction = save_transaction(details, owner, message_key)
+        if owner == SLOW and calls[owner] == 1:
+            # Já gravou: o timeout do worker chega antes do ack
+            time.sleep(VISIBILITY_TIMEOUT + 0.5)
+        return transaction
+
+    main.save_transaction = failing_save_transaction
+
+    queue = get_work_queue()
+    queue.enqueue(TRANSIENT, "gastei 50 reais no mercado")
+    queue.enqueue(PERMANENT, "gastei 20 reais na padaria")
+    queue.enqueue(SLOW, "gastei 30 reais na farmacia")
+    pool = WorkerPool(queue, main.process_message, concurrency=3, poll_interval=0.1, on_dead_letter=main.reply_failure)
+    dispatcher = get_dispatcher()
+    started = time.perf_counter()
+    pool.start()
+    dispatcher.start()
+    while time.perf_counter() - started < args.timeout:
+        metrics = queue.metrics()
+        if metrics["pending"] + metrics["processing"] == 0 and len(fake_zenvia.state.sent) >= 3:
+            break
+        await asyncio.sleep(0.1)
+    await pool.stop()
+    await dispatcher.stop()
+    elapsed = time.perf_counter() - started
+
+    with sqlite3.connect(queue.path) as conn:
+        dead = conn.execute("SELECT sender, attempts, last_error FROM message_dead_letter").fetchall()
+    with main.Session(main.engine) as session:
+        saved = Counter(owner for owner in session.exec(main.select(main.models.Transaction.owner)))
+    replies = Counter((body["to"], body["contents"][0]["text"]) for body in fake_zenvia.state.sent)
+
+    print(f"{elapsed:.1f}s, chamadas ao banco por remetente: {dict(calls)}, pool: {pool.stats}")
+    print(f"dead-letter: {dead}")
+    for (recipient, text), count in sorted(replies.items()):
+        print(f"  {count}x para {recipient}: {text}")
+
+    failures = []
+    if calls[TRANSIENT] != args.transient_failures + 1 or saved[TRANSIENT] != 1:
+        failures.append(f"transitório: {calls[TRANSIENT]} tentativas e {saved[TRANSIENT]} transações gravadas")
+    if not any(to == TRANSIENT and text.startswith("✅") for to, text in replies):
+        failures.append("transitório: sem a resposta de sucesso")
+    if calls[PERMANENT] != args.max_attempts or [row[0] for row in dead] != [PERMANENT]:
+        failures.append(f"permanente: {calls[PERMANENT]} tentativas, dead-letter {dead}")
+    if sum(count for (to, _), count in replies.items() if to == PERMANENT) != 1:
+        failures.append("permanente: o usuário não recebeu exatamente uma resposta de erro")
+    if calls[SLOW] != 2 or saved[SLOW] != 1:
+        failures.append(f"lento: {calls[SLOW]} tentativas e {saved[SLOW]} transações gravadas")
+    if not any(to == SLOW and text.startswith("✅") for to, text in replies):
+        failures.append("lento: sem a resposta de sucesso")
+    expected_failures = args.transient_failures + args.max_attempts + 1
+    if pool.stats["failed"] != expected_failures or pool.stats["dead_lettered"] != 1:
+        failures.append(f"estatísticas do pool inesperadas: {pool.stats}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--transient-failures", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60.0, help="tempo máximo de espera (s)")
+    args = parser.parse_args()
+    if args.transient_failures >= args.max_attempts:
+        parser.error("--transient-failures precisa ser menor que --max-attempts")
+
+    os.environ.update(
+        {
+            "QUEUE_MAX_ATTEMPTS": str(args.max_attempts),
+            "QUEUE_VISIBILITY_TIMEOUT": str(VISIBILITY_TIMEOUT),
+            "ZENVIA_API_URL": f"http://127.0.0.1:{ZENVIA_PORT}/v2/channels/{{channel}}/messages",
+            "ZENVIA_API_TOKEN": "fake",
+            "ZENVIA_SENDER_ID": "fake",
+            "OUTBOX_POLL_INTERVAL": "0.1",
+        }
+    )
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-queue-retries-"))
+
+    from benchmarks.fake_upstreams import create_fake_zenvia, run_server
+
+    fake_zenvia = create_fake_zenvia()
+    run_server(fake_zenvia, ZENVIA_PORT)
+    failures = asyncio.run(run(args, fake_zenvia))
+    if failures:
+        raise SystemExit("; ".join(failures))
+    print("retentativa e dead-letter funcionando: cada transação gravada uma vez e uma resposta de erro")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Precisão, cobertura e latência do caminho rápido por regras.
+
+Cada linha do corpus traz a mensagem e o resultado esperado. Para cada
+limite de confiança o benchmark mostra quantas mensagens as regras
+responderiam sozinhas (cobertura), quantas dessas estão corretas e
+quantas seriam respondidas erradas sem passar pela OpenAI.
+
+Uso: python -m benchmarks.rule_parser_accuracy [--corpus arquivo.jsonl]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.dates import period_range  # noqa: E402
+from services.query_planner import resolve_plan  # noqa: E402
+from services.rule_parser import RuleMatch, parse_message  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "data" / "rule_parser_corpus.jsonl"
+TODAY = date(2026, 2, 12)
+
+
+def is_correct(match: RuleMatch, expected: dict) -> bool:
+    if match.intent != expected["intent"]:
+        return False
+
+    if match.transaction is not None:
+        details = match.transaction
+        return (
+            details["tipo"] == expected["tipo"]
+            and abs(details["valor"] - expected["valor"]) < 0.005
+            and details["categoria"] == expected["categoria"]
+        )
+
+    plan = resolve_plan(match.query_plan, TODAY) if match.query_plan else {}
+    filters = plan.get("filters", {})
+    expected_filters = {key: expected[key] for key in ("tipo", "categoria") if key in expected}
+    period = expected.get("period")
+    if period and period != "last_n":
+        start, end = period_range(period, TODAY)
+        expected_filters.update(date_start=start.isoformat(), date_end=end.isoformat())
+    return (
+        plan.get("aggregation") == expected["aggregation"]
+        and filters == expected_filters
+        and plan.get("limit") == expected.get("limit")
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=200, help="repetições para medir a latência")
+    args = parser.parse_args()
+
+    corpus = [json.loads(line) for line in args.corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+    matches = [parse_message(row["text"]) for row in corpus]
+
+    print(f"corpus: {len(corpus)} mensagens ({args.corpus.name})")
+    for threshold in (0.5, 0.7, 0.8, 0.9):
+        answered = [(m, row) for m, row in zip(matches, corpus) if m is not None and m.confidence >= threshold]
+        correct = sum(is_correct(m, row) for m, row in answered)
+        wrong = len(answered) - correct
+        precision = correct / len(answered) if answered else 0.0
+        print(
+            f"limite={threshold:.1f} cobertura={len(answered) / len(corpus):6.1%} "
+            f"precisao={precision:6.1%} erradas={wrong}"
+        )
+
+    for match, row in zip(matches, corpus):
+        if match is not None and not is_correct(match, row):
+            print(f"  divergente (confianca {match.confidence:.2f}): {row['text']!r} -> {match.transaction or match.query_plan}")
+
+    samples = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for row in corpus:
+            parse_message(row["text"])
+        samples.append((time.perf_counter() - started) / len(corpus) * 1e6)
+    samples.sort()
+    print(
+        f"latencia por mensagem: media={statistics.mean(samples):.1f}us "
+        f"p50={samples[len(samples) // 2]:.1f}us p99={samples[int(len(samples) * 0.99) - 1]:.1f}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Cache, deduplicação e limite de taxa com vários workers, por backend de estado.
+
+Simula N processos atrás de um balanceador: as entregas de webhook (textos
+repetidos em distribuição de Zipf, mais --retry-rate de reenvios da Zenvia
+que caem em qualquer processo) são divididas entre eles. Cada processo passa
+cada entrega pelo IdempotencyStore e pelo cache de respostas; um miss custa
+--llm-latency segundos, como uma chamada à OpenAI. Depois todos disputam o
+SharedRateLimiter do outbox por --rate-seconds segundos.
+
+Para cada backend (SHARED_STATE_BACKEND) e número de workers mostra a taxa de
+acertos do cache, as chamadas à OpenAI, os reenvios que passaram pela
+deduplicação, a vazão e os envios/s somados contra --rate-limit. Com o backend
+"memory" cada processo aquece o próprio cache e conhece só os próprios
+webhooks e envios; com "sqlite" (ou "redis", com --redis-url e o pacote redis
+instalado) o estado é um só para todos.
+
+Uso: python -m benchmarks.shared_state_scaling --workers 1 2 4 8 --deliveries 4000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def deliveries(total: int, distinct: int, retry_rate: float, seed: int = 13) -> list[tuple[str, str, str]]:
+    """
+    (id da mensagem, remetente, texto); reenvios repetem o id de uma entrega anterior.
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    texts = rng.choices([f"gastei {value} no mercado" for value in range(distinct)], weights, k=total)
+    items = [(f"msg-{index}", f"55119{rng.randrange(500):08d}", text) for index, text in enumerate(texts)]
+    retries = [rng.choice(items[: index + 1]) for index in range(total) if rng.random() < retry_rate]
+    items.extend(retries)
+    rng.shuffle(items)
+    return items
+
+
+def run_worker(share, llm_latency: float, rate_limit: float, rate_seconds: float, barrier, results) -> None:
+    import asyncio
+
+    from services.cache import get_llm_cache
+    from services.idempotency import get_idempotency_store
+    from services.outbox import SharedRateLimiter
+    from services.shared_state import get_shared_state
+
+    cache = get_llm_cache()
+    store = get_idempotency_store()
+    counts = {"processed": 0, "llm_calls": 0, "hits": 0, "sends": 0}
+
+    barrier.wait()
+    started = time.perf_counter()
+    for message_id, sender, text in share:
+        if not store.check_and_remember(message_id, sender, text):
+            continue
+        counts["processed"] += 1
+        if cache.get("understanding", text, "bench") is not None:
+            counts["hits"] += 1
+            continue
+        time.sleep(llm_latency)
+        counts["llm_calls"] += 1
+        cache.set("understanding", text, "bench", {"intent": "new_transaction"})
+    counts["elapsed"] = time.perf_counter() - started
+
+    # Rajada de um envio: a medição curta mostra só a taxa sustentada
+    limiter = SharedRateLimiter(get_shared_state(), "bench", rate_limit, burst=1)
+
+    async def send_as_fast_as_allowed() -> None:
+        deadline = time.monotonic() + rate_seconds
+        while True:
+            await limiter.acquire()
+            if time.monotonic() >= deadline:
+                return
+            counts["sends"] += 1
+
+    barrier.wait()
+    asyncio.run(send_as_fast_as_allowed())
+    results.put(counts)
+
+
+def run_config(backend: str, workers: int, items: list, args, workdir: str) -> dict:
+    os.environ.update(
+        {
+            "SHARED_STATE_BACKEND": backend,
+            "SHARED_STATE_PATH": os.path.join(workdir, f"state-{backend}-{workers}.db"),
+            "SHARED_STATE_URL": args.redis_url or "",
+            "SHARED_STATE_PREFIX": f"bench-{os.getpid()}-{workers}:",
+            "LLM_CACHE_SHARED": "1",
+        }
+    )
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(items[index::workers], args.llm_latency, args.rate_limit, args.rate_seconds, barrier, results),
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    counts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    processed = sum(count["processed"] for count in counts)
+    return {
+        "hit_ratio": sum(count["hits"] for count in counts) / max(processed, 1),
+        "llm_calls": sum(count["llm_calls"] for count in counts),
+        "duplicates": processed - args.deliveries,
+        "throughput": len(items) / max(count["elapsed"] for count in counts),
+        "sends_per_second": sum(count["sends"] for count in counts) / args.rate_seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--deliveries", type=int, default=4000, help="mensagens distintas (sem contar reenvios)")
+    parser.add_argument("--distinct", type=int, default=600, help="textos distintos")
+    parser.add_argument("--retry-rate", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="envios/s do SharedRateLimiter")
+    parser.add_argument("--rate-seconds", type=float, default=2.0)
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"])
+    parser.add_argument("--redis-url", help="inclui o backend redis (precisa do pacote redis)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    workdir = tempfile.mkdtemp(prefix="bench-shared-state-")
+    os.chdir(workdir)
+    backends = args.backends + (["redis"] if args.redis_url else [])
+    items = deliveries(args.deliveries, args.distinct, args.retry_rate)
+    print(f"{len(items)} entregas ({len(items) - args.deliveries} reenvios), {args.distinct} textos distintos")
+
+    for backend in backends:
+        print(f"\nbackend {backend}")
+        print(f"{'workers':>8} {'acertos':>8} {'chamadas LLM':>13} {'duplicadas':>11} {'msgs/s':>8} {'envios/s':>9}")
+        for workers in args.workers:
+            result = run_config(backend, workers, items, args, workdir)
+            print(
+                f"{workers:>8} {result['hit_ratio']:>8.1%} {result['llm_calls']:>13} {result['duplicates']:>11} "
+                f"{result['throughput']:>8.0f} {result['sends_per_second']:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Teste de carga: latência de aceitação do /webhook/zenvia com upstreams lentos.
+
+Sobe a OpenAI e a Zenvia falsas, envia rajadas de webhooks e compara a
+latência de aceitação com upstreams rápidos e lentos. Com o caminho
+totalmente assíncrono as duas fases devem ficar praticamente iguais.
+
+Uso: python -m benchmarks.webhook_latency --requests 200 --slow-latency 2.0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_upstreams import create_fake_openai, create_fake_zenvia, run_server
+
+OPENAI_PORT = 18001
+ZENVIA_PORT = 18002
+APP_PORT = 18000
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def fire(total: int, rate: float, phase: str) -> list[float]:
+    """
+    Cada mensagem tem id e texto próprios da fase: reenvios seriam descartados
+    pela deduplicação e a medição veria só esse caminho.
+    """
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", timeout=60.0) as client:
+
+        async def one(i: int) -> None:
+            payload = {
+                "message": {
+                    "id": f"{phase}-{i}",
+                    "from": f"55119{i:08d}",
+                    "contents": [{"type": "text", "text": f"gastei {i} no uber ({phase})"}],
+                }
+            }
+            started = time.perf_counter()
+            response = await client.post("/webhook/zenvia", json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+
+        tasks = []
+        for i in range(total):
+            tasks.append(asyncio.create_task(one(i)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+
+    return latencies
+
+
+def report(label: str, latencies: list[float]) -> None:
+    print(
+        f"{label:<22} n={len(latencies):<5} p50={percentile(latencies, 50):8.1f}ms "
+        f"p95={percentile(latencies, 95):8.1f}ms max={max(latencies):8.1f}ms "
+        f"media={statistics.mean(latencies):8.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=50.0, help="webhooks por segundo")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="latência dos upstreams lentos (s)")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{OPENAI_PORT}/v1",
+            "ZENVIA_API_URL": f"http://127.0.0.1:{ZENVIA_PORT}/v2/channels/whatsapp/messages",
+            "ZENVIA_API_TOKEN": "fake",
+            "ZENVIA_SENDER_ID": "fake",
+        }
+    )
+    # O banco SQLite é criado no diretório atual: isola o benchmark em um diretório temporário
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.chdir(tempfile.mkdtemp(prefix="bench-webhook-"))
+
+    import main as app_module
+    from database.database import engine
+    from database.migrations import run_migrations
+
+    run_migrations(engine)
+
+    fake_openai = create_fake_openai()
+    fake_zenvia = create_fake_zenvia()
+    run_server(fake_openai, OPENAI_PORT)
+    run_server(fake_zenvia, ZENVIA_PORT)
+    run_server(app_module.app, APP_PORT)
+
+    phases = (
+        ("rapidos", "upstreams rapidos", 0.0),
+        ("lentos", f"upstreams lentos {args.slow_latency}s", args.slow_latency),
+    )
+    for phase, label, latency in phases:
+        fake_openai.state.latency = latency
+        fake_zenvia.state.latency = latency
+        report(label, asyncio.run(fire(args.requests, args.rate, phase)))
+    suppressed = app_module.get_idempotency_store().stats["duplicates_suppressed"]
+    if suppressed:
+        raise SystemExit(f"{suppressed} webhooks descartados como reenvio: a medição não é de mensagens novas")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,257 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, declarative_base, sessionmaker
-from sqlmodel import Session as SQLModelSession
+"""
+Engine, sessões e caminho de escrita do banco.
 
-DATABASE_URL = "sqlite:///./assistente_financeiro.db"
+DATABASE_URL escolhe o banco (SQLite por padrão; postgresql://... usa um pool
+de conexões). No SQLite cada conexão recebe os PRAGMAs do perfil
+DB_PRAGMA_PROFILE: WAL deixa leitores e o escritor trabalharem ao mesmo
+tempo, e o busy_timeout faz uma conexão esperar o lock em vez de falhar com
+"database is locked".
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+O SQLite só aceita um escritor por vez, então as escritas da aplicação passam
+por um único DatabaseWriter: uma thread que junta as escritas que chegam
+juntas em uma só transação (group commit), pagando um fsync por lote em vez de
+um por transação. Leituras usam sessões comuns (get_session), em paralelo.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, TypeVar
 
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
 
-def get_db():
-    db: Session = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from services.observability import DB_QUERY_SECONDS
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./assistente_financeiro.db")
+# "balanced" (padrão), "durable" (fsync a cada commit) ou "fast" (benchmarks/cargas descartáveis)
+DB_PRAGMA_PROFILE = os.environ.get("DB_PRAGMA_PROFILE", "balanced")
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# Escritas serializadas com group commit; padrão ligado só no SQLite
+DB_SERIALIZED_WRITES = os.environ.get("DB_SERIALIZED_WRITES", "1" if DATABASE_URL.startswith("sqlite") else "0") == "1"
+DB_WRITER_MAX_BATCH = int(os.environ.get("DB_WRITER_MAX_BATCH", "64"))
+# Espera extra por mais jobs antes do commit; 0 junta só o que já está na fila
+DB_WRITER_MAX_WAIT = float(os.environ.get("DB_WRITER_MAX_WAIT", "0"))
+
+PRAGMA_PROFILES = {
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # ~64 MB
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+    # Comportamento antigo (journal de rollback, sem PRAGMAs); útil para comparar
+    "legacy": {},
+}
+
+T = TypeVar("T")
+
+
+# Tempo de cada instrução SQL, para todos os engines (inclusive os de benchmarks)
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(connection, cursor, statement, parameters, context, executemany) -> None:
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_query_timer(connection, cursor, statement, parameters, context, executemany) -> None:
+    started = connection.info["query_started"].pop()
+    operation = statement.lstrip()[:6].lower()
+    if operation not in ("select", "insert", "update", "delete"):
+        operation = "other"
+    DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation)
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_query_timer(context) -> None:
+    timers = context.connection.info.get("query_started") if context.connection is not None else None
+    if timers:
+        timers.pop()
+
+
+def create_db_engine(url: str = DATABASE_URL, profile: str = DB_PRAGMA_PROFILE, **kwargs) -> Engine:
+    """
+    Cria o engine para `url`. SQLite recebe os PRAGMAs do perfil em toda conexão
+    nova; Postgres (e outros) recebe um pool com pre_ping e reciclagem.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            pool_recycle=DB_POOL_RECYCLE,
+            **kwargs,
+        )
+
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Perfil de PRAGMA desconhecido: {profile}")
+    pragmas = PRAGMA_PROFILES[profile]
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        if pragmas:
+            cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+engine = create_db_engine()
 
 
 def get_session():
-    with SQLModelSession(engine) as session:
+    """
+    Dependência do FastAPI: uma sessão por requisição.
+    """
+    with Session(engine) as session:
         yield session
+
+
+class DatabaseWriter:
+    """
+    Thread única que executa as escritas. Cada job recebe uma Session e roda
+    dentro da transação do lote; um lote junta até `max_batch` jobs que chegam
+    em até `max_wait` segundos. Se um job falha o lote é desfeito e os jobs são
+    refeitos um a um, então a falha de um não derruba os outros.
+    """
+
+    def __init__(self, engine: Engine, max_batch: int = DB_WRITER_MAX_BATCH, max_wait: float = DB_WRITER_MAX_WAIT):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = {"jobs": 0, "batches": 0, "failed_batches": 0}
+        self._jobs: queue.Queue[tuple[Callable[[Session], Any], Future] | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable[[Session], T]) -> "Future[T]":
+        future: Future = Future()
+        self._jobs.put((job, future))
+        return future
+
+    def write(self, job: Callable[[Session], T]) -> T:
+        """Executa o job no escritor e espera o commit."""
+        return self.submit(job).result()
+
+    async def write_async(self, job: Callable[[Session], T]) -> T:
+        return await asyncio.wrap_future(self.submit(job))
+
+    def _next_batch(self) -> list[tuple[Callable[[Session], Any], Future]] | None:
+        item = self._jobs.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._jobs.get(timeout=timeout) if timeout > 0 else self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._jobs.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _execute(self, batch: list[tuple[Callable[[Session], Any], Future]]) -> None:
+        with Session(self.engine, expire_on_commit=False) as session:
+            results = [job(session) for job, _ in batch]
+            session.commit()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+            self.stats["jobs"] += len(batch)
+            self.stats["batches"] += 1
+            try:
+                self._execute(batch)
+            except Exception:
+                self.stats["failed_batches"] += 1
+                for job, future in batch:
+                    try:
+                        self._execute([(job, future)])
+                    except Exception as error:
+                        future.set_exception(error)
+
+    def close(self) -> None:
+        self._jobs.put(None)
+        self._thread.join()
+
+
+class DirectWriter:
+    """
+    Mesma interface do DatabaseWriter, mas cada job roda na thread de quem chamou,
+    com transação própria (Postgres, ou DB_SERIALIZED_WRITES=0).
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.stats = {"jobs": 0}
+
+    def write(self, job: Callable[[Session], T]) -> T:
+        self.stats["jobs"] += 1
+        with Session(self.engine, expire_on_commit=False) as session:
+            result = job(session)
+            session.commit()
+        return result
+
+    async def write_async(self, job: Callable[[Session], T]) -> T:
+        return await asyncio.to_thread(self.write, job)
+
+    def close(self) -> None:
+        pass
+
+
+_writer: DatabaseWriter | DirectWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> DatabaseWriter | DirectWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DatabaseWriter(engine) if DB_SERIALIZED_WRITES else DirectWriter(engine)
+        return _writer
+
+
+def close_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
@@ -0,0 +1,187 @@
+"""
+Migrações do schema para bancos já existentes.
+
+SQLModel.metadata.create_all só cria tabelas que não existem; colunas e
+índices novos em tabelas antigas (ex.: um assistente_financeiro.db criado
+antes da coluna owner) precisam ser aplicados aqui. Todas as etapas são
+idempotentes.
+
+Roda uma vez por deploy, antes de subir a API e os workers: eles só conferem
+se o schema está completo (DB_AUTO_MIGRATE=1 em main.py migra no startup, para
+desenvolvimento).
+
+Uso: python -m database.migrations
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+from database import models
+
+logger = logging.getLogger(__name__)
+
+
+def _add_owner_column(engine: Engine) -> bool:
+    columns = {column["name"] for column in inspect(engine).get_columns("transaction")}
+    if "owner" in columns:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE \"transaction\" ADD COLUMN owner VARCHAR NOT NULL DEFAULT ''"))
+    return True
+
+
+def _add_categoria_key_column(engine: Engine) -> bool:
+    """
+    Adiciona categoria_key e preenche as linhas existentes. Como há poucas
+    categorias distintas, o backfill é um UPDATE por categoria.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("transaction")}
+    if "categoria_key" in columns:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE \"transaction\" ADD COLUMN categoria_key VARCHAR NOT NULL DEFAULT ''"))
+        categorias = connection.execute(text("SELECT DISTINCT categoria FROM \"transaction\"")).scalars().all()
+        for categoria in categorias:
+            connection.execute(
+                text("UPDATE \"transaction\" SET categoria_key = :key WHERE categoria = :categoria"),
+                {"key": models.category_key(categoria or ""), "categoria": categoria},
+            )
+    return True
+
+
+def _add_dedupe_hash_column(engine: Engine) -> bool:
+    """
+    Adiciona dedupe_hash e preenche as linhas existentes em lotes (o hash usa o
+    dia local, então é calculado em Python).
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("transaction")}
+    if "dedupe_hash" in columns:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE \"transaction\" ADD COLUMN dedupe_hash VARCHAR"))
+        rows = connection.execute(
+            text("SELECT id, owner, data_criacao, valor, descricao FROM \"transaction\"")
+        ).all()
+        updates = [
+            {
+                "id": row.id,
+                "hash": models.dedupe_hash(
+                    row.owner,
+                    models.local_day(datetime.fromisoformat(str(row.data_criacao))),
+                    row.valor,
+                    row.descricao,
+                ),
+            }
+            for row in rows
+        ]
+        for offset in range(0, len(updates), 10_000):
+            connection.execute(
+                text("UPDATE \"transaction\" SET dedupe_hash = :hash WHERE id = :id"),
+                updates[offset:offset + 10_000],
+            )
+    return True
+
+
+def _add_message_key_column(engine: Engine) -> bool:
+    columns = {column["name"] for column in inspect(engine).get_columns("transaction")}
+    if "message_key" in columns:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE \"transaction\" ADD COLUMN message_key VARCHAR"))
+    return True
+
+
+def _create_indexes(engine: Engine) -> list[str]:
+    existing = {index["name"] for index in inspect(engine).get_indexes("transaction")}
+    created = []
+    # Substituído por ix_transaction_owner_categoria_key
+    if "ix_transaction_owner_categoria" in existing:
+        with engine.begin() as connection:
+            connection.execute(text("DROP INDEX ix_transaction_owner_categoria"))
+    for index in models.Transaction.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def missing_schema(engine: Engine) -> list[str]:
+    """
+    Tabelas, colunas e índices do modelo que ainda não existem no banco.
+    """
+    inspector = inspect(engine)
+    missing = []
+    for name, table in SQLModel.metadata.tables.items():
+        if not inspector.has_table(name):
+            missing.append(name)
+            continue
+        columns = {column["name"] for column in inspector.get_columns(name)}
+        missing.extend(f"{name}.{column.name}" for column in table.columns if column.name not in columns)
+        indexes = {index["name"] for index in inspector.get_indexes(name)}
+        missing.extend(index.name for index in table.indexes if index.name not in indexes)
+    return missing
+
+
+def schema_ready(engine: Engine) -> bool:
+    """
+    Verificação barata para o startup: as tabelas, colunas e índices do modelo existem.
+    """
+    missing = missing_schema(engine)
+    if missing:
+        logger.error("Schema do banco desatualizado, falta: %s", ", ".join(missing))
+    return not missing
+
+
+def run_migrations(engine: Engine) -> list[str]:
+    """
+    Cria as tabelas que faltam e aplica as alterações pendentes.
+    Retorna a lista do que foi feito (vazia se o banco já estava atualizado).
+    """
+    has_rollup = inspect(engine).has_table(models.TransactionRollup.__tablename__)
+    SQLModel.metadata.create_all(bind=engine)
+    applied = []
+    if _add_owner_column(engine):
+        applied.append("transaction.owner")
+    if _add_categoria_key_column(engine):
+        applied.append("transaction.categoria_key")
+    if _add_dedupe_hash_column(engine):
+        applied.append("transaction.dedupe_hash")
+    if _add_message_key_column(engine):
+        applied.append("transaction.message_key")
+    applied.extend(_create_indexes(engine))
+    if not has_rollup:
+        # Banco anterior ao rollup: preenche a partir das transações existentes
+        from database.rollups import rebuild_rollups
+
+        rebuild_rollups(engine)
+        applied.append("transaction_rollup")
+    if applied:
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+    return applied
+
+
+def run_migrations_locked(engine: Engine, timeout: float = 300.0) -> list[str]:
+    """
+    run_migrations sob o lock "migrations" do estado compartilhado: processos
+    que sobem juntos (uvicorn --workers N) migram um de cada vez.
+    """
+    from services.shared_state import get_shared_state
+
+    with get_shared_state().lock("migrations", ttl=timeout, timeout=timeout):
+        return run_migrations(engine)
+
+
+if __name__ == "__main__":
+    from database.database import engine
+    from services.observability import configure_logging
+
+    configure_logging()
+    applied = run_migrations_locked(engine)
+    if applied:
+        logger.info("Migrações aplicadas: %s", ", ".join(applied))
+    else:
+        logger.info("Banco já está atualizado.")
@@ -1,13 +1,159 @@
-from datetime import datetime
+import hashlib
+import unicodedata
+from datetime import date, datetime, timezone
 from typing import Optional
 
+from sqlalchemy import Index, event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import Field, SQLModel
 
+from services.dates import APP_TIMEZONE
+
+
+def category_key(categoria: str) -> str:
+    """
+    Chave canônica da categoria: sem acentos, minúscula e sem espaços extras
+    ("Alimentação " -> "alimentacao"). É o que os filtros por categoria comparam.
+    """
+    normalized = unicodedata.normalize("NFKD", categoria)
+    stripped = "".join(char for char in normalized if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def dedupe_hash(owner: str, day: date, valor: float, descricao: str, occurrence: int = 0) -> str:
+    """
+    Identidade de uma transação para importações: (dono, dia local, valor, descrição).
+    `occurrence` separa lançamentos idênticos no mesmo dia (dois cafés de R$ 5,00).
+    """
+    descricao = " ".join(category_key(descricao or "").split())
+    raw = f"{owner or ''}|{day.isoformat()}|{abs(valor):.2f}|{descricao}|{occurrence}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
 
 class Transaction(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_transaction_owner_data_criacao", "owner", "data_criacao"),
+        Index("ix_transaction_owner_tipo_data_criacao", "owner", "tipo", "data_criacao"),
+        Index("ix_transaction_owner_categoria_key", "owner", "categoria_key", "data_criacao"),
+        # Paginação por (data_criacao, id) sem filtro de dono (id é o rowid, já incluso no índice)
+        Index("ix_transaction_data_criacao", "data_criacao"),
+        Index("ix_transaction_owner_dedupe_hash", "owner", "dedupe_hash"),
+        Index("ix_transaction_message_key", "message_key"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Número do WhatsApp (ou conta) dono da transação; "" para registros antigos sem dono
+    owner: str = Field(default="", nullable=False)
     tipo: str
     valor: float
     descricao: str
     categoria: str
+    # Preenchida automaticamente a partir de `categoria` (ver category_key)
+    categoria_key: str = Field(default="", nullable=False)
     data_criacao: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # Ver dedupe_hash; usado pela importação de extratos para ignorar linhas já gravadas
+    dedupe_hash: Optional[str] = Field(default=None)
+    # Mensagem da fila que gerou a transação (QueuedMessage.key): uma reentrega não grava de novo
+    message_key: Optional[str] = Field(default=None)
+
+
+@event.listens_for(Transaction, "before_insert")
+@event.listens_for(Transaction, "before_update")
+def _fill_categoria_key(mapper, connection, target: Transaction) -> None:
+    target.categoria_key = category_key(target.categoria or "")
+
+
+@event.listens_for(Transaction, "before_insert")
+def _fill_dedupe_hash(mapper, connection, target: Transaction) -> None:
+    if target.dedupe_hash is None:
+        target.dedupe_hash = dedupe_hash(
+            target.owner, local_day(target.data_criacao), target.valor, target.descricao
+        )
+
+
+class TransactionRollup(SQLModel, table=True):
+    """
+    Soma e contagem das transações por (dono, dia local, tipo, categoria).
+    Mantida pelos eventos abaixo na mesma transação de cada insert/update/delete.
+    """
+
+    __tablename__ = "transaction_rollup"
+
+    owner: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    tipo: str = Field(primary_key=True)
+    categoria_key: str = Field(primary_key=True)
+    total: float = Field(default=0.0, nullable=False)
+    count: int = Field(default=0, nullable=False)
+
+
+def local_day(moment: datetime) -> date:
+    """
+    Dia no fuso do usuário de um data_criacao (gravado em UTC sem tzinfo).
+    """
+    return moment.replace(tzinfo=timezone.utc).astimezone(APP_TIMEZONE).date()
+
+
+def apply_rollup_deltas(connection, deltas: dict[tuple[str, date, str, str], tuple[float, int]]) -> None:
+    """
+    Soma os deltas {(owner, day, tipo, categoria_key): (total, count)} na tabela de rollup
+    usando a conexão (e portanto a transação) de quem chamou.
+    """
+    if not deltas:
+        return
+    table = TransactionRollup.__table__
+    if connection.dialect.name == "postgresql":
+        # O dialeto do PostgreSQL só é carregado quando ele está em uso
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = sqlite_insert
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.owner, table.c.day, table.c.tipo, table.c.categoria_key],
+        set_={
+            "total": table.c.total + statement.excluded.total,
+            "count": table.c.count + statement.excluded.count,
+        },
+    )
+    connection.execute(
+        statement,
+        [
+            {"owner": owner, "day": day, "tipo": tipo, "categoria_key": key, "total": total, "count": count}
+            for (owner, day, tipo, key), (total, count) in deltas.items()
+        ],
+    )
+
+
+def _rollup_key(owner: str, data_criacao: datetime, tipo: str, categoria: str) -> tuple[str, date, str, str]:
+    return owner or "", local_day(data_criacao), tipo, category_key(categoria or "")
+
+
+@event.listens_for(Transaction, "after_insert")
+def _rollup_insert(mapper, connection, target: Transaction) -> None:
+    key = _rollup_key(target.owner, target.data_criacao, target.tipo, target.categoria)
+    apply_rollup_deltas(connection, {key: (target.valor, 1)})
+
+
+@event.listens_for(Transaction, "after_delete")
+def _rollup_delete(mapper, connection, target: Transaction) -> None:
+    key = _rollup_key(target.owner, target.data_criacao, target.tipo, target.categoria)
+    apply_rollup_deltas(connection, {key: (-target.valor, -1)})
+
+
+@event.listens_for(Transaction, "after_update")
+def _rollup_update(mapper, connection, target: Transaction) -> None:
+    state = inspect(target)
+    fields = ("owner", "data_criacao", "tipo", "categoria", "valor")
+    if not any(state.attrs[field].history.has_changes() for field in fields):
+        return
+
+    def old(field: str):
+        history = state.attrs[field].history
+        return history.deleted[0] if history.deleted else getattr(target, field)
+
+    old_key = _rollup_key(old("owner"), old("data_criacao"), old("tipo"), old("categoria"))
+    new_key = _rollup_key(target.owner, target.data_criacao, target.tipo, target.categoria)
+    deltas = {old_key: (-old("valor"), -1)}
+    total, count = deltas.get(new_key, (0.0, 0))
+    deltas[new_key] = (total + target.valor, count + 1)
+    apply_rollup_deltas(connection, deltas)
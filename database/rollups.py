@@ -0,0 +1,180 @@
+"""
+Agregados diários das transações (tabela transaction_rollup).
+
+Cada linha guarda soma e contagem por (dono, dia local, tipo, categoria_key).
+A tabela é mantida pelos eventos de Transaction em database/models.py, na
+mesma transação do insert/update/delete, então "quanto gastei este mês" lê no
+máximo ~31 linhas por categoria em vez de todas as transações do período.
+Inserts em massa que não passam pelo ORM devem chamar
+models.apply_rollup_deltas com rollup_deltas(linhas).
+
+Uso:
+    python -m database.rollups check     # compara com as transações
+    python -m database.rollups rebuild   # recalcula a tabela inteira
+"""
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from database import models
+from services.dates import day_start_utc
+
+RollupKey = tuple[str, date, str, str]
+
+
+def rollup_deltas(rows) -> dict[RollupKey, tuple[float, int]]:
+    """
+    Agrupa linhas (owner, data_criacao, tipo, categoria_key, valor) nos deltas do rollup.
+    """
+    deltas: dict[RollupKey, tuple[float, int]] = {}
+    for owner, data_criacao, tipo, key, valor in rows:
+        rollup_key = (owner or "", models.local_day(data_criacao), tipo, key)
+        total, count = deltas.get(rollup_key, (0.0, 0))
+        deltas[rollup_key] = (total + valor, count + 1)
+    return deltas
+
+
+def _whole_days(start: datetime | None, end: datetime | None) -> tuple[date | None, date | None]:
+    """
+    Dias locais inteiramente contidos em [start, end): retorna (primeiro, fim exclusivo).
+    """
+    first_day = None
+    if start is not None:
+        first_day = models.local_day(start)
+        if day_start_utc(first_day) < start:
+            first_day += timedelta(days=1)
+    end_day = models.local_day(end) if end is not None else None
+    return first_day, end_day
+
+
+def _raw_sum(session: Session, owner: str | None, start: datetime, end: datetime, tipo, key) -> float:
+    statement = select(func.sum(models.Transaction.valor))
+    if owner is not None:
+        statement = statement.where(models.Transaction.owner == owner)
+    statement = statement.where(models.Transaction.data_criacao >= start, models.Transaction.data_criacao < end)
+    if tipo:
+        statement = statement.where(models.Transaction.tipo == tipo)
+    if key is not None:
+        statement = statement.where(models.Transaction.categoria_key == key)
+    return session.exec(statement).one_or_none() or 0.0
+
+
+def sum_transactions(
+    session: Session,
+    owner: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    tipo: str | None = None,
+    categoria: str | None = None,
+) -> float:
+    """
+    Soma de valor no intervalo UTC [start, end). Os dias locais inteiros vêm do
+    rollup; só as pontas que cortam um dia ao meio são lidas de transaction.
+    """
+    key = models.category_key(categoria) if categoria else None
+    first_day, end_day = _whole_days(start, end)
+
+    if first_day is not None and end_day is not None and first_day >= end_day:
+        # O intervalo não contém nenhum dia inteiro
+        return _raw_sum(session, owner, start, end, tipo, key)
+
+    rollup = models.TransactionRollup
+    statement = select(func.sum(rollup.total))
+    if owner is not None:
+        statement = statement.where(rollup.owner == owner)
+    if first_day is not None:
+        statement = statement.where(rollup.day >= first_day)
+    if end_day is not None:
+        statement = statement.where(rollup.day < end_day)
+    if tipo:
+        statement = statement.where(rollup.tipo == tipo)
+    if key is not None:
+        statement = statement.where(rollup.categoria_key == key)
+    total = session.exec(statement).one_or_none() or 0.0
+
+    if first_day is not None and start < day_start_utc(first_day):
+        total += _raw_sum(session, owner, start, day_start_utc(first_day), tipo, key)
+    if end_day is not None and day_start_utc(end_day) < end:
+        total += _raw_sum(session, owner, day_start_utc(end_day), end, tipo, key)
+    return total
+
+
+def _expected_rollups(session: Session) -> dict[RollupKey, tuple[float, int]]:
+    transaction = models.Transaction
+    rows = session.exec(
+        select(
+            transaction.owner,
+            transaction.data_criacao,
+            transaction.tipo,
+            transaction.categoria_key,
+            transaction.valor,
+        ).execution_options(yield_per=10_000)
+    )
+    return rollup_deltas(rows)
+
+
+def check_rollups(engine: Engine, tolerance: float = 0.005) -> list[dict]:
+    """
+    Compara o rollup com as transações e retorna as chaves divergentes.
+    """
+    with Session(engine) as session:
+        expected = _expected_rollups(session)
+        stored = {
+            (row.owner, row.day, row.tipo, row.categoria_key): (row.total, row.count)
+            for row in session.exec(select(models.TransactionRollup))
+        }
+
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        expected_total, expected_count = expected.get(key, (0.0, 0))
+        stored_total, stored_count = stored.get(key, (0.0, 0))
+        if expected_count != stored_count or abs(expected_total - stored_total) > tolerance:
+            owner, day, tipo, categoria_key = key
+            mismatches.append({
+                "owner": owner,
+                "day": day.isoformat(),
+                "tipo": tipo,
+                "categoria_key": categoria_key,
+                "expected": {"total": round(expected_total, 2), "count": expected_count},
+                "stored": {"total": round(stored_total, 2), "count": stored_count},
+            })
+    return mismatches
+
+
+def rebuild_rollups(engine: Engine) -> int:
+    """
+    Recalcula o rollup a partir das transações, em uma única transação.
+    Retorna o número de linhas gravadas.
+    """
+    with Session(engine) as session:
+        deltas = _expected_rollups(session)
+        session.exec(delete(models.TransactionRollup))
+        models.apply_rollup_deltas(session.connection(), deltas)
+        session.commit()
+    return len(deltas)
+
+
+if __name__ == "__main__":
+    from database.database import engine
+    from database.migrations import run_migrations_locked, schema_ready
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "rebuild":
+        # Mesmo lock do startup com DB_AUTO_MIGRATE: o banco pode estar em uso
+        run_migrations_locked(engine)
+        print(f"Rollup recalculado: {rebuild_rollups(engine)} linhas.")
+    elif command == "check":
+        # Só leitura: não migra o banco que está sendo conferido
+        if not schema_ready(engine):
+            sys.exit("Schema do banco desatualizado: rode `python -m database.migrations` antes do check.")
+        mismatches = check_rollups(engine)
+        for mismatch in mismatches[:50]:
+            print(mismatch)
+        print(f"{len(mismatches)} divergências encontradas." if mismatches else "Rollup consistente.")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print("Uso: python -m database.rollups [check|rebuild]")
+        sys.exit(2)
@@ -1,32 +1,143 @@
 import json
+import logging
 import os
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
 
-import openai
-import requests
-from fastapi import FastAPI, Request, Response, BackgroundTasks
-from sqlmodel import SQLModel, Session, func, select
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, func, select
 from typing import Any
 
-from database import models
-from database.database import engine
+from database import models, rollups
+from database.database import close_writer, engine, get_writer
+from database.migrations import run_migrations_locked, schema_ready
+from routers.analytics import router as analytics_router
 from routers.transactions import router as transactions_router
-
-INTENT_CACHE = {}
-
-SQLModel.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Assistente Financeiro")
-
-app.include_router(transactions_router, prefix="/transactions", tags=["Transactions"])
-
-
-def get_session():
-    with Session(engine) as session:
-        yield session
-
-
-def extract_transaction_details(user_text: str) -> dict:
+from services import schemas
+from services.cache import get_llm_cache, prompt_version
+from services.dates import utc_range
+from services.idempotency import get_idempotency_store
+from services.llm_gateway import CANNED_REPLY, CircuitOpenError, close_gateway, get_gateway, preload_client
+from services.preclassifier import PRECLASSIFIER_ENABLED, get_preclassifier
+from services.query_planner import ANALYTICS_AGGREGATIONS, PLAN_FORMAT, plan_query, resolve_plan
+from services.observability import MESSAGE_SECONDS, STAGE_SECONDS, configure_logging, render_metrics
+from services.outbox import get_dispatcher
+from services.rule_parser import RULE_PARSER_ENABLED, RULE_PARSER_MIN_CONFIDENCE, parse_message
+from services.work_queue import WORKER_CONCURRENCY, QueueFullError, WorkerPool, get_work_queue
+from services.zenvia_service import close_http_client, send_reply
+
+logger = logging.getLogger(__name__)
+
+# "combined": uma única chamada para intenção + conteúdo; "two_step": get_intent e depois extração/análise
+UNDERSTAND_MODE = os.environ.get("UNDERSTAND_MODE", "combined")
+# "0" faz as somas lerem direto de transaction (útil para comparar com o rollup)
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "1") == "1"
+# "1" aplica as migrações no startup (desenvolvimento); em produção rode `python -m database.migrations`
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "0") == "1"
+
+TRANSACTION_PROMPT = (
+    "Voce e um assistente financeiro especializado em extrair dados de transacoes.\n"
+    "Sua unica funcao e ler a mensagem do usuario e responder APENAS com um JSON valido.\n"
+    "Nao inclua explicacoes, markdown, texto adicional, comentarios, prefixos ou sufixos.\n"
+    "Formato EXATO de saida:\n"
+    '{"tipo": "...", "valor": ..., "descricao": "...", "categoria": "..."}\n'
+    "Regras:\n"
+    "- tipo deve ser 'receita' ou 'despesa'.\n"
+    "- valor deve ser numero float (sem simbolo de moeda).\n"
+    "- descricao deve ser curta e objetiva.\n"
+    "- categoria deve ser uma categoria financeira comum.\n"
+    "Exemplos de categorizacao:\n"
+    "- salario, bonus, freelas -> Salario\n"
+    "- mercado, restaurante, lanches -> Alimentacao\n"
+    "- uber, onibus, combustivel -> Transporte\n"
+    "- aluguel, condominio, luz, agua, internet -> Moradia\n"
+    "- farmacia, medico, plano de saude -> Saude\n"
+    "- cursos, livros, mensalidade -> Educacao\n"
+    "- cinema, streaming, viagens -> Lazer\n"
+    "- compras diversas -> Outros\n"
+    "Se houver duvida, escolha a categoria mais provavel e mantenha JSON valido."
+)
+
+INTENT_PROMPT = """
+    Você é um classificador de intenções para um chatbot de finanças.
+    Responda apenas com uma das seguintes opções:
+    - "new_transaction": para registrar uma nova despesa ou receita (ex: "gastei 50 reais", "recebi 300 de um freela").
+    - "query_transactions": para fazer uma pergunta ou consulta sobre os dados (ex: "quanto gastei hoje?", "liste minhas últimas 3 despesas").
+    - "unknown": se a mensagem do usuário não se encaixa em nenhuma das anteriores.
+"""
+
+UNDERSTAND_PROMPT = '''
+    Você é o motor de entendimento de um chatbot de finanças.
+    Analise a mensagem do usuário e retorne APENAS um objeto JSON com a chave "intent" e o conteúdo correspondente.
+
+    Valores possíveis de "intent":
+    - "new_transaction": registrar uma nova despesa ou receita. Inclua a chave "transaction".
+    - "query_transactions": pergunta ou consulta sobre os dados. Inclua a chave "query_plan".
+    - "unknown": a mensagem não se encaixa em nenhuma das anteriores. Não inclua outras chaves.
+
+    Formato de "transaction": {"tipo": "receita" ou "despesa", "valor": número float, "descricao": texto curto, "categoria": categoria}
+    Categorias:
+    - salario, bonus, freelas -> Salario
+    - mercado, restaurante, lanches -> Alimentacao
+    - uber, onibus, combustivel -> Transporte
+    - aluguel, condominio, luz, agua, internet -> Moradia
+    - farmacia, medico, plano de saude -> Saude
+    - cursos, livros, mensalidade -> Educacao
+    - cinema, streaming, viagens -> Lazer
+    - compras diversas -> Outros
+
+    "query_plan" segue o formato do plano abaixo.
+''' + PLAN_FORMAT + '''
+
+    Exemplos:
+    - "gastei 50 reais no uber" -> {"intent": "new_transaction", "transaction": {"tipo": "despesa", "valor": 50.0, "descricao": "Uber", "categoria": "Transporte"}}
+    - "quanto gastei hoje?" -> {"intent": "query_transactions", "query_plan": {"aggregation": "sum", "filters": {"tipo": "despesa"}, "period": {"kind": "today"}}}
+    - "últimas 3 transações" -> {"intent": "query_transactions", "query_plan": {"aggregation": "list", "filters": {}, "limit": 3}}
+    - "bom dia" -> {"intent": "unknown"}
+'''
+
+TRANSACTION_PROMPT_VERSION = prompt_version(TRANSACTION_PROMPT)
+INTENT_PROMPT_VERSION = prompt_version(INTENT_PROMPT)
+UNDERSTAND_PROMPT_VERSION = prompt_version(UNDERSTAND_PROMPT)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # O schema é responsabilidade de `python -m database.migrations`, rodado uma
+    # vez por deploy, e não de cada processo que sobe
+    if DB_AUTO_MIGRATE:
+        await run_in_threadpool(run_migrations_locked, engine)
+    elif not await run_in_threadpool(schema_ready, engine):
+        raise RuntimeError("Schema do banco desatualizado: rode `python -m database.migrations` antes de subir a API.")
+
+    # WORKER_CONCURRENCY=0 deixa este processo só recebendo webhooks;
+    # o processamento fica com `python worker.py`
+    worker_pool = None
+    if WORKER_CONCURRENCY > 0:
+        # Só processos que chamam a OpenAI pagam o import do cliente, e no startup
+        await preload_client()
+        worker_pool = WorkerPool(get_work_queue(), process_message, on_dead_letter=reply_failure)
+        worker_pool.start()
+        # As respostas geradas pelos workers saem pelo outbox
+        get_dispatcher().start()
+    app.state.worker_pool = worker_pool
+
+    yield
+
+    if worker_pool is not None:
+        await worker_pool.stop()
+        await get_dispatcher().stop()
+    await close_http_client()
+    await close_gateway()
+    close_writer()
+
+
+router = APIRouter()
+
+
+async def extract_transaction_details(user_text: str) -> dict:
     default_data = {
         "tipo": "despesa",
         "valor": 0.0,
@@ -34,41 +145,20 @@ def extract_transaction_details(user_text: str) -> dict:
         "categoria": "Outros",
     }
 
-    try:
-        client = openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), timeout=30.0)
-        system_prompt = (
-            "Voce e um assistente financeiro especializado em extrair dados de transacoes.\n"
-            "Sua unica funcao e ler a mensagem do usuario e responder APENAS com um JSON valido.\n"
-            "Nao inclua explicacoes, markdown, texto adicional, comentarios, prefixos ou sufixos.\n"
-            "Formato EXATO de saida:\n"
-            '{"tipo": "...", "valor": ..., "descricao": "...", "categoria": "..."}\n'
-            "Regras:\n"
-            "- tipo deve ser 'receita' ou 'despesa'.\n"
-            "- valor deve ser numero float (sem simbolo de moeda).\n"
-            "- descricao deve ser curta e objetiva.\n"
-            "- categoria deve ser uma categoria financeira comum.\n"
-            "Exemplos de categorizacao:\n"
-            "- salario, bonus, freelas -> Salario\n"
-            "- mercado, restaurante, lanches -> Alimentacao\n"
-            "- uber, onibus, combustivel -> Transporte\n"
-            "- aluguel, condominio, luz, agua, internet -> Moradia\n"
-            "- farmacia, medico, plano de saude -> Saude\n"
-            "- cursos, livros, mensalidade -> Educacao\n"
-            "- cinema, streaming, viagens -> Lazer\n"
-            "- compras diversas -> Outros\n"
-            "Se houver duvida, escolha a categoria mais provavel e mantenha JSON valido."
-        )
+    cache = get_llm_cache()
+    cached = cache.get("transaction", user_text, TRANSACTION_PROMPT_VERSION)
+    if cached is not None:
+        return cached
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+    try:
+        ai_content = await get_gateway().chat(
+            operation="extraction",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": TRANSACTION_PROMPT},
                 {"role": "user", "content": user_text},
             ],
             temperature=0,
         )
-
-        ai_content = response.choices[0].message.content or ""
         ai_content = ai_content.strip()
 
         if ai_content.startswith("```"):
@@ -76,148 +166,186 @@ def extract_transaction_details(user_text: str) -> dict:
 
         parsed_data = json.loads(ai_content)
 
-        return {
+        details = {
             "tipo": parsed_data.get("tipo", default_data["tipo"]),
             "valor": float(parsed_data.get("valor", default_data["valor"])),
             "descricao": parsed_data.get("descricao", default_data["descricao"]),
             "categoria": parsed_data.get("categoria", default_data["categoria"]),
         }
+        cache.set("transaction", user_text, TRANSACTION_PROMPT_VERSION, details)
+        return details
+    except CircuitOpenError:
+        raise
     except Exception as error:
-        print(f"Erro ao extrair detalhes da transacao com OpenAI: {error}")
+        logger.warning("Erro ao extrair detalhes da transacao com OpenAI: %s", error)
         return default_data
 
 
 async def get_intent(user_message: str) -> str | None:
     """
     Classifica a intenção do usuário a partir da mensagem.
-    Usa um cache em memória para evitar chamadas repetidas à API.
+    Usa o cache de respostas da OpenAI para evitar chamadas repetidas à API.
     """
-    # Normaliza a mensagem para que "Oi" e "oi" sejam a mesma chave no cache
-    cache_key = user_message.strip().lower()
-
     # 1. Verifica se a intenção para esta mensagem já está no cache
-    if cache_key in INTENT_CACHE:
-        print(f"Cache HIT para a intenção da mensagem: '{user_message}'")
-        return INTENT_CACHE[cache_key]
-
-    print(f"Cache MISS para a intenção da mensagem: '{user_message}'. Chamando a API.")
+    # (a chave normaliza a mensagem, então "Oi" e "oi" são a mesma entrada)
+    cache = get_llm_cache()
+    cached_intent = cache.get("intent", user_message, INTENT_PROMPT_VERSION)
+    if cached_intent is not None:
+        logger.debug("Cache HIT para a intenção da mensagem: %r", user_message)
+        return cached_intent
+
+    logger.debug("Cache MISS para a intenção da mensagem: %r. Chamando a API.", user_message)
     # 2. Se não estiver no cache, aí sim chama a API da OpenAI
     try:
-        client = openai.AsyncOpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            timeout=30.0
-        )
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
+        content = await get_gateway().chat(
+            operation="intent",
             messages=[
                 {
                     "role": "system",
-                    "content": """
-                        Você é um classificador de intenções para um chatbot de finanças.
-                        Responda apenas com uma das seguintes opções:
-                        - "new_transaction": para registrar uma nova despesa ou receita (ex: "gastei 50 reais", "recebi 300 de um freela").
-                        - "query_transactions": para fazer uma pergunta ou consulta sobre os dados (ex: "quanto gastei hoje?", "liste minhas últimas 3 despesas").
-                        - "unknown": se a mensagem do usuário não se encaixa em nenhuma das anteriores.
-                    """,
+                    "content": INTENT_PROMPT,
                 },
                 {"role": "user", "content": user_message},
             ],
             temperature=0.0,
         )
-        intent = response.choices[0].message.content or "unknown"
+        intent = content or "unknown"
 
         # 3. Salva a nova intenção no cache para uso futuro antes de retornar
-        INTENT_CACHE[cache_key] = intent
+        cache.set("intent", user_message, INTENT_PROMPT_VERSION, intent)
         return intent
+    except CircuitOpenError:
+        raise
     except Exception as error:
-        print(f"Erro ao classificar intencao com OpenAI: {error}")
+        logger.warning("Erro ao classificar intencao com OpenAI: %s", error)
         return None
 
 
-def send_reply(to: str, message: str) -> None:
-    zenvia_api_token = os.environ.get("ZENVIA_API_TOKEN")
-    zenvia_sender_id = os.environ.get("ZENVIA_SENDER_ID")
-    url = "https://api.zenvia.com/v2/channels/whatsapp/messages"
-
-    if not zenvia_api_token or not zenvia_sender_id:
-        print("Erro ao enviar resposta: variaveis ZENVIA_API_TOKEN ou ZENVIA_SENDER_ID nao configuradas.")
-        return
-
-    headers = {
-        "Content-Type": "application/json",
-        "X-API-TOKEN": zenvia_api_token,
-    }
-
-    data = {
-        "from": zenvia_sender_id,
-        "to": to,
-        "contents": [
-            {
-                "type": "text",
-                "text": message,
-            }
-        ],
-    }
-
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        print(f"Resposta enviada com sucesso para {to}. Status: {response.status_code}")
-    except requests.RequestException as error:
-        print(f"Erro ao enviar resposta para {to}: {error}")
-
-
-async def analyze_query(user_message: str) -> dict | None:
+async def understand_message(user_message: str) -> dict | None:
     """
-    Usa a OpenAI para analisar uma pergunta do usuário e extrair parâmetros
-    estruturados para uma consulta ao banco de dados.
+    Classifica a intenção e extrai o conteúdo estruturado (transação ou plano
+    de consulta) em uma única chamada à OpenAI.
+    Retorna None se a resposta não passar na validação do esquema, para que o
+    chamador use o caminho em duas etapas.
     """
+    cache = get_llm_cache()
+    cached = cache.get("understanding", user_message, UNDERSTAND_PROMPT_VERSION)
+    if cached is not None:
+        return dict(cached)
+
     try:
-        client = openai.AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), timeout=30.0)
-        # Note o uso de ''' para um bloco de texto grande.
-        # Dentro dele, aspas duplas " podem ser usadas normalmente.
-        system_prompt = '''
-        Você é um especialista em análise de queries para um banco de dados de finanças.
-        A data de hoje é 12 de Fevereiro de 2026.
-        Sua tarefa é analisar a pergunta do usuário e retornar APENAS um objeto JSON com um plano de consulta.
-
-        As chaves JSON possíveis são:
-        - "aggregation": Obrigatória. Pode ser "sum" ou "list".
-        - "filters": Um objeto com filtros opcionais.
-        - "limit": Um número, se o usuário pedir um limite (ex: "últimas 5").
-
-        Os filtros possíveis dentro de "filters" são:
-        - "date_start" e "date_end": Datas no formato "YYYY-MM-DD".
-        - "tipo": "receita" ou "despesa".
-        - "categoria": Uma categoria financeira comum.
-
-        Exemplos de conversão de pergunta para JSON:
-        - Pergunta: "quanto gastei hoje?" -> Resposta: {"aggregation": "sum", "filters": {"tipo": "despesa", "date_start": "2026-02-12", "date_end": "2026-02-12"}}
-        - Pergunta: "listar minhas receitas de fevereiro" -> Resposta: {"aggregation": "list", "filters": {"tipo": "receita", "date_start": "2026-02-01", "date_end": "2026-02-28"}}
-        - Pergunta: "total de despesas com alimentação este mês" -> Resposta: {"aggregation": "sum", "filters": {"tipo": "despesa", "categoria": "Alimentacao", "date_start": "2026-02-01", "date_end": "2026-02-28"}}
-        - Pergunta: "últimas 3 transações" -> Resposta: {"aggregation": "list", "filters": {}, "limit": 3}
-        - Pergunta: "quais foram minhas receitas?" -> Resposta: {"aggregation": "list", "filters": {"tipo": "receita"}}
-        '''
-
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
+        content = await get_gateway().chat(
+            operation="understand",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": UNDERSTAND_PROMPT},
                 {"role": "user", "content": user_message},
             ],
             temperature=0,
-            # Forçar a resposta em formato JSON é mais confiável
             response_format={"type": "json_object"},
         )
 
-        content = (response.choices[0].message.content or "").strip()
-        return json.loads(content)
-
+        content = content.strip()
+        parsed = json.loads(content)
+        if not isinstance(parsed, dict):
+            return None
+
+        understanding = schemas.parse_understanding(parsed)
+        if understanding is None:
+            return None
+
+        result: dict[str, Any] = {"intent": understanding.intent}
+        if understanding.transaction is not None:
+            result["transaction"] = understanding.transaction.model_dump()
+        if understanding.query_plan is not None:
+            result["query_plan"] = understanding.query_plan.to_dict()
+        cache.set("understanding", user_message, UNDERSTAND_PROMPT_VERSION, result)
+        return dict(result)
+    except CircuitOpenError:
+        raise
     except Exception as error:
-        print(f"Erro ao analisar query com OpenAI: {error}")
+        logger.warning("Erro ao entender mensagem com OpenAI: %s", error)
         return None
 
 
+@contextmanager
+def measure_stage(timings: dict[str, float], stage: str):
+    """
+    Acumula em `timings` a duração (ms) de uma etapa do processamento e a
+    registra no histograma da etapa.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[stage] = timings.get(stage, 0.0) + elapsed * 1000
+        STAGE_SECONDS.observe(elapsed, stage)
+
+
+async def resolve_with_llm(user_message: str, timings: dict[str, float]) -> dict:
+    """
+    Descobre a intenção e o conteúdo estruturado da mensagem usando a OpenAI.
+    No modo "combined" tenta uma única chamada; se a resposta for inválida
+    (ou no modo "two_step"), usa get_intent seguido da extração/análise.
+    """
+    if UNDERSTAND_MODE == "combined":
+        with measure_stage(timings, "understand"):
+            understanding = await understand_message(user_message)
+        if understanding is not None:
+            understanding["mode"] = "combined"
+            return understanding
+        logger.info("Resposta combinada inválida. Usando o caminho em duas etapas.")
+
+    with measure_stage(timings, "intent"):
+        intent = await get_intent(user_message)
+    result: dict[str, Any] = {"intent": intent, "mode": "two_step"}
+
+    if intent == "new_transaction":
+        with measure_stage(timings, "extraction"):
+            result["transaction"] = await extract_transaction_details(user_message)
+    elif intent == "query_transactions":
+        with measure_stage(timings, "query_plan"):
+            result["query_plan"] = await plan_query(user_message)
+
+    return result
+
+
+async def resolve_message(user_message: str, timings: dict[str, float]) -> dict:
+    """
+    Tenta, nesta ordem: as regras locais para as frases mais comuns, o
+    pré-classificador (mensagens quase repetidas) e, por último, a OpenAI,
+    ensinando o resultado ao pré-classificador.
+    """
+    if RULE_PARSER_ENABLED:
+        with measure_stage(timings, "rules"):
+            rule_match = parse_message(user_message)
+        if rule_match is not None and rule_match.confidence >= RULE_PARSER_MIN_CONFIDENCE:
+            result: dict[str, Any] = {"intent": rule_match.intent, "mode": "rules"}
+            if rule_match.transaction is not None:
+                result["transaction"] = rule_match.transaction
+            if rule_match.query_plan is not None:
+                result["query_plan"] = rule_match.query_plan
+            return result
+
+    preclassifier = get_preclassifier()
+
+    if PRECLASSIFIER_ENABLED:
+        with measure_stage(timings, "preclassifier"):
+            match = preclassifier.classify(user_message)
+        if match is not None:
+            result = {"intent": match.intent, "mode": "preclassifier"}
+            if match.transaction is not None:
+                result["transaction"] = match.transaction
+            elif match.intent == "query_transactions":
+                with measure_stage(timings, "query_plan"):
+                    result["query_plan"] = await plan_query(user_message)
+            return result
+
+    result = await resolve_with_llm(user_message, timings)
+    if PRECLASSIFIER_ENABLED:
+        preclassifier.learn(user_message, result)
+    return result
+
+
 def format_query_results(query_plan: dict, results: Any) -> str:
     """
     Formata os resultados da consulta do banco de dados em uma string amigável.
@@ -250,13 +378,68 @@ def format_query_results(query_plan: dict, results: Any) -> str:
         header = "Aqui estão as transações que encontrei:"
         return f"{header}\n\n" + "\n".join(transaction_lines)
 
+    elif aggregation in ANALYTICS_AGGREGATIONS:
+        return format_analytics(aggregation, results)
+
     return "Não consegui formatar a sua resposta."
 
 
-def query_database(query_plan: dict, session: Session) -> Any:
+def format_analytics(aggregation: str, results: dict) -> str:
     """
-    Executa uma consulta no banco de dados com base em um plano gerado pela IA.
-    VERSÃO CORRIGIDA para lidar com datas corretamente.
+    Resposta em texto para as análises de services/analytics.py.
+    """
+    if aggregation == "breakdown":
+        if not results["categories"]:
+            return "Nenhuma transação encontrada para sua busca."
+        lines = [
+            f"- {item['categoria']}: R$ {item['total']:.2f} ({item['share']:.0%})"
+            for item in results["categories"]
+        ]
+        return f"Total de {results['tipo']}s: R$ {results['total']:.2f}\n\n" + "\n".join(lines)
+
+    if aggregation == "compare":
+        current, previous = results["current_total"], results["previous_total_to_date"]
+        header = (
+            f"Até o dia {results['through_day']}, {results['tipo']}s de R$ {current:.2f} "
+            f"contra R$ {previous:.2f} no mesmo período do mês anterior."
+        )
+        lines = [
+            f"- {item['categoria']}: {'+' if item['delta'] >= 0 else '-'}R$ {abs(item['delta']):.2f}"
+            for item in results["categories"][:5]
+            if item["delta"]
+        ]
+        return f"{header}\n\n" + "\n".join(lines) if lines else header
+
+    if aggregation == "balance":
+        return (
+            f"Seu saldo é de R$ {results['closing_balance']:.2f} "
+            f"(era R$ {results['opening_balance']:.2f} em {datetime.fromisoformat(results['date_start']):%d/%m})."
+        )
+
+    if aggregation == "budget":
+        reply = f"Do orçamento de R$ {results['budget']:.2f} você já usou R$ {results['spent']:.2f}"
+        if results["remaining"] <= 0:
+            return reply + f": o orçamento do mês acabou e você passou R$ {-results['remaining']:.2f} dele."
+        reply += f" e restam R$ {results['remaining']:.2f}."
+        if results["projected_exhaustion"]:
+            exhaustion = datetime.fromisoformat(results["projected_exhaustion"])
+            return reply + f" No ritmo atual ele acaba em {exhaustion:%d/%m}; dá para gastar R$ {results['daily_allowance']:.2f} por dia."
+        return reply + f" Você está dentro do planejado: dá para gastar R$ {results['daily_allowance']:.2f} por dia."
+
+    if aggregation == "forecast":
+        return (
+            f"Você gastou R$ {results['spent']:.2f} em {results['days_elapsed']} dias; "
+            f"no ritmo atual o mês deve fechar em R$ {results['projected_total']:.2f}."
+        )
+
+    return "Não consegui formatar a sua resposta."
+
+
+def build_query_statement(query_plan: dict, owner: str | None = None):
+    """
+    Monta o SELECT do plano de consulta. Todos os filtros comparam colunas
+    "nuas" (sem funções e sem curinga no início), então o SQLite consegue
+    usar os índices (owner, ...) da tabela.
     """
     filters_data = query_plan.get("filters", {})
     aggregation = query_plan.get("aggregation")
@@ -268,22 +451,32 @@ def query_database(query_plan: dict, session: Session) -> Any:
     else:  # "list"
         statement = select(models.Transaction)
 
-    # Aplica os filtros dinamicamente
-    for key, value in filters_data.items():
-        # A função func.date() extrai apenas a data (ignora a hora/fuso)
-        # tanto da coluna do banco quanto do valor do filtro.
-        # Isso resolve o problema de fuso horário.
-        if key == "date_start":
-            start_date = datetime.fromisoformat(value).date()
-            statement = statement.where(func.date(models.Transaction.data_criacao) >= start_date)
-        elif key == "date_end":
-            end_date = datetime.fromisoformat(value).date()
-            statement = statement.where(func.date(models.Transaction.data_criacao) <= end_date)
-        elif key == "tipo":
-            statement = statement.where(models.Transaction.tipo == value)
-        elif key == "categoria":
-            # Usamos .ilike() para busca case-insensitive (ignora maiúsculas/minúsculas)
-            statement = statement.where(models.Transaction.categoria.ilike(f"%%{value}%%"))
+    # Restringe ao dono primeiro: é a coluna líder de todos os índices da tabela
+    if owner is not None:
+        statement = statement.where(models.Transaction.owner == owner)
+
+    # Datas são dias no fuso do usuário: viram um intervalo UTC semiaberto
+    # [início, fim) comparado direto com data_criacao (gravada em UTC)
+    date_start = filters_data.get("date_start")
+    date_end = filters_data.get("date_end")
+    start, end = utc_range(
+        datetime.fromisoformat(date_start).date() if date_start else None,
+        datetime.fromisoformat(date_end).date() if date_end else None,
+    )
+    if start is not None:
+        statement = statement.where(models.Transaction.data_criacao >= start)
+    if end is not None:
+        statement = statement.where(models.Transaction.data_criacao < end)
+
+    if filters_data.get("tipo"):
+        statement = statement.where(models.Transaction.tipo == filters_data["tipo"])
+
+    if filters_data.get("categoria"):
+        # Compara a chave canônica gravada na escrita ("Alimentação" == "alimentacao"),
+        # usando o índice (owner, categoria_key, data_criacao) inteiro
+        statement = statement.where(
+            models.Transaction.categoria_key == models.category_key(filters_data["categoria"])
+        )
 
     # Aplica ordenação e limite para listagens
     if aggregation == "list":
@@ -291,89 +484,259 @@ def query_database(query_plan: dict, session: Session) -> Any:
         if limit:
             statement = statement.limit(limit)
 
-    # Executa a consulta
-    results = session.exec(statement)
+    return statement
 
-    if aggregation == "sum":
+
+def query_database(query_plan: dict, session: Session, owner: str | None = None) -> Any:
+    """
+    Executa uma consulta no banco de dados com base em um plano gerado pela IA.
+    Com `owner`, só considera as transações daquele remetente.
+    """
+    if query_plan.get("aggregation") in ANALYTICS_AGGREGATIONS:
+        # Import tardio: services.analytics carrega o numpy
+        from services import analytics
+
+        return analytics.run_plan(session, query_plan, owner)
+
+    if query_plan.get("aggregation") == "sum" and ROLLUPS_ENABLED:
+        # Somas saem dos agregados diários; ver database/rollups.py
+        filters_data = query_plan.get("filters", {})
+        date_start = filters_data.get("date_start")
+        date_end = filters_data.get("date_end")
+        start, end = utc_range(
+            datetime.fromisoformat(date_start).date() if date_start else None,
+            datetime.fromisoformat(date_end).date() if date_end else None,
+        )
+        return rollups.sum_transactions(
+            session,
+            owner=owner,
+            start=start,
+            end=end,
+            tipo=filters_data.get("tipo"),
+            categoria=filters_data.get("categoria"),
+        )
+
+    results = session.exec(build_query_statement(query_plan, owner))
+
+    if query_plan.get("aggregation") == "sum":
         return results.one_or_none() or 0.0
     else:  # "list"
         return results.all()
 
 
-@app.get("/")
+@router.get("/")
 def read_root() -> dict[str, str]:
     return {"message": "API do Assistente Financeiro no ar!"}
 
 
-@app.post("/zenvia-webhook")
+@router.post("/zenvia-webhook")
 def receive_zenvia_webhook(payload: dict[str, Any]) -> dict[str, str]:
     sender = payload.get("from")
     message = payload.get("message", {})
     contents = message.get("contents", [])
     text = contents[0].get("text") if contents and isinstance(contents[0], dict) else None
 
-    print(f"[ZENVIA] Remetente: {sender} | Mensagem: {text}")
+    logger.info("Mensagem recebida no webhook legado", extra={"sender": sender, "text": text})
     return {"status": "received"}
 
 
-async def process_message(sender_number: str, user_message: str):
+def save_transaction(details: dict, owner: str, message_key: str | None = None) -> models.Transaction:
     """
-    Esta função faz todo o trabalho pesado em segundo plano.
+    Grava a transação extraída pelo escritor do banco. Síncrono: deve rodar fora do event loop.
+    Se a mensagem da fila (`message_key`) já gerou uma transação, devolve essa
+    em vez de gravar outra: a tentativa anterior pode ter sido cancelada depois
+    do commit e antes do ack.
+    """
+    def job(session: Session) -> models.Transaction:
+        if message_key is not None:
+            existente = session.exec(
+                select(models.Transaction).where(models.Transaction.message_key == message_key)
+            ).first()
+            if existente is not None:
+                return existente
+        nova_transacao = models.Transaction(
+            owner=owner,
+            descricao=details.get("descricao", "não identificado"),
+            valor=details.get("valor", 0.0),
+            tipo=details.get("tipo", "despesa"),
+            categoria=details.get("categoria", "Outros"),
+            message_key=message_key,
+        )
+        session.add(nova_transacao)
+        session.flush()
+        return nova_transacao
+
+    return get_writer().write(job)
+
+
+def run_query(query_plan: dict, owner: str) -> Any:
+    """
+    Executa o plano de consulta em uma sessão própria. Síncrono: deve rodar fora do event loop.
     """
-    print(f"Processando em segundo plano a mensagem: '{user_message}'")
     with Session(engine) as session:
-        try:
-            intent = await get_intent(user_message)
-            reply_message = f"Desculpe, não consegui entender sua solicitação. A intenção foi: {intent}"
-
-            if intent == "new_transaction":
-                details = extract_transaction_details(user_message)
-
-                nova_transacao = models.Transaction(
-                    descricao=details.get("descricao", "não identificado"),
-                    valor=details.get("valor", 0.0),
-                    tipo=details.get("tipo", "despesa"),
-                    categoria=details.get("categoria", "Outros"),
-                )
-                session.add(nova_transacao)
-                session.commit()
-                session.refresh(nova_transacao)
-
-                reply_message = (
-                    f"✅ Transacao registrada: {nova_transacao.descricao} no valor de R$ {nova_transacao.valor:.2f}."
-                )
-
-            elif intent == "query_transactions":
-                query_plan = await analyze_query(user_message)
-                if not query_plan:
-                    reply_message = "Não consegui entender sua pergunta."
-                else:
-                    results = query_database(query_plan, session)
-                    reply_message = format_query_results(query_plan, results)
-
-            send_reply(sender_number or "", reply_message)
-        except Exception as error:
-            print(f"Erro no processamento em segundo plano: {error}")
-            send_reply(sender_number or "", "Ocorreu um erro inesperado ao processar sua mensagem.")
-
-
-@app.post("/webhook/zenvia")
-async def webhook_zenvia(request: Request, background_tasks: BackgroundTasks):
+        return query_database(query_plan, session, owner=owner)
+
+
+async def process_message(sender_number: str, user_message: str, message_key: str | None = None):
+    """
+    Esta função faz todo o trabalho pesado em segundo plano.
+    As chamadas à OpenAI e à Zenvia são assíncronas e o acesso ao SQLite roda
+    no threadpool, para que nenhuma etapa bloqueie o event loop.
+    Erros inesperados são propagados para o WorkerPool tentar de novo com
+    backoff; o usuário só é avisado quando a mensagem vai para a dead-letter
+    (reply_failure). `message_key` (QueuedMessage.key) impede que uma nova
+    tentativa grave de novo a transação de uma tentativa cancelada.
+    """
+    logger.debug("Processando em segundo plano a mensagem: %r", user_message)
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    mode = UNDERSTAND_MODE
+    outcome = "ok"
+    saved = False
+    try:
+        understanding = await resolve_message(user_message, timings)
+        intent = understanding.get("intent")
+        mode = understanding.get("mode", mode)
+        reply_message = f"Desculpe, não consegui entender sua solicitação. A intenção foi: {intent}"
+
+        if intent == "new_transaction":
+            details = understanding.get("transaction") or {}
+
+            with measure_stage(timings, "db"):
+                nova_transacao = await run_in_threadpool(save_transaction, details, sender_number or "", message_key)
+            saved = True
+
+            reply_message = (
+                f"✅ Transacao registrada: {nova_transacao.descricao} no valor de R$ {nova_transacao.valor:.2f}."
+            )
+
+        elif intent == "query_transactions":
+            query_plan = understanding.get("query_plan")
+            if not query_plan:
+                reply_message = "Não consegui entender sua pergunta."
+            else:
+                # O plano é simbólico ("este mês"); as datas saem do dia de hoje, no fuso do usuário
+                query_plan = resolve_plan(query_plan)
+                with measure_stage(timings, "db"):
+                    results = await run_in_threadpool(run_query, query_plan, sender_number or "")
+                reply_message = format_query_results(query_plan, results)
+
+        with measure_stage(timings, "reply"):
+            await send_reply(sender_number or "", reply_message)
+    except CircuitOpenError:
+        outcome = "circuit_open"
+        logger.warning("OpenAI indisponível (circuito aberto). Enviando resposta padrão.")
+        await send_reply(sender_number or "", CANNED_REPLY)
+    except Exception:
+        outcome = "error"
+        if saved:
+            # A transação já foi gravada: tentar de novo a duplicaria
+            logger.exception("Erro ao responder sobre a transação já registrada")
+        else:
+            logger.exception("Erro no processamento em segundo plano")
+            raise
+    finally:
+        total = time.perf_counter() - started
+        MESSAGE_SECONDS.observe(total, mode, outcome)
+        logger.info(
+            "Mensagem processada",
+            extra={
+                "mode": mode,
+                "outcome": outcome,
+                **{f"{stage}_ms": round(elapsed, 1) for stage, elapsed in timings.items()},
+                "total_ms": round(total * 1000, 1),
+            },
+        )
+
+
+async def reply_failure(sender_number: str, user_message: str):
+    """
+    Avisa o usuário quando a mensagem esgotou as tentativas e foi para a dead-letter.
+    """
+    await send_reply(sender_number or "", "Ocorreu um erro inesperado ao processar sua mensagem.")
+
+
+@router.get("/queue/metrics")
+def queue_metrics() -> dict[str, float]:
+    return {
+        **get_work_queue().metrics(),
+        "duplicates_suppressed": get_idempotency_store().stats["duplicates_suppressed"],
+    }
+
+
+@router.get("/metrics")
+def metrics() -> Response:
+    """
+    Métricas deste processo no formato de texto do Prometheus.
+    """
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/outbox/metrics")
+def outbox_metrics() -> dict[str, float]:
+    return get_dispatcher().metrics()
+
+
+def accept_message(message_id: str | None, sender_number: str, user_message: str) -> bool:
+    """
+    Descarta reenvios da Zenvia e enfileira as mensagens novas.
+    Retorna False se a entrega já tinha sido recebida.
+    """
+    idempotency_store = get_idempotency_store()
+    if not idempotency_store.check_and_remember(message_id, sender_number, user_message):
+        return False
+    try:
+        get_work_queue().enqueue(sender_number, user_message)
+    except Exception:
+        # Não foi enfileirada: o próximo reenvio precisa ser aceito
+        idempotency_store.forget(message_id, sender_number, user_message)
+        raise
+    return True
+
+
+@router.post("/webhook/zenvia")
+async def webhook_zenvia(request: Request):
     try:
         body = await request.json()
+        message_id = body.get("message", {}).get("id")
         sender_number = body.get("message", {}).get("from")
         user_message = body.get("message", {}).get("contents", [{}])[0].get("text", "").strip()
 
         if not user_message:
-            print("Recebida mensagem vazia ou evento de status. Ignorando.")
+            logger.debug("Recebida mensagem vazia ou evento de status. Ignorando.")
             return Response(status_code=200)
 
-        # Adiciona a tarefa pesada para ser executada em segundo plano
-        background_tasks.add_task(process_message, sender_number, user_message)
+        # Grava a mensagem na fila persistente; os workers fazem o trabalho pesado
+        accepted = await run_in_threadpool(accept_message, message_id, sender_number or "", user_message)
+        if not accepted:
+            logger.info("Reenvio da mensagem %s de %s ignorado.", message_id or repr(user_message), sender_number)
+            return Response(status_code=200)
+        if request.app.state.worker_pool is not None:
+            request.app.state.worker_pool.notify()
 
-        # Retorna 'OK' imediatamente para o Zenvia não reenviar a mensagem
-        print(f"Webhook recebido. Adicionando '{user_message}' ao processamento em segundo plano.")
+        # Retorna 'OK' assim que a mensagem está gravada para o Zenvia não reenviar
+        logger.debug("Webhook recebido. %r adicionada à fila de processamento.", user_message)
         return Response(status_code=200)
-    except Exception as error:
-        print(f"Erro crítico no webhook: {error}")
+    except QueueFullError as error:
+        # Backpressure: a Zenvia reenvia mais tarde
+        logger.warning("Fila cheia, recusando webhook: %s", error)
+        return Response(status_code=503)
+    except Exception:
+        logger.exception("Erro crítico no webhook")
         return Response(status_code=500)
+
+
+def create_app() -> FastAPI:
+    """
+    Monta a aplicação. Nada aqui abre conexões: o cliente da OpenAI, o cliente
+    HTTP da Zenvia, a fila e o writer do banco são criados no primeiro uso.
+    """
+    configure_logging()
+    application = FastAPI(title="Assistente Financeiro", lifespan=lifespan)
+    application.include_router(router)
+    application.include_router(transactions_router, prefix="/transactions", tags=["Transactions"])
+    application.include_router(analytics_router, prefix="/analytics", tags=["Analytics"])
+    return application
+
+
+app = create_app()
@@ -0,0 +1,85 @@
+from datetime import date
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session
+
+from database.database import get_session
+from services.dates import local_today
+
+# services.analytics carrega o numpy: cada endpoint importa no primeiro uso, fora do startup
+router = APIRouter()
+
+
+def _period(date_start: date | None, date_end: date | None) -> tuple[date, date]:
+    from services import analytics
+
+    # Sem datas: do início do mês até hoje
+    today = local_today()
+    start = date_start or analytics.month_bounds(date_end or today)[0]
+    end = date_end or today
+    if end < start:
+        raise HTTPException(status_code=400, detail="date_end anterior a date_start")
+    return start, end
+
+
+@router.get("/breakdown")
+def get_breakdown(
+    owner: str | None = None,
+    tipo: Literal["receita", "despesa"] = "despesa",
+    date_start: date | None = None,
+    date_end: date | None = None,
+    session: Session = Depends(get_session),
+):
+    from services import analytics
+
+    start, end = _period(date_start, date_end)
+    return analytics.category_breakdown(analytics.load_daily(session, owner, start, end), tipo)
+
+
+@router.get("/month-over-month")
+def get_month_over_month(
+    owner: str | None = None,
+    tipo: Literal["receita", "despesa"] = "despesa",
+    reference: date | None = None,
+    session: Session = Depends(get_session),
+):
+    from services import analytics
+
+    return analytics.month_over_month(session, owner, reference, tipo)
+
+
+@router.get("/balance")
+def get_balance(
+    owner: str | None = None,
+    date_start: date | None = None,
+    date_end: date | None = None,
+    session: Session = Depends(get_session),
+):
+    from services import analytics
+
+    start, end = _period(date_start, date_end)
+    return analytics.running_balance(session, owner, start, end)
+
+
+@router.get("/budget")
+def get_budget(
+    budget: float = Query(gt=0),
+    owner: str | None = None,
+    reference: date | None = None,
+    session: Session = Depends(get_session),
+):
+    from services import analytics
+
+    return analytics.budget_burndown(session, owner, budget, reference)
+
+
+@router.get("/forecast")
+def get_forecast(
+    owner: str | None = None,
+    reference: date | None = None,
+    session: Session = Depends(get_session),
+):
+    from services import analytics
+
+    return analytics.forecast_month(session, owner, reference)
@@ -1,25 +1,49 @@
-from datetime import datetime
-from typing import List
+import base64
+import codecs
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from typing import Iterator, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import tuple_
 from sqlmodel import Session, select
 
 from database import models
-from database.database import get_db, get_session
+from database.database import engine, get_session, get_writer
+from services.dates import utc_range
+from services.statement_import import (
+    IMPORT_LLM_CATEGORIZE,
+    ImportFormatError,
+    categorize_descriptions,
+    categorize_with_llm,
+    import_statement,
+)
 
 router = APIRouter()
 
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ["id", "owner", "tipo", "valor", "descricao", "categoria", "data_criacao"]
+
 
 class TransactionCreate(BaseModel):
     tipo: str = "despesa"
     description: str
     amount: float
     category: str | None = None
+    owner: str = ""
 
 
 class TransactionResponse(BaseModel):
     id: int
+    tipo: str = "despesa"
     description: str
     amount: float
     category: str | None
@@ -28,53 +52,211 @@ class TransactionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_model(cls, transaction: models.Transaction) -> "TransactionResponse":
+        return cls(
+            id=transaction.id,
+            tipo=transaction.tipo,
+            description=transaction.descricao,
+            amount=transaction.valor,
+            category=transaction.categoria,
+            date_created=transaction.data_criacao,
+        )
+
+
+class TransactionPage(BaseModel):
+    items: list[TransactionResponse]
+    # Passe em ?cursor= para buscar a próxima página; None quando acabou
+    next_cursor: str | None = None
+
+
+class TransactionFilters(BaseModel):
+    owner: str | None = None
+    tipo: str | None = None
+    categoria: str | None = None
+    date_start: date | None = None
+    date_end: date | None = None
+
+
+def encode_cursor(transaction: models.Transaction) -> str:
+    raw = json.dumps([transaction.data_criacao.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data_criacao, transaction_id = json.loads(raw)
+        return datetime.fromisoformat(data_criacao), int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor invalido")
+
+
+def filtered_statement(filters: TransactionFilters, descending: bool = True):
+    """
+    SELECT das transações com os filtros aplicados, ordenado por (data_criacao, id).
+    Os filtros comparam colunas nuas para aproveitar os índices (owner, ...).
+    """
+    statement = select(models.Transaction)
+    if filters.owner is not None:
+        statement = statement.where(models.Transaction.owner == filters.owner)
+    if filters.tipo:
+        statement = statement.where(models.Transaction.tipo == filters.tipo)
+    if filters.categoria:
+        statement = statement.where(models.Transaction.categoria_key == models.category_key(filters.categoria))
+    start, end = utc_range(filters.date_start, filters.date_end)
+    if start is not None:
+        statement = statement.where(models.Transaction.data_criacao >= start)
+    if end is not None:
+        statement = statement.where(models.Transaction.data_criacao < end)
+
+    if descending:
+        return statement.order_by(models.Transaction.data_criacao.desc(), models.Transaction.id.desc())
+    return statement.order_by(models.Transaction.data_criacao, models.Transaction.id)
+
 
 @router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-def create_transaction(payload: TransactionCreate, db: Session = Depends(get_db)):
-    transaction = models.Transaction(
-        tipo=payload.tipo,
-        valor=payload.amount,
-        descricao=payload.description,
-        categoria=payload.category or "Sem categoria",
-    )
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-    return TransactionResponse(
-        id=transaction.id,
-        description=transaction.descricao,
-        amount=transaction.valor,
-        category=transaction.categoria,
-        date_created=transaction.data_criacao,
-    )
-
-
-@router.get("/", response_model=list[models.Transaction])
-def get_all_transactions(session: Session = Depends(get_session)) -> List[models.Transaction]:
-    transactions = session.exec(select(models.Transaction)).all()
-    return transactions
+def create_transaction(payload: TransactionCreate):
+    def job(session: Session) -> models.Transaction:
+        transaction = models.Transaction(
+            owner=payload.owner,
+            tipo=payload.tipo,
+            valor=payload.amount,
+            descricao=payload.description,
+            categoria=payload.category or "Sem categoria",
+        )
+        session.add(transaction)
+        session.flush()
+        return transaction
+
+    return TransactionResponse.from_model(get_writer().write(job))
+
+
+@router.get("/", response_model=TransactionPage)
+def get_all_transactions(
+    filters: TransactionFilters = Depends(),
+    cursor: str | None = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    order: Literal["asc", "desc"] = "desc",
+    session: Session = Depends(get_session),
+) -> TransactionPage:
+    """
+    Lista as transações em páginas (keyset): cada página continua a partir do
+    (data_criacao, id) da última linha da anterior, sem OFFSET.
+    """
+    descending = order == "desc"
+    statement = filtered_statement(filters, descending)
+    if cursor:
+        position = tuple_(models.Transaction.data_criacao, models.Transaction.id)
+        last = tuple_(*decode_cursor(cursor))
+        statement = statement.where(position < last if descending else position > last)
+
+    # Uma linha a mais só para saber se existe próxima página
+    rows = session.exec(statement.limit(limit + 1)).all()
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return TransactionPage(items=[TransactionResponse.from_model(row) for row in items], next_cursor=next_cursor)
+
+
+def _export_rows(filters: TransactionFilters) -> Iterator[models.Transaction]:
+    # Sessão própria: o StreamingResponse continua iterando depois que o endpoint retorna
+    with Session(engine) as session:
+        statement = filtered_statement(filters, descending=False).execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        )
+        yield from session.exec(statement)
+
+
+def _export_ndjson(filters: TransactionFilters) -> Iterator[str]:
+    for row in _export_rows(filters):
+        data = {field: getattr(row, field) for field in EXPORT_FIELDS}
+        data["data_criacao"] = row.data_criacao.isoformat()
+        yield json.dumps(data, ensure_ascii=False) + "\n"
+
+
+def _export_csv(filters: TransactionFilters) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(_export_rows(filters), start=1):
+        writer.writerow([getattr(row, field) for field in EXPORT_FIELDS])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.get("/export")
+def export_transactions(
+    filters: TransactionFilters = Depends(),
+    format: Literal["ndjson", "csv"] = "ndjson",
+) -> StreamingResponse:
+    """
+    Exporta todas as transações filtradas em streaming, com memória constante.
+    """
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(filters),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="transacoes.csv"'},
+        )
+    return StreamingResponse(_export_ndjson(filters), media_type="application/x-ndjson")
+
+
+@router.post("/import")
+async def import_transactions(
+    request: Request,
+    owner: str = "",
+    format: Literal["auto", "csv", "ofx"] = "auto",
+    encoding: str = "utf-8",
+) -> dict:
+    """
+    Importa um extrato CSV/OFX enviado como corpo da requisição
+    (ex.: curl --data-binary @extrato.ofx). O corpo é copiado em streaming para
+    um arquivo temporário e gravado em lotes fora do event loop.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=422, detail=f"Encoding desconhecido: {encoding}")
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding=encoding, errors="replace", newline="")
+        try:
+            result = await run_in_threadpool(
+                import_statement,
+                owner,
+                stream,
+                format,
+                categorize_with_llm if IMPORT_LLM_CATEGORIZE else categorize_descriptions,
+            )
+        except ImportFormatError as error:
+            raise HTTPException(status_code=422, detail=str(error))
+        finally:
+            stream.detach()
+    return result.to_dict()
 
 
 @router.get("/{transaction_id}", response_model=TransactionResponse)
-def get_transaction(transaction_id: int, db: Session = Depends(get_db)):
-    transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
+def get_transaction(transaction_id: int, session: Session = Depends(get_session)):
+    transaction = session.get(models.Transaction, transaction_id)
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transacao nao encontrada")
-    return TransactionResponse(
-        id=transaction.id,
-        description=transaction.descricao,
-        amount=transaction.valor,
-        category=transaction.categoria,
-        date_created=transaction.data_criacao,
-    )
+    return TransactionResponse.from_model(transaction)
 
 
 @router.delete("/{transaction_id}")
-def delete_transaction(transaction_id: int, session: Session = Depends(get_session)):
-    transaction = session.get(models.Transaction, transaction_id)
-    if transaction is None:
-        raise HTTPException(status_code=404, detail="Transacao nao encontrada")
+def delete_transaction(transaction_id: int):
+    def job(session: Session) -> bool:
+        transaction = session.get(models.Transaction, transaction_id)
+        if transaction is None:
+            return False
+        session.delete(transaction)
+        return True
 
-    session.delete(transaction)
-    session.commit()
+    if not get_writer().write(job):
+        raise HTTPException(status_code=404, detail="Transacao nao encontrada")
     return {"ok": True}
@@ -0,0 +1,298 @@
+"""
+Análises financeiras vetorizadas: para onde foi o dinheiro, comparação com o
+mês anterior, saldo acumulado, consumo do orçamento e projeção do mês.
+
+Os dados vêm do rollup diário (database/rollups.py) em uma única consulta por
+análise, convertidos em colunas NumPy; todo o cálculo é feito com
+bincount/cumsum sobre essas colunas, sem laço por transação. O custo depende
+do número de (dia, tipo, categoria) do período, não do número de transações.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import case
+from sqlmodel import Session, func, select
+
+from database import models
+from services.dates import local_today
+
+
+@dataclass
+class DailyFrame:
+    """
+    Colunas do rollup de um dono em [start, end], dias locais inclusivos.
+    """
+
+    start: date
+    end: date
+    day: np.ndarray  # deslocamento em dias a partir de `start`
+    is_expense: np.ndarray
+    category: np.ndarray  # índice em `categories`
+    total: np.ndarray
+    count: np.ndarray
+    categories: list[str]
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+    def signed(self) -> np.ndarray:
+        """Valores com sinal: receitas positivas, despesas negativas."""
+        return np.where(self.is_expense, -self.total, self.total)
+
+
+def category_label(key: str) -> str:
+    # O rollup guarda só a chave canônica ("alimentacao"); as categorias padrão são ASCII
+    return key.capitalize() if key else "Sem categoria"
+
+
+def _for_owner(statement, owner: str | None):
+    # Sem owner (painel), considera todos os remetentes
+    return statement if owner is None else statement.where(models.TransactionRollup.owner == owner)
+
+
+def load_daily(session: Session, owner: str | None, start: date, end: date) -> DailyFrame:
+    rollup = models.TransactionRollup
+    statement = select(rollup.day, rollup.tipo, rollup.categoria_key, rollup.total, rollup.count).where(
+        rollup.day >= start, rollup.day <= end
+    )
+    rows = session.exec(_for_owner(statement, owner)).all()
+
+    categories = sorted({row[2] for row in rows})
+    index = {key: position for position, key in enumerate(categories)}
+    origin = start.toordinal()
+    return DailyFrame(
+        start=start,
+        end=end,
+        day=np.fromiter((row[0].toordinal() - origin for row in rows), dtype=np.int64, count=len(rows)),
+        is_expense=np.fromiter((row[1] == "despesa" for row in rows), dtype=bool, count=len(rows)),
+        category=np.fromiter((index[row[2]] for row in rows), dtype=np.int64, count=len(rows)),
+        total=np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows)),
+        count=np.fromiter((row[4] for row in rows), dtype=np.int64, count=len(rows)),
+        categories=[category_label(key) for key in categories],
+    )
+
+
+def balance_before(session: Session, owner: str | None, day: date) -> float:
+    """Saldo (receitas - despesas) de tudo antes de `day`."""
+    rollup = models.TransactionRollup
+    signed = func.sum(case((rollup.tipo == "despesa", -rollup.total), else_=rollup.total))
+    return session.exec(_for_owner(select(signed).where(rollup.day < day), owner)).one_or_none() or 0.0
+
+
+def month_bounds(day: date) -> tuple[date, date]:
+    return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def category_breakdown(frame: DailyFrame, tipo: str = "despesa") -> dict:
+    """
+    Total, quantidade e participação por categoria, da maior para a menor.
+    """
+    mask = frame.is_expense if tipo == "despesa" else ~frame.is_expense
+    size = len(frame.categories)
+    totals = np.bincount(frame.category[mask], weights=frame.total[mask], minlength=size)
+    counts = np.bincount(frame.category[mask], weights=frame.count[mask], minlength=size)
+    grand_total = float(totals.sum())
+    order = np.argsort(-totals, kind="stable")
+    return {
+        "tipo": tipo,
+        "date_start": frame.start.isoformat(),
+        "date_end": frame.end.isoformat(),
+        "total": round(grand_total, 2),
+        "categories": [
+            {
+                "categoria": frame.categories[position],
+                "total": round(float(totals[position]), 2),
+                "count": int(counts[position]),
+                "share": round(float(totals[position] / grand_total), 4) if grand_total else 0.0,
+            }
+            for position in order
+            if totals[position] > 0
+        ],
+    }
+
+
+def month_over_month(session: Session, owner: str | None, reference: date | None = None, tipo: str = "despesa") -> dict:
+    """
+    Mês de `reference` contra o mês anterior, por categoria. O mês corrente é
+    comparado com o mesmo número de dias do mês anterior ("até hoje").
+    """
+    reference = reference or local_today()
+    current_start, current_end = month_bounds(reference)
+    previous_start, previous_end = month_bounds(current_start - timedelta(days=1))
+    frame = load_daily(session, owner, previous_start, current_end)
+
+    mask = frame.is_expense if tipo == "despesa" else ~frame.is_expense
+    offset = (current_start - previous_start).days
+    is_current = frame.day >= offset
+    # Mesmo trecho do mês anterior: até o dia do mês de `reference`
+    elapsed = (reference - current_start).days if reference <= current_end else (current_end - current_start).days
+    is_previous_to_date = ~is_current & (frame.day <= elapsed)
+
+    size = len(frame.categories)
+
+    def totals(selection: np.ndarray) -> np.ndarray:
+        selection = selection & mask
+        return np.bincount(frame.category[selection], weights=frame.total[selection], minlength=size)
+
+    current = totals(is_current)
+    previous = totals(~is_current)
+    previous_to_date = totals(is_previous_to_date)
+    delta = current - previous_to_date
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(previous_to_date > 0, delta / previous_to_date, np.nan)
+
+    order = np.argsort(-np.abs(delta), kind="stable")
+    return {
+        "tipo": tipo,
+        "current_month": current_start.strftime("%Y-%m"),
+        "previous_month": previous_start.strftime("%Y-%m"),
+        "through_day": elapsed + 1,
+        "current_total": round(float(current.sum()), 2),
+        "previous_total": round(float(previous.sum()), 2),
+        "previous_total_to_date": round(float(previous_to_date.sum()), 2),
+        "categories": [
+            {
+                "categoria": frame.categories[position],
+                "current": round(float(current[position]), 2),
+                "previous_to_date": round(float(previous_to_date[position]), 2),
+                "delta": round(float(delta[position]), 2),
+                "change": None if np.isnan(change[position]) else round(float(change[position]), 4),
+            }
+            for position in order
+            if current[position] or previous[position]
+        ],
+    }
+
+
+def running_balance(session: Session, owner: str | None, start: date, end: date) -> dict:
+    """
+    Saldo acumulado dia a dia, partindo do saldo de tudo antes de `start`.
+    """
+    frame = load_daily(session, owner, start, end)
+    opening = balance_before(session, owner, start)
+    daily = np.bincount(frame.day, weights=frame.signed(), minlength=frame.days)[: frame.days]
+    balance = opening + np.cumsum(daily)
+    return {
+        "date_start": start.isoformat(),
+        "date_end": end.isoformat(),
+        "opening_balance": round(opening, 2),
+        "closing_balance": round(float(balance[-1]), 2) if len(balance) else round(opening, 2),
+        "days": [
+            {"day": (start + timedelta(days=offset)).isoformat(), "net": round(float(net), 2), "balance": round(float(value), 2)}
+            for offset, (net, value) in enumerate(zip(daily, balance))
+        ],
+    }
+
+
+def _month_expenses(session: Session, owner: str | None, reference: date) -> tuple[DailyFrame, np.ndarray, int]:
+    start, end = month_bounds(reference)
+    frame = load_daily(session, owner, start, end)
+    daily = np.bincount(frame.day[frame.is_expense], weights=frame.total[frame.is_expense], minlength=frame.days)
+    elapsed = min(max((reference - start).days + 1, 1), frame.days)
+    return frame, daily, elapsed
+
+
+def forecast_month(session: Session, owner: str | None, reference: date | None = None) -> dict:
+    """
+    Projeção das despesas do mês: reta ajustada (mínimos quadrados) sobre o
+    gasto acumulado até `reference`, e o ritmo médio diário por categoria.
+    """
+    reference = reference or local_today()
+    frame, daily, elapsed = _month_expenses(session, owner, reference)
+    cumulative = np.cumsum(daily[:elapsed])
+    spent = float(cumulative[-1])
+
+    if elapsed >= 2:
+        slope, intercept = np.polyfit(np.arange(1, elapsed + 1), cumulative, 1)
+        projected = max(float(slope * frame.days + intercept), spent)
+    else:
+        projected = spent * frame.days
+
+    mask = frame.is_expense & (frame.day < elapsed)
+    per_category = np.bincount(frame.category[mask], weights=frame.total[mask], minlength=len(frame.categories))
+    rate = per_category / elapsed
+    order = np.argsort(-per_category, kind="stable")
+    return {
+        "month": frame.start.strftime("%Y-%m"),
+        "days_elapsed": elapsed,
+        "days_in_month": frame.days,
+        "spent": round(spent, 2),
+        "projected_total": round(projected, 2),
+        "categories": [
+            {
+                "categoria": frame.categories[position],
+                "spent": round(float(per_category[position]), 2),
+                "projected": round(float(rate[position] * frame.days), 2),
+            }
+            for position in order
+            if per_category[position] > 0
+        ],
+    }
+
+
+def budget_burndown(session: Session, owner: str | None, budget: float, reference: date | None = None) -> dict:
+    """
+    Consumo do orçamento mensal: restante dia a dia contra a linha ideal e,
+    no ritmo atual, em que dia o orçamento acaba.
+    """
+    reference = reference or local_today()
+    frame, daily, elapsed = _month_expenses(session, owner, reference)
+    remaining = budget - np.cumsum(daily[:elapsed])
+    ideal = budget * (1 - np.arange(1, frame.days + 1) / frame.days)
+    spent = budget - float(remaining[-1])
+    daily_rate = spent / elapsed
+
+    exhausted_on = None
+    if daily_rate > 0:
+        day_number = int(np.ceil(budget / daily_rate))
+        if day_number <= frame.days:
+            exhausted_on = (frame.start + timedelta(days=day_number - 1)).isoformat()
+
+    return {
+        "month": frame.start.strftime("%Y-%m"),
+        "budget": round(budget, 2),
+        "spent": round(spent, 2),
+        "remaining": round(float(remaining[-1]), 2),
+        "ideal_remaining": round(float(ideal[elapsed - 1]), 2),
+        "on_track": bool(remaining[-1] >= ideal[elapsed - 1]),
+        "daily_allowance": round(max(float(remaining[-1]), 0.0) / max(frame.days - elapsed, 1), 2),
+        "projected_exhaustion": exhausted_on,
+        "days": [
+            {
+                "day": (frame.start + timedelta(days=offset)).isoformat(),
+                "remaining": round(float(remaining[offset]), 2),
+                "ideal": round(float(ideal[offset]), 2),
+            }
+            for offset in range(elapsed)
+        ],
+    }
+
+
+def run_plan(session: Session, query_plan: dict, owner: str | None = None) -> dict:
+    """
+    Executa uma aggregation de análise do plano concreto (resolve_plan). O
+    período do plano é o intervalo da análise; compare/budget/forecast usam o
+    mês de date_end, até hoje se for o mês corrente.
+    """
+    filters = query_plan.get("filters", {})
+    today = local_today()
+    start = date.fromisoformat(filters["date_start"]) if filters.get("date_start") else month_bounds(today)[0]
+    end = date.fromisoformat(filters["date_end"]) if filters.get("date_end") else today
+    reference = min(end, today)
+    tipo = filters.get("tipo") or "despesa"
+
+    aggregation = query_plan.get("aggregation")
+    if aggregation == "breakdown":
+        return category_breakdown(load_daily(session, owner, start, end), tipo)
+    if aggregation == "compare":
+        return month_over_month(session, owner, reference, tipo)
+    if aggregation == "balance":
+        return running_balance(session, owner, start, max(start, min(end, today)))
+    if aggregation == "budget":
+        return budget_burndown(session, owner, query_plan["budget"], reference)
+    if aggregation == "forecast":
+        return forecast_month(session, owner, reference)
+    raise ValueError(f"Aggregation de análise desconhecida: {aggregation}")
@@ -0,0 +1,237 @@
+"""
+Cache das respostas da OpenAI.
+
+Camada em memória com LRU + TTL e uma camada compartilhada entre workers, que
+sobrevive a restarts/deploys: o estado compartilhado de services/shared_state.py
+(LLM_CACHE_SHARED) ou um arquivo SQLite próprio e limitado (LLM_CACHE_PATH).
+As chaves combinam o texto normalizado com a versão do prompt, então mudar
+um prompt invalida automaticamente as respostas antigas.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from services.observability import CACHE_LOOKUPS, REGISTRY
+from services.shared_state import SHARED_STATE_BACKEND, SharedState, get_shared_state
+
+LLM_CACHE_MAXSIZE = int(os.environ.get("LLM_CACHE_MAXSIZE", "10000"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(24 * 60 * 60)))
+# Caminho de um arquivo SQLite só para o cache; vazio usa o estado compartilhado
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "")
+# "0" deixa o cache só na memória de cada processo
+LLM_CACHE_SHARED = os.environ.get("LLM_CACHE_SHARED", "1") == "1"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.strip().lower().split())
+
+
+def prompt_version(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class TTLCache:
+    """
+    Dicionário com limite de tamanho (descarta o menos usado) e expiração por item.
+    """
+
+    def __init__(self, maxsize: int = LLM_CACHE_MAXSIZE, ttl: float = LLM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCacheTier:
+    """
+    Camada persistente em um arquivo SQLite (modo WAL), compartilhável entre processos.
+    Os valores precisam ser serializáveis em JSON.
+    """
+
+    def __init__(self, path: str, ttl: float = LLM_CACHE_TTL, maxsize: int = LLM_CACHE_MAXSIZE * 10):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_expires_at ON llm_cache (expires_at)")
+        self._writes = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._prune()
+
+    def _prune(self) -> None:
+        cursor = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        removed = cursor.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.maxsize:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)",
+                (count - self.maxsize,),
+            )
+            removed += cursor.rowcount
+        self.stats["evictions"] += removed
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SharedCacheTier:
+    """
+    Camada guardada no estado compartilhado: um worker aproveita as respostas
+    que outro já pagou. Sem limite de itens; as entradas somem pelo TTL.
+    """
+
+    def __init__(self, state: SharedState, ttl: float = LLM_CACHE_TTL):
+        self.state = state
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Any | None:
+        value = self.state.get(f"llm:{key}")
+        self.stats["misses" if value is None else "hits"] += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self.state.set(f"llm:{key}", value, self.ttl if ttl is None else ttl)
+
+
+class LLMCache:
+    """
+    Cache em dois níveis para respostas de prompts (intenção, extração, plano de consulta).
+    Um acerto na camada persistente é promovido para a memória.
+    """
+
+    def __init__(self, memory: TTLCache | None = None, persistent: SQLiteCacheTier | SharedCacheTier | None = None):
+        self.memory = memory or TTLCache()
+        self.persistent = persistent
+
+    @staticmethod
+    def make_key(namespace: str, text: str, version: str) -> str:
+        return f"{namespace}:{version}:{normalize_text(text)}"
+
+    def get(self, namespace: str, text: str, version: str) -> Any | None:
+        key = self.make_key(namespace, text, version)
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        CACHE_LOOKUPS.inc(namespace, "miss" if value is None else "hit")
+        return value
+
+    def set(self, namespace: str, text: str, version: str, value: Any) -> None:
+        key = self.make_key(namespace, text, version)
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    @property
+    def stats(self) -> dict[str, dict[str, int]]:
+        stats = {"memory": dict(self.memory.stats)}
+        if self.persistent is not None:
+            stats["persistent"] = dict(self.persistent.stats)
+        return stats
+
+
+_llm_cache: LLMCache | None = None
+
+
+def get_llm_cache() -> LLMCache:
+    global _llm_cache
+    if _llm_cache is None:
+        persistent = None
+        if LLM_CACHE_PATH:
+            persistent = SQLiteCacheTier(LLM_CACHE_PATH)
+        elif LLM_CACHE_SHARED and SHARED_STATE_BACKEND != "memory":
+            # Com o backend "memory" a camada só repetiria a memória do processo
+            persistent = SharedCacheTier(get_shared_state())
+        _llm_cache = LLMCache(TTLCache(), persistent)
+    return _llm_cache
+
+
+def _collect_cache_metrics():
+    if _llm_cache is None:
+        return
+    tiers = _llm_cache.stats
+    yield "assistente_llm_cache_tier_lookups_total", "counter", "Consultas por camada do cache de respostas", [
+        ({"tier": tier, "result": result}, stats[result]) for tier, stats in tiers.items() for result in ("hits", "misses")
+    ]
+    yield "assistente_llm_cache_hit_ratio", "gauge", "Fração de acertos por camada do cache de respostas", [
+        ({"tier": tier}, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0.0)
+        for tier, stats in tiers.items()
+    ]
+    yield "assistente_llm_cache_entries", "gauge", "Itens na camada em memória do cache de respostas", [
+        ({}, len(_llm_cache.memory))
+    ]
+
+
+REGISTRY.register_collector(_collect_cache_metrics)
@@ -0,0 +1,162 @@
+"""
+Categorização em lote de descrições de transações.
+
+Em vez de uma chamada à OpenAI por descrição (extract_transaction_details),
+envia até CATEGORIZE_BATCH_SIZE descrições por prompt e recebe um array JSON
+alinhado por índice. Entradas inválidas (ausentes, vazias, não-texto) são
+refeitas uma a uma; os lotes rodam em paralelo até
+CATEGORIZE_MAX_CONCURRENCY. O resultado segue a mesma semântica de
+Transaction.categoria: as categorias do prompt de extração, com "Outros" como
+fallback, e a categoria_key derivada na gravação.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable
+
+from database.models import category_key
+from services.cache import get_llm_cache, prompt_version
+from services.llm_gateway import CircuitOpenError, get_gateway
+
+logger = logging.getLogger(__name__)
+
+CATEGORIZE_BATCH_SIZE = int(os.environ.get("CATEGORIZE_BATCH_SIZE", "25"))
+CATEGORIZE_MAX_CONCURRENCY = int(os.environ.get("CATEGORIZE_MAX_CONCURRENCY", "4"))
+
+# Mesmas categorias do TRANSACTION_PROMPT em main.py
+CATEGORIES = ["Salario", "Alimentacao", "Transporte", "Moradia", "Saude", "Educacao", "Lazer", "Outros"]
+_CANONICAL = {category_key(category): category for category in CATEGORIES}
+
+CATEGORIZE_PROMPT = (
+    "Voce e um assistente financeiro que categoriza descricoes de transacoes.\n"
+    "A mensagem do usuario e um array JSON de descricoes.\n"
+    "Responda APENAS com um JSON no formato:\n"
+    '{"categorias": ["...", "..."]}\n'
+    "Regras:\n"
+    "- o array categorias deve ter exatamente o mesmo tamanho e a mesma ordem do array recebido.\n"
+    f"- cada item deve ser uma destas categorias: {', '.join(CATEGORIES)}.\n"
+    "Exemplos de categorizacao:\n"
+    "- salario, bonus, freelas -> Salario\n"
+    "- mercado, restaurante, lanches -> Alimentacao\n"
+    "- uber, onibus, combustivel -> Transporte\n"
+    "- aluguel, condominio, luz, agua, internet -> Moradia\n"
+    "- farmacia, medico, plano de saude -> Saude\n"
+    "- cursos, livros, mensalidade -> Educacao\n"
+    "- cinema, streaming, viagens -> Lazer\n"
+    "- compras diversas -> Outros\n"
+    "Se houver duvida, escolha a categoria mais provavel."
+)
+CATEGORIZE_PROMPT_VERSION = prompt_version(CATEGORIZE_PROMPT)
+
+
+def canonical_category(value) -> str | None:
+    """
+    Normaliza a categoria devolvida pelo modelo; None se a entrada for inválida.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return _CANONICAL.get(category_key(value), value.strip())
+
+
+def parse_batch_response(content: str, size: int) -> list[str | None]:
+    """
+    Lê {"categorias": [...]} e devolve `size` entradas, None nas inválidas.
+    Resposta ilegível ou de tamanho errado invalida o lote inteiro.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return [None] * size
+    items = data.get("categorias") if isinstance(data, dict) else data
+    if not isinstance(items, list) or len(items) != size:
+        return [None] * size
+    return [canonical_category(item) for item in items]
+
+
+class BatchCategorizer:
+    def __init__(self, batch_size: int = CATEGORIZE_BATCH_SIZE, max_concurrency: int = CATEGORIZE_MAX_CONCURRENCY):
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.stats = {"descriptions": 0, "cached": 0, "batches": 0, "retried": 0, "fallbacks": 0}
+
+    async def _ask(self, descriptions: list[str]) -> list[str | None]:
+        content = await get_gateway().chat(
+            operation="categorize",
+            messages=[
+                {"role": "system", "content": CATEGORIZE_PROMPT},
+                {"role": "user", "content": json.dumps(descriptions, ensure_ascii=False)},
+            ],
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        return parse_batch_response(content, len(descriptions))
+
+    async def _categorize_one(self, descricao: str) -> str | None:
+        try:
+            return (await self._ask([descricao]))[0]
+        except CircuitOpenError:
+            raise
+        except Exception as error:
+            logger.warning("Erro ao categorizar %r: %r", descricao, error)
+            return None
+
+    async def _categorize_batch(self, batch: list[str], semaphore: asyncio.Semaphore) -> dict[str, str | None]:
+        async with semaphore:
+            self.stats["batches"] += 1
+            try:
+                results = await self._ask(batch)
+            except CircuitOpenError:
+                raise
+            except Exception as error:
+                logger.warning("Erro ao categorizar lote de %s descrições: %r", len(batch), error)
+                results = [None] * len(batch)
+
+            categories = {descricao: result for descricao, result in zip(batch, results) if result is not None}
+            malformed = [descricao for descricao, result in zip(batch, results) if result is None]
+            self.stats["retried"] += len(malformed)
+            retried = await asyncio.gather(*(self._categorize_one(descricao) for descricao in malformed))
+        categories.update(zip(malformed, retried))
+        return categories
+
+    async def categorize(self, descriptions: Iterable[str]) -> dict[str, str]:
+        """
+        Categoria de cada descrição distinta. Respostas válidas ficam no cache de
+        respostas; descrições que falharam também na retentativa viram "Outros" (sem cache).
+        """
+        cache = get_llm_cache()
+        results: dict[str, str] = {}
+        pending = []
+        for descricao in dict.fromkeys(descriptions):
+            self.stats["descriptions"] += 1
+            cached = cache.get("category", descricao, CATEGORIZE_PROMPT_VERSION)
+            if cached is not None:
+                self.stats["cached"] += 1
+                results[descricao] = cached
+            else:
+                pending.append(descricao)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        for categories in await asyncio.gather(*(self._categorize_batch(batch, semaphore) for batch in batches)):
+            for descricao, categoria in categories.items():
+                if categoria is None:
+                    self.stats["fallbacks"] += 1
+                    results[descricao] = "Outros"
+                    continue
+                cache.set("category", descricao, CATEGORIZE_PROMPT_VERSION, categoria)
+                results[descricao] = categoria
+        return results
+
+
+_categorizer: BatchCategorizer | None = None
+
+
+def get_categorizer() -> BatchCategorizer:
+    global _categorizer
+    if _categorizer is None:
+        _categorizer = BatchCategorizer()
+    return _categorizer
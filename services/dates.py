@@ -0,0 +1,97 @@
+"""
+Datas no fuso do usuário.
+
+As transações gravam data_criacao em UTC (datetime.utcnow), mas "hoje" e
+"este mês" são dias no fuso do usuário. Os filtros viram intervalos
+semiabertos [início, fim) em UTC, comparados direto com a coluna, o que
+permite ao SQLite usar os índices em data_criacao.
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Literal
+from zoneinfo import ZoneInfo
+
+APP_TIMEZONE = ZoneInfo(os.environ.get("APP_TIMEZONE", "America/Sao_Paulo"))
+
+
+def local_today() -> date:
+    return datetime.now(APP_TIMEZONE).date()
+
+
+def day_start_utc(day: date) -> datetime:
+    """
+    Meia-noite local de `day`, convertida para UTC sem tzinfo (o formato de data_criacao).
+    """
+    local_midnight = datetime.combine(day, time.min, tzinfo=APP_TIMEZONE)
+    return local_midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_range(date_start: date | None, date_end: date | None) -> tuple[datetime | None, datetime | None]:
+    """
+    Converte dias locais inclusivos [date_start, date_end] para o intervalo
+    UTC semiaberto [início, fim).
+    """
+    start = day_start_utc(date_start) if date_start else None
+    end = day_start_utc(date_end + timedelta(days=1)) if date_end else None
+    return start, end
+
+
+# Períodos simbólicos do plano de consulta (PlanPeriod.kind); "range" tem datas
+# absolutas e não passa por period_range
+PeriodKind = Literal[
+    "today",
+    "yesterday",
+    "this_week",
+    "last_week",
+    "this_month",
+    "last_month",
+    "this_year",
+    "last_n_days",
+    "month",
+    "range",
+]
+
+
+def _month_bounds(year: int, month: int) -> tuple[date, date]:
+    first = date(year, month, 1)
+    next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first, next_month - timedelta(days=1)
+
+
+def period_range(
+    period: str,
+    today: date | None = None,
+    days: int | None = None,
+    month: int | None = None,
+    year: int | None = None,
+) -> tuple[date, date]:
+    """
+    Converte um período simbólico em dias locais (início, fim), ambos inclusivos.
+    "last_n_days" usa `days` (incluindo hoje); "month" usa `month` e, sem `year`,
+    a ocorrência mais recente desse mês até hoje.
+    """
+    today = today or local_today()
+    if period == "today":
+        return today, today
+    if period == "yesterday":
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+    if period == "this_week":
+        return today - timedelta(days=today.weekday()), today
+    if period == "last_week":
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if period == "this_month":
+        return _month_bounds(today.year, today.month)
+    if period == "last_month":
+        last_day = today.replace(day=1) - timedelta(days=1)
+        return last_day.replace(day=1), last_day
+    if period == "this_year":
+        return date(today.year, 1, 1), date(today.year, 12, 31)
+    if period == "last_n_days" and days:
+        return today - timedelta(days=days - 1), today
+    if period == "month" and month:
+        if year is None:
+            year = today.year if month <= today.month else today.year - 1
+        return _month_bounds(year, month)
+    raise ValueError(f"Período desconhecido ou incompleto: {period}")
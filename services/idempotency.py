@@ -0,0 +1,75 @@
+"""
+Deduplicação dos webhooks da Zenvia.
+
+Quando o processamento demora a Zenvia reenvia a mesma entrega; sem controle
+cada reenvio vira outro process_message (mais gasto com a OpenAI e transações
+duplicadas). A chave é o id da mensagem no provedor; se ele não vier, usamos
+(remetente, hash do texto) dentro de uma janela de tempo.
+
+A verificação passa primeiro por um TTLCache em memória e depois pelo estado
+compartilhado (services/shared_state.py; SQLite por padrão), comum a todos os
+workers e que sobrevive a restarts.
+"""
+import hashlib
+import os
+
+from services.cache import TTLCache
+from services.shared_state import SharedState, get_shared_state
+
+# Por quanto tempo um id do provedor é lembrado
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+# Janela do fallback (remetente, hash do texto) quando não há id do provedor
+IDEMPOTENCY_FALLBACK_WINDOW = float(os.environ.get("IDEMPOTENCY_FALLBACK_WINDOW", "600"))
+
+
+def idempotency_key(message_id: str | None, sender: str, text: str) -> tuple[str, float]:
+    """
+    Retorna a chave e a janela (em segundos) em que ela conta como duplicada.
+    """
+    if message_id:
+        return f"id:{message_id}", IDEMPOTENCY_TTL
+    digest = hashlib.sha1(text.strip().lower().encode("utf-8")).hexdigest()
+    return f"text:{sender}:{digest}", IDEMPOTENCY_FALLBACK_WINDOW
+
+
+class IdempotencyStore:
+    def __init__(self, state: SharedState | None = None):
+        self.state = state or get_shared_state()
+        self.stats = {"checked": 0, "duplicates_suppressed": 0}
+        self._memory = TTLCache(maxsize=100_000, ttl=IDEMPOTENCY_TTL)
+
+    def check_and_remember(self, message_id: str | None, sender: str, text: str) -> bool:
+        """
+        Registra a entrega e retorna True se ela é nova, False se é um reenvio.
+        """
+        key, window = idempotency_key(message_id, sender, text)
+        self.stats["checked"] += 1
+
+        if self._memory.get(key) is not None:
+            self.stats["duplicates_suppressed"] += 1
+            return False
+
+        # Grava a chave, ou ocupa uma já expirada; se ela existe, é duplicada
+        is_new = self.state.add(f"dedup:{key}", True, window)
+        self._memory.set(key, True, ttl=window)
+        if not is_new:
+            self.stats["duplicates_suppressed"] += 1
+        return is_new
+
+    def forget(self, message_id: str | None, sender: str, text: str) -> None:
+        """
+        Esquece uma entrega que não chegou a ser enfileirada, para que o reenvio seja aceito.
+        """
+        key, _ = idempotency_key(message_id, sender, text)
+        self._memory.delete(key)
+        self.state.delete(f"dedup:{key}")
+
+
+_idempotency_store: IdempotencyStore | None = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore()
+    return _idempotency_store
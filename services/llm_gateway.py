@@ -0,0 +1,238 @@
+"""
+Gateway único para as chamadas à OpenAI.
+
+Mantém um cliente com pool de conexões persistente, limita quantas chamadas
+ficam abertas ao mesmo tempo, refaz 429/5xx com backoff exponencial com
+jitter e abre um circuit breaker quando o provedor está degradado.
+"""
+import asyncio
+import importlib
+import os
+import random
+import time
+
+import httpx
+
+from services.observability import LLM_CALLS, LLM_SECONDS, LLM_TOKENS, REGISTRY
+
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+
+# Resposta enviada ao usuário enquanto o circuito está aberto
+CANNED_REPLY = "⚠️ O assistente está temporariamente indisponível. Tente novamente em alguns minutos."
+
+
+class CircuitOpenError(Exception):
+    """O provedor está degradado e as chamadas estão sendo recusadas sem tentar."""
+
+
+class CircuitBreaker:
+    """
+    Abre após `failure_threshold` falhas consecutivas. Depois de `cooldown`
+    segundos deixa passar uma única chamada de teste (meio aberto): se ela
+    funcionar o circuito fecha, senão volta a abrir. Uma chamada de teste
+    cancelada libera a vaga (release_probe); se nem isso acontecer, a vaga
+    expira depois de mais `cooldown` segundos.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_started: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half_open" and (self._probe_started is None or now - self._probe_started >= self.cooldown):
+            self._probe_started = now
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """
+        A chamada de teste terminou sem resultado (cancelada): outra pode testar.
+        """
+        self._probe_started = None
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def backoff_delay(attempt: int, error: Exception | None = None) -> float:
+    """
+    Backoff exponencial com "full jitter"; respeita o Retry-After do 429 quando existir.
+    """
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(LLM_BACKOFF_MAX, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # O pacote openai leva ~0,5 s para importar: só é carregado quando o gateway é criado
+        import openai
+
+        self._client = openai.AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+            timeout=LLM_TIMEOUT,
+            # As retentativas ficam a cargo do gateway, para passarem pelo breaker
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=max_concurrency,
+                    max_keepalive_connections=max_concurrency,
+                ),
+            ),
+        )
+
+    async def chat(self, messages: list[dict], model: str = LLM_MODEL, operation: str = "chat", **kwargs) -> str:
+        """
+        Executa um chat completion e devolve o conteúdo da resposta.
+        Levanta CircuitOpenError sem chamar o provedor se o circuito estiver aberto.
+        `operation` identifica a função chamadora nas métricas (chamadas, latência, tokens).
+        """
+        probe = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            LLM_CALLS.inc(operation, "short_circuited")
+            raise CircuitOpenError("circuito da OpenAI aberto")
+        if not probe:
+            return await self._chat(messages, model, operation, **kwargs)
+        try:
+            return await self._chat(messages, model, operation, **kwargs)
+        finally:
+            # Cancelada (visibility timeout do worker, desligamento) antes de
+            # registrar sucesso ou falha: sem isso o circuito nunca mais testaria
+            self.breaker.release_probe()
+
+    async def _chat(self, messages: list[dict], model: str, operation: str, **kwargs) -> str:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            self.stats["calls"] += 1
+            try:
+                async with self._semaphore:
+                    response = await self._client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        **kwargs,
+                    )
+            except Exception as error:
+                if not is_retryable(error):
+                    # Erro do pedido (4xx, JSON inválido...): o provedor está saudável
+                    self.breaker.record_success()
+                    LLM_CALLS.inc(operation, "error")
+                    raise
+                if attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    self.breaker.record_failure()
+                    LLM_CALLS.inc(operation, "error")
+                    raise
+                if self.breaker.state == "open":
+                    # Outra chamada já abriu o circuito: não insiste no provedor
+                    self.stats["short_circuited"] += 1
+                    LLM_CALLS.inc(operation, "short_circuited")
+                    raise CircuitOpenError("circuito da OpenAI aberto") from error
+                self.stats["retries"] += 1
+                LLM_CALLS.inc(operation, "retry")
+                await asyncio.sleep(backoff_delay(attempt, error))
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            LLM_CALLS.inc(operation, "ok")
+            LLM_SECONDS.observe(time.perf_counter() - started, operation)
+            if response.usage is not None:
+                LLM_TOKENS.inc(operation, "prompt", amount=response.usage.prompt_tokens)
+                LLM_TOKENS.inc(operation, "completion", amount=response.usage.completion_tokens)
+            return response.choices[0].message.content or ""
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+_gateway: LLMGateway | None = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+async def preload_client() -> None:
+    """
+    Importa o pacote openai em uma thread, para a primeira mensagem não pagar
+    o import dentro do event loop. Chamado no startup dos processos com workers.
+    """
+    await asyncio.to_thread(importlib.import_module, "openai")
+
+
+async def close_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.close()
+        _gateway = None
+
+
+def _collect_gateway_metrics():
+    if _gateway is None:
+        return
+    yield "assistente_llm_circuit_open", "gauge", "1 se o circuito da OpenAI está aberto ou meio aberto", [
+        ({}, 0.0 if _gateway.breaker.state == "closed" else 1.0)
+    ]
+
+
+REGISTRY.register_collector(_collect_gateway_metrics)
@@ -0,0 +1,410 @@
+"""
+Outbox persistente (SQLite) e dispatcher das respostas enviadas pela Zenvia.
+
+O processamento da mensagem só grava a resposta no outbox; o ReplyDispatcher
+reserva lotes de respostas e as entrega pelo cliente HTTP keep-alive
+compartilhado. Garantias:
+- respostas pendentes sobrevivem a um restart (ficam na tabela até a entrega);
+- respostas para um mesmo destinatário saem em ordem;
+- cada canal envia até ZENVIA_RATE_PER_SECOND por segundo, com rajadas de até
+  ZENVIA_BURST, para não estourar o limite do provedor nos picos. Com
+  ZENVIA_RATE_SHARED=1 (padrão) o limite é contado no estado compartilhado
+  (services/shared_state.py) e vale para a soma de todos os processos com
+  dispatcher; com 0, cada processo tem o seu token bucket;
+- falhas transitórias (rede, 429, 5xx) voltam para o outbox com backoff
+  exponencial com jitter, respeitando o Retry-After; depois de
+  OUTBOX_MAX_ATTEMPTS, ou em erro definitivo (4xx), a resposta fica como 'failed'.
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from services.observability import REGISTRY, Histogram
+from services.shared_state import SharedState, get_shared_state
+from services.work_queue import QUEUE_DB_PATH
+from services.zenvia_service import ZENVIA_CHANNEL, DeliveryError, deliver
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DB_PATH = os.environ.get("OUTBOX_DB_PATH", QUEUE_DB_PATH)
+OUTBOX_CONCURRENCY = int(os.environ.get("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "32"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_SEND_TIMEOUT = float(os.environ.get("OUTBOX_SEND_TIMEOUT", "60"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1.0"))
+# No desligamento, quanto esperar os envios em andamento antes de cancelá-los
+OUTBOX_STOP_TIMEOUT = float(os.environ.get("OUTBOX_STOP_TIMEOUT", "10"))
+OUTBOX_BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", "1.0"))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", "300"))
+ZENVIA_RATE_PER_SECOND = float(os.environ.get("ZENVIA_RATE_PER_SECOND", "20"))
+ZENVIA_BURST = int(os.environ.get("ZENVIA_BURST", "40"))
+ZENVIA_RATE_SHARED = os.environ.get("ZENVIA_RATE_SHARED", "1") == "1"
+
+DELIVERY_SECONDS = Histogram(
+    "assistente_reply_delivery_seconds", "Duração de cada envio à Zenvia", ["channel", "outcome"]
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reply_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_reply_outbox_status_available ON reply_outbox (status, available_at);
+CREATE INDEX IF NOT EXISTS ix_reply_outbox_recipient_id ON reply_outbox (recipient, id);
+"""
+
+# Reserva até :limit respostas que podem sair agora: pendentes e disponíveis,
+# ou em envio com o prazo vencido (processo que caiu no meio do envio), e sem
+# resposta anterior ainda não entregue para o mesmo destinatário.
+CLAIM_SQL = """
+UPDATE reply_outbox
+SET status = 'sending', locked_until = :locked_until, attempts = attempts + 1
+WHERE id IN (
+    SELECT o.id FROM reply_outbox o
+    WHERE (
+        (o.status = 'pending' AND o.available_at <= :now)
+        OR (o.status = 'sending' AND o.locked_until <= :now)
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM reply_outbox earlier
+        WHERE earlier.recipient = o.recipient AND earlier.id < o.id AND earlier.status != 'failed'
+    )
+    ORDER BY o.id
+    LIMIT :limit
+)
+RETURNING id, channel, recipient, text, attempts
+"""
+
+
+@dataclass
+class OutboxReply:
+    id: int
+    channel: str
+    recipient: str
+    text: str
+    attempts: int
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: str = OUTBOX_DB_PATH,
+        send_timeout: float = OUTBOX_SEND_TIMEOUT,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.send_timeout = send_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def add(self, recipient: str, text: str, channel: str = ZENVIA_CHANNEL) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO reply_outbox (channel, recipient, text, available_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (channel, recipient, text, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int = OUTBOX_BATCH_SIZE) -> list[OutboxReply]:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                CLAIM_SQL, {"now": now, "locked_until": now + self.send_timeout, "limit": limit}
+            ).fetchall()
+        # RETURNING não garante a ordem do UPDATE
+        return sorted((OutboxReply(*row) for row in rows), key=lambda reply: reply.id)
+
+    def mark_sent(self, replies: list[OutboxReply]) -> None:
+        """Remove as respostas entregues, todas em uma transação."""
+        if not replies:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM reply_outbox WHERE id = ?", [(reply.id,) for reply in replies])
+            self._conn.execute("COMMIT")
+
+    def retry(self, reply: OutboxReply, delay: float, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE reply_outbox SET status = 'pending', locked_until = NULL, available_at = ?, last_error = ?"
+                " WHERE id = ?",
+                (time.time() + delay, error, reply.id),
+            )
+
+    def release(self, reply: OutboxReply) -> None:
+        """
+        Devolve imediatamente uma resposta reservada, sem contar a tentativa
+        (usado no desligamento do dispatcher).
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE reply_outbox SET status = 'pending', locked_until = NULL, attempts = attempts - 1"
+                " WHERE id = ?",
+                (reply.id,),
+            )
+
+    def fail(self, reply: OutboxReply, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE reply_outbox SET status = 'failed', locked_until = NULL, last_error = ? WHERE id = ?",
+                (error, reply.id),
+            )
+        logger.error(
+            "Resposta %s para %s não entregue após %s tentativa(s): %s", reply.id, reply.recipient, reply.attempts, error,
+            extra={"channel": reply.channel},
+        )
+
+    def metrics(self) -> dict[str, float]:
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT status, COUNT(*) FROM reply_outbox GROUP BY status").fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM reply_outbox WHERE status != 'failed'"
+            ).fetchone()[0]
+        return {
+            "pending": rows.get("pending", 0),
+            "sending": rows.get("sending", 0),
+            "failed": rows.get("failed", 0),
+            "oldest_unsent_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TokenBucket:
+    """
+    Até `burst` envios de uma vez e, depois, `rate` envios por segundo.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """Espera um token; devolve quanto tempo esperou."""
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class SharedRateLimiter:
+    """
+    O mesmo limite do TokenBucket, guardado no estado compartilhado: vale
+    para a soma de todos os processos que usam o mesmo backend.
+    """
+
+    def __init__(self, state: SharedState, name: str, rate: float, burst: int):
+        self.state = state
+        self.key = f"rate:{name}"
+        self.rate = rate
+        self.burst = burst
+
+    async def acquire(self) -> float:
+        """Espera a vez; devolve quanto tempo esperou."""
+        waited = 0.0
+        while True:
+            delay = await asyncio.to_thread(self.state.rate_limit, self.key, self.rate, self.burst)
+            if delay <= 0:
+                return waited
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Backoff exponencial com "full jitter"; nunca menor que o Retry-After do provedor.
+    """
+    delay = random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, min(OUTBOX_BACKOFF_MAX, retry_after))
+    return delay
+
+
+class ReplyDispatcher:
+    """
+    Uma tarefa que reserva lotes do outbox e os entrega com até `concurrency`
+    envios simultâneos, cada um esperando o token do seu canal. Entregas com
+    sucesso são removidas do outbox em uma única transação por lote.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: Callable[[str, str, str], Awaitable[None]] = deliver,
+        concurrency: int = OUTBOX_CONCURRENCY,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        rate_per_second: float = ZENVIA_RATE_PER_SECOND,
+        burst: int = ZENVIA_BURST,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        shared_rate: bool = ZENVIA_RATE_SHARED,
+    ):
+        self.outbox = outbox
+        self.send = send
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.poll_interval = poll_interval
+        self.shared_rate = shared_rate
+        self.stats = {"enqueued": 0, "sent": 0, "retried": 0, "given_up": 0, "batches": 0, "throttled_seconds": 0.0}
+        self._buckets: dict[str, TokenBucket | SharedRateLimiter] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def bucket(self, channel: str) -> TokenBucket | SharedRateLimiter:
+        if channel not in self._buckets:
+            if self.shared_rate:
+                self._buckets[channel] = SharedRateLimiter(
+                    get_shared_state(), f"zenvia:{channel}", self.rate_per_second, self.burst
+                )
+            else:
+                self._buckets[channel] = TokenBucket(self.rate_per_second, self.burst)
+        return self._buckets[channel]
+
+    async def enqueue(self, recipient: str, text: str, channel: str = ZENVIA_CHANNEL) -> int:
+        reply_id = await asyncio.to_thread(self.outbox.add, recipient, text, channel)
+        self.stats["enqueued"] += 1
+        self._wakeup.set()
+        return reply_id
+
+    async def _deliver(self, reply: OutboxReply, semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            self.stats["throttled_seconds"] += await self.bucket(reply.channel).acquire()
+            started = time.perf_counter()
+            try:
+                await self.send(reply.recipient, reply.text, reply.channel)
+            except DeliveryError as error:
+                DELIVERY_SECONDS.observe(time.perf_counter() - started, reply.channel, "error")
+                await self._handle_failure(reply, str(error), error.retryable, error.retry_after)
+                return False
+            except Exception as error:
+                DELIVERY_SECONDS.observe(time.perf_counter() - started, reply.channel, "error")
+                await self._handle_failure(reply, repr(error), True, None)
+                return False
+            DELIVERY_SECONDS.observe(time.perf_counter() - started, reply.channel, "ok")
+            return True
+
+    async def _handle_failure(self, reply: OutboxReply, error: str, retryable: bool, retry_after: float | None) -> None:
+        if not retryable or reply.attempts >= self.outbox.max_attempts:
+            self.stats["given_up"] += 1
+            await asyncio.to_thread(self.outbox.fail, reply, error)
+            return
+        self.stats["retried"] += 1
+        await asyncio.to_thread(self.outbox.retry, reply, backoff_delay(reply.attempts - 1, retry_after), error)
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while not self._stopping:
+            replies = await asyncio.to_thread(self.outbox.claim, self.batch_size)
+            if not replies:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.stats["batches"] += 1
+            tasks = [asyncio.create_task(self._deliver(reply, semaphore)) for reply in replies]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # Cancelado no meio do lote: as que já saíram são confirmadas e as
+                # outras voltam para o outbox (uma resposta que a Zenvia já tinha
+                # aceitado pode sair de novo: a entrega é "pelo menos uma vez")
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                sent = [
+                    reply for reply, task in zip(replies, tasks)
+                    if not task.cancelled() and task.exception() is None and task.result()
+                ]
+                self.stats["sent"] += len(sent)
+                await asyncio.to_thread(self.outbox.mark_sent, sent)
+                for reply, task in zip(replies, tasks):
+                    if task.cancelled():
+                        await asyncio.to_thread(self.outbox.release, reply)
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = OUTBOX_STOP_TIMEOUT) -> None:
+        """
+        Para de reservar lotes e espera o lote em andamento terminar; depois de
+        `timeout` segundos cancela os envios que faltam.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def metrics(self) -> dict[str, float]:
+        return {**self.outbox.metrics(), **self.stats}
+
+
+_dispatcher: ReplyDispatcher | None = None
+
+
+def get_dispatcher() -> ReplyDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = ReplyDispatcher(Outbox())
+    return _dispatcher
+
+
+def _collect_outbox_metrics():
+    if _dispatcher is None:
+        return
+    metrics = _dispatcher.outbox.metrics()
+    yield "assistente_outbox_replies", "gauge", "Respostas no outbox por estado", [
+        ({"status": status}, metrics[status]) for status in ("pending", "sending", "failed")
+    ]
+    yield "assistente_outbox_oldest_unsent_age_seconds", "gauge", "Idade da resposta não entregue mais antiga", [
+        ({}, metrics["oldest_unsent_age_seconds"])
+    ]
+    yield "assistente_outbox_events_total", "counter", "Eventos do dispatcher de respostas neste processo", [
+        ({"event": event}, _dispatcher.stats[event]) for event in ("enqueued", "sent", "retried", "given_up")
+    ]
+
+
+REGISTRY.register_collector(_collect_outbox_metrics)
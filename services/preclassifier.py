@@ -0,0 +1,158 @@
+"""
+Pré-classificador local para mensagens quase repetidas.
+
+A mensagem vira um "template": sem acentos e pontuação, com valores, datas e
+símbolos de moeda mascarados ("Gastei R$ 52,90 no Uber!" -> "gastei <num> no uber").
+Cada template guarda os resultados que a OpenAI já deu para ele; quando um
+resultado é consistente o bastante, a próxima mensagem com o mesmo template é
+respondida sem chamar a API, com o valor lido de forma determinística.
+"""
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+
+from services.cache import LLMCache, get_llm_cache
+from services.schemas import INTENTS
+
+PRECLASSIFIER_ENABLED = os.environ.get("PRECLASSIFIER_ENABLED", "1") == "1"
+PRECLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("PRECLASSIFIER_MIN_CONFIDENCE", "0.6"))
+TEMPLATE_VERSION = "v1"
+
+DATE_PATTERN = re.compile(r"\b(?:\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}(?:/\d{2,4})?)\b")
+CURRENCY_PATTERN = re.compile(r"r\$|\brs\b|\breais\b|\breal\b|\bbrl\b|\$")
+AMOUNT_PATTERN = re.compile(r"(?<![\w.,])(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?![\w])")
+PUNCTUATION_PATTERN = re.compile(r"[^\w<>\s]")
+
+
+def strip_accents(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in normalized if not unicodedata.combining(char))
+
+
+def _clean(text: str) -> str:
+    text = strip_accents(text.lower())
+    text = DATE_PATTERN.sub(" <data> ", text)
+    return CURRENCY_PATTERN.sub(" ", text)
+
+
+def to_float(token: str) -> float:
+    """
+    Converte "1.234,56", "1234,56", "1234.56" e "1.500" (milhar) para float.
+    """
+    if "," in token:
+        return float(token.replace(".", "").replace(",", "."))
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+", token):
+        return float(token.replace(".", ""))
+    return float(token)
+
+
+def parse_amount(text: str) -> float | None:
+    """
+    Lê o valor da mensagem sem usar a OpenAI. Retorna None se não houver
+    exatamente um número (fora datas) na mensagem.
+    """
+    amounts = AMOUNT_PATTERN.findall(_clean(text))
+    if len(amounts) != 1:
+        return None
+    return to_float(amounts[0])
+
+
+def message_template(text: str) -> str:
+    text = AMOUNT_PATTERN.sub(" <num> ", _clean(text))
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+@dataclass
+class Preclassification:
+    intent: str
+    confidence: float
+    template: str
+    transaction: dict | None = None
+
+
+class Preclassifier:
+    """
+    Índice template -> resultados observados, guardado no cache de respostas
+    (e portanto compartilhado entre workers quando o cache tem camada persistente).
+    A confiança de um resultado é acertos / (observações + 1): são necessárias
+    pelo menos duas observações concordantes para passar do limite padrão.
+    """
+
+    def __init__(self, cache: LLMCache | None = None, min_confidence: float = PRECLASSIFIER_MIN_CONFIDENCE):
+        self.cache = cache
+        self.min_confidence = min_confidence
+        self.stats = {"lookups": 0, "local_hits": 0, "learned": 0}
+
+    def _cache(self) -> LLMCache:
+        return self.cache or get_llm_cache()
+
+    def classify(self, text: str) -> Preclassification | None:
+        self.stats["lookups"] += 1
+        template = message_template(text)
+        entry = self._cache().get("template", template, TEMPLATE_VERSION)
+        if not entry:
+            return None
+
+        total = sum(outcome["count"] for outcome in entry.values())
+        best = max(entry.values(), key=lambda outcome: outcome["count"])
+        confidence = best["count"] / (total + 1)
+        if confidence < self.min_confidence:
+            return None
+
+        match = Preclassification(intent=best["intent"], confidence=confidence, template=template)
+        if best["intent"] == "new_transaction":
+            amount = parse_amount(text)
+            if amount is None:
+                return None
+            match.transaction = {
+                "tipo": best["tipo"],
+                "valor": amount,
+                "descricao": best["descricao"],
+                "categoria": best["categoria"],
+            }
+
+        self.stats["local_hits"] += 1
+        return match
+
+    def learn(self, text: str, understanding: dict) -> None:
+        """
+        Registra o resultado que a OpenAI deu para esta mensagem.
+        Transações só são aprendidas se o valor extraído bater com o lido localmente.
+        """
+        intent = understanding.get("intent")
+        if intent not in INTENTS:
+            return
+
+        outcome: dict = {"intent": intent}
+        if intent == "new_transaction":
+            details = understanding.get("transaction") or {}
+            amount = parse_amount(text)
+            if amount is None or abs(float(details.get("valor", -1)) - amount) > 0.005:
+                return
+            outcome.update(
+                tipo=details.get("tipo", "despesa"),
+                descricao=details.get("descricao", "não identificado"),
+                categoria=details.get("categoria", "Outros"),
+            )
+
+        template = message_template(text)
+        cache = self._cache()
+        entry = cache.get("template", template, TEMPLATE_VERSION) or {}
+        key = "|".join(str(outcome.get(field, "")) for field in ("intent", "tipo", "categoria"))
+        previous = entry.get(key, {"count": 0})
+        # A descrição mais recente prevalece; só intenção/tipo/categoria definem o resultado
+        entry[key] = {**outcome, "count": previous["count"] + 1}
+        cache.set("template", template, TEMPLATE_VERSION, entry)
+        self.stats["learned"] += 1
+
+
+_preclassifier: Preclassifier | None = None
+
+
+def get_preclassifier() -> Preclassifier:
+    global _preclassifier
+    if _preclassifier is None:
+        _preclassifier = Preclassifier()
+    return _preclassifier
@@ -0,0 +1,130 @@
+"""
+Planejador canônico das consultas do chatbot.
+
+A OpenAI (ou o parser de regras) produz um plano simbólico, sem datas:
+{"aggregation": "sum", "filters": {"tipo": "despesa"}, "period": {"kind": "this_month"}}.
+Como o plano não depende do dia em que foi gerado, ele é cacheado pela pergunta
+normalizada; resolve_plan converte o período em datas locais só na execução.
+Uma pergunta repetida não chama a OpenAI e continua certa nos dias seguintes.
+"""
+import json
+import logging
+from datetime import date
+
+from services import schemas
+from services.cache import get_llm_cache, prompt_version
+from services.dates import period_range
+from services.llm_gateway import CircuitOpenError, get_gateway
+from services.rule_parser import normalize
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_AGGREGATIONS = {"breakdown", "compare", "balance", "budget", "forecast"}
+
+PLAN_FORMAT = """
+    Formato do plano:
+    {"aggregation": ..., "filters": {"tipo": ..., "categoria": ...}, "period": {...}, "limit": número, "budget": número}
+    - "aggregation": "sum" para total/quanto gastei/quanto recebi; "list" para listar/mostrar/últimas;
+      "breakdown" para gastos por categoria/onde gastei mais; "compare" para comparar com o mês anterior;
+      "balance" para saldo; "budget" para acompanhar um orçamento do mês (exige "budget" com o valor em reais);
+      "forecast" para previsão/projeção de gastos do mês.
+    - "filters.tipo": "receita" ou "despesa". "filters.categoria": uma categoria financeira comum.
+    - "period" (opcional), nunca com datas calculadas por você:
+      {"kind": "today"} | {"kind": "yesterday"} | {"kind": "this_week"} | {"kind": "last_week"}
+      | {"kind": "this_month"} | {"kind": "last_month"} | {"kind": "this_year"}
+      | {"kind": "last_n_days", "days": N} | {"kind": "month", "month": 1-12, "year": opcional}
+      | {"kind": "range", "date_start": "YYYY-MM-DD", "date_end": "YYYY-MM-DD"} (só datas absolutas ditas pelo usuário)
+    - "limit": só se o usuário pedir uma quantidade (ex: "últimas 5").
+    - "compare", "budget" e "forecast" usam o mês do período (padrão: mês atual).
+    Se algum filtro ou período não for mencionado, não inclua a chave.
+"""
+
+QUERY_PLANNER_PROMPT = f'''
+    Você é um especialista em análise de queries para um banco de dados de finanças.
+    Transforme a pergunta do usuário em um plano de consulta e retorne APENAS o objeto JSON do plano.
+{PLAN_FORMAT}
+    Exemplos:
+    - "quanto gastei hoje?" -> {{"aggregation": "sum", "filters": {{"tipo": "despesa"}}, "period": {{"kind": "today"}}}}
+    - "listar minhas receitas de fevereiro" -> {{"aggregation": "list", "filters": {{"tipo": "receita"}}, "period": {{"kind": "month", "month": 2}}}}
+    - "total de despesas com alimentação este mês" -> {{"aggregation": "sum", "filters": {{"tipo": "despesa", "categoria": "Alimentacao"}}, "period": {{"kind": "this_month"}}}}
+    - "quanto gastei nos últimos 7 dias?" -> {{"aggregation": "sum", "filters": {{"tipo": "despesa"}}, "period": {{"kind": "last_n_days", "days": 7}}}}
+    - "últimas 3 transações" -> {{"aggregation": "list", "filters": {{}}, "limit": 3}}
+    - "quais foram minhas receitas?" -> {{"aggregation": "list", "filters": {{"tipo": "receita"}}}}
+    - "onde gastei mais este mês?" -> {{"aggregation": "breakdown", "filters": {{"tipo": "despesa"}}, "period": {{"kind": "this_month"}}}}
+    - "gastei mais que no mês passado?" -> {{"aggregation": "compare", "filters": {{"tipo": "despesa"}}}}
+    - "qual meu saldo?" -> {{"aggregation": "balance", "filters": {{}}}}
+    - "meu orçamento do mês é 3000, como estou?" -> {{"aggregation": "budget", "filters": {{"tipo": "despesa"}}, "budget": 3000}}
+    - "quanto vou gastar até o fim do mês?" -> {{"aggregation": "forecast", "filters": {{"tipo": "despesa"}}}}
+'''
+QUERY_PLANNER_PROMPT_VERSION = prompt_version(QUERY_PLANNER_PROMPT)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Chave do cache: sem acentos, minúscula, sem pontuação final e espaços extras.
+    """
+    return normalize(question)
+
+
+async def plan_query(question: str) -> dict | None:
+    """
+    Plano simbólico da pergunta, validado pelo esquema estrito. Planos válidos
+    ficam no cache de respostas; None se a OpenAI não devolver um plano válido.
+    """
+    key = normalize_question(question)
+    cache = get_llm_cache()
+    cached_plan = cache.get("query_plan", key, QUERY_PLANNER_PROMPT_VERSION)
+    if cached_plan is not None:
+        return dict(cached_plan)
+
+    try:
+        content = await get_gateway().chat(
+            operation="query_plan",
+            messages=[
+                {"role": "system", "content": QUERY_PLANNER_PROMPT},
+                {"role": "user", "content": question},
+            ],
+            temperature=0,
+            # Forçar a resposta em formato JSON é mais confiável
+            response_format={"type": "json_object"},
+        )
+        parsed = json.loads(content.strip())
+        plan = schemas.parse_query_plan(parsed) if isinstance(parsed, dict) else None
+        if plan is None:
+            return None
+
+        query_plan = plan.to_dict()
+        cache.set("query_plan", key, QUERY_PLANNER_PROMPT_VERSION, query_plan)
+        return dict(query_plan)
+    except CircuitOpenError:
+        raise
+    except Exception as error:
+        logger.warning("Erro ao analisar query com OpenAI: %s", error)
+        return None
+
+
+def resolve_plan(query_plan: dict, today: date | None = None) -> dict:
+    """
+    Converte o plano simbólico no plano concreto que query_database executa,
+    com date_start/date_end em dias locais. Levanta ValueError se o plano for inválido.
+    """
+    plan = schemas.SymbolicQueryPlan.model_validate(query_plan)
+    filters = plan.filters.model_dump(exclude_none=True)
+
+    period = plan.period
+    if period is None and plan.aggregation in ANALYTICS_AGGREGATIONS:
+        # Análises sem período falam do mês atual
+        period = schemas.PlanPeriod(kind="this_month")
+    if period is not None:
+        if period.kind == "range":
+            start, end = period.date_start, period.date_end
+        else:
+            start, end = period_range(period.kind, today, days=period.days, month=period.month, year=period.year)
+        if start is not None:
+            filters["date_start"] = start.isoformat()
+        if end is not None:
+            filters["date_end"] = end.isoformat()
+
+    return schemas.QueryPlan(
+        aggregation=plan.aggregation, filters=filters, limit=plan.limit, budget=plan.budget
+    ).to_dict()
@@ -0,0 +1,184 @@
+"""
+Caminho rápido por regras para as frases mais comuns do nosso tráfego:
+"gastei X reais com Y", "recebi X de Z", "quanto gastei hoje/este mês",
+"últimas N transações".
+
+Produz o mesmo formato de transação de extract_transaction_details e o plano
+simbólico de services.query_planner; a OpenAI só é usada quando nenhuma regra
+atinge a confiança mínima.
+"""
+import os
+import re
+from dataclasses import dataclass
+
+from services.preclassifier import AMOUNT_PATTERN, strip_accents, to_float
+
+RULE_PARSER_ENABLED = os.environ.get("RULE_PARSER_ENABLED", "1") == "1"
+RULE_PARSER_MIN_CONFIDENCE = float(os.environ.get("RULE_PARSER_MIN_CONFIDENCE", "0.8"))
+
+# Mesmo mapa de categorias descrito no prompt de extract_transaction_details
+CATEGORY_KEYWORDS = {
+    "Salario": ["salario", "bonus", "freela", "freelas", "freelance"],
+    "Alimentacao": ["mercado", "supermercado", "restaurante", "lanche", "lanches", "ifood", "padaria", "almoco", "jantar"],
+    "Transporte": ["uber", "onibus", "combustivel", "gasolina", "metro", "taxi", "estacionamento"],
+    "Moradia": ["aluguel", "condominio", "luz", "agua", "internet", "energia", "gas"],
+    "Saude": ["farmacia", "medico", "plano de saude", "remedio", "remedios", "consulta", "dentista"],
+    "Educacao": ["curso", "cursos", "livro", "livros", "mensalidade", "faculdade", "escola"],
+    "Lazer": ["cinema", "streaming", "netflix", "spotify", "viagem", "viagens", "show", "bar"],
+}
+# O próprio nome da categoria também conta como palavra-chave ("quanto gastei com alimentacao")
+_KEYWORD_PATTERNS = [
+    (category, re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in [category.lower(), *keywords]) + r")\b"))
+    for category, keywords in CATEGORY_KEYWORDS.items()
+]
+
+_AMOUNT = AMOUNT_PATTERN.pattern
+_PREPOSITIONS = r"(?:com|no|na|nos|nas|num|numa|em|de|do|da|dos|das|pra|para|pro|pelo|pela)"
+
+EXPENSE_PATTERN = re.compile(
+    rf"^(?:eu\s+)?(?:gastei|paguei|comprei)\s+(?:r\$\s*)?(?P<valor>{_AMOUNT})(?:\s*(?:reais|real|conto|contos)\b)?"
+    rf"(?:\s+{_PREPOSITIONS}\b)?\s*(?P<descricao>.*?)$"
+)
+INCOME_PATTERN = re.compile(
+    rf"^(?:eu\s+)?(?:recebi|ganhei)\s+(?:r\$\s*)?(?P<valor>{_AMOUNT})(?:\s*(?:reais|real|conto|contos)\b)?"
+    rf"(?:\s+{_PREPOSITIONS}\b)?\s*(?P<descricao>.*?)$"
+)
+SUM_QUERY_PATTERN = re.compile(
+    r"^(?:quanto|qual (?:o )?total (?:que )?)\s*(?:eu )?(?P<verbo>gastei|paguei|recebi|ganhei)"
+    rf"(?:\s+{_PREPOSITIONS}\s+(?!mes\b|semana\b)(?P<categoria>[a-z ]+?))?"
+    r"(?:\s+(?P<periodo>hoje|ontem|(?:n?esta|n?essa) semana|(?:na )?semana passada|(?:n?este|n?esse) mes|(?:no )?mes passado))?$"
+)
+LIST_QUERY_PATTERN = re.compile(
+    r"^(?:liste|listar|lista|mostre|mostrar|mostra|quais (?:foram )?)?\s*(?:as |minhas )?(?:ultimas?)\s+"
+    r"(?P<limite>\d+)\s+(?P<objeto>transacoes|transacao|despesas|despesa|gastos|receitas|receita)$"
+)
+
+PERIOD_ALIASES = {
+    "hoje": "today",
+    "ontem": "yesterday",
+    "esta semana": "this_week",
+    "essa semana": "this_week",
+    "nesta semana": "this_week",
+    "nessa semana": "this_week",
+    "este mes": "this_month",
+    "esse mes": "this_month",
+    "neste mes": "this_month",
+    "nesse mes": "this_month",
+    "mes passado": "last_month",
+    "no mes passado": "last_month",
+    "semana passada": "last_week",
+    "na semana passada": "last_week",
+}
+
+
+def normalize(text: str) -> str:
+    text = strip_accents(text.lower())
+    text = re.sub(r"[!?.;]+$", "", text.strip())
+    return " ".join(text.split())
+
+
+def detect_category(text: str) -> str | None:
+    for category, pattern in _KEYWORD_PATTERNS:
+        if pattern.search(text):
+            return category
+    return None
+
+
+@dataclass
+class RuleMatch:
+    intent: str
+    confidence: float
+    rule: str
+    transaction: dict | None = None
+    query_plan: dict | None = None
+    period: str | None = None
+
+
+def _parse_transaction(text: str) -> RuleMatch | None:
+    for tipo, rule, pattern in (
+        ("despesa", "expense", EXPENSE_PATTERN),
+        ("receita", "income", INCOME_PATTERN),
+    ):
+        match = pattern.match(text)
+        if match is None:
+            continue
+
+        descricao = match.group("descricao").strip()
+        # Outro número na descrição ("gastei 10 e 20 no bar") torna o valor ambíguo
+        if AMOUNT_PATTERN.search(descricao):
+            return None
+
+        categoria = detect_category(descricao)
+        confidence = 0.95 if categoria else (0.7 if descricao else 0.5)
+
+        return RuleMatch(
+            intent="new_transaction",
+            confidence=confidence,
+            rule=rule,
+            transaction={
+                "tipo": tipo,
+                "valor": to_float(match.group("valor")),
+                "descricao": descricao.capitalize() if descricao else "não identificado",
+                "categoria": categoria or "Outros",
+            },
+        )
+    return None
+
+
+def _parse_query(text: str) -> RuleMatch | None:
+    match = SUM_QUERY_PATTERN.match(text)
+    if match is not None:
+        tipo = "receita" if match.group("verbo") in {"recebi", "ganhei"} else "despesa"
+        filters: dict = {"tipo": tipo}
+        confidence = 0.95
+
+        categoria_text = match.group("categoria")
+        if categoria_text and re.search(r"\b(?:semana|mes|ano|dia|dias)\b", categoria_text):
+            # Período que as regras não conhecem ("nos ultimos 10 dias"): fica para a OpenAI
+            return None
+        if categoria_text:
+            categoria = detect_category(categoria_text)
+            if categoria is None:
+                return None
+            filters["categoria"] = categoria
+
+        query_plan: dict = {"aggregation": "sum", "filters": filters}
+        # Plano simbólico: as datas são resolvidas na execução (ver services/query_planner.py)
+        period = PERIOD_ALIASES.get(match.group("periodo") or "")
+        if period:
+            query_plan["period"] = {"kind": period}
+
+        return RuleMatch(
+            intent="query_transactions",
+            confidence=confidence,
+            rule="sum_query",
+            query_plan=query_plan,
+            period=period,
+        )
+
+    match = LIST_QUERY_PATTERN.match(text)
+    if match is not None:
+        filters = {}
+        objeto = match.group("objeto")
+        if objeto.startswith(("despesa", "gasto")):
+            filters["tipo"] = "despesa"
+        elif objeto.startswith("receita"):
+            filters["tipo"] = "receita"
+        return RuleMatch(
+            intent="query_transactions",
+            confidence=0.95,
+            rule="list_query",
+            query_plan={"aggregation": "list", "filters": filters, "limit": int(match.group("limite"))},
+            period="last_n",
+        )
+    return None
+
+
+def parse_message(user_message: str) -> RuleMatch | None:
+    """
+    Aplica as regras à mensagem. Retorna o melhor resultado (com sua
+    confiança) ou None se nenhuma regra reconhecer a frase. Planos de consulta
+    saem no formato simbólico de services.query_planner.
+    """
+    text = normalize(user_message)
+    return _parse_transaction(text) or _parse_query(text)
@@ -0,0 +1,152 @@
+import logging
+from datetime import date
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+from services.dates import PeriodKind
+
+logger = logging.getLogger(__name__)
+
+INTENTS = {"new_transaction", "query_transactions", "unknown"}
+
+# "sum"/"list" consultam as transações; as demais são análises (services/analytics.py)
+Aggregation = Literal["sum", "list", "breakdown", "compare", "balance", "budget", "forecast"]
+
+
+class TransactionDetails(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    tipo: Literal["receita", "despesa"]
+    valor: float = Field(ge=0)
+    descricao: str = Field(min_length=1)
+    categoria: str = Field(min_length=1)
+
+
+class QueryFilters(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    date_start: str | None = None
+    date_end: str | None = None
+    tipo: Literal["receita", "despesa"] | None = None
+    categoria: str | None = None
+
+    @field_validator("date_start", "date_end")
+    @classmethod
+    def validate_date(cls, value: str | None) -> str | None:
+        if value is not None:
+            date.fromisoformat(value)
+        return value
+
+
+class QueryPlan(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    aggregation: Aggregation
+    filters: QueryFilters = Field(default_factory=QueryFilters)
+    limit: int | None = Field(default=None, gt=0)
+    budget: float | None = Field(default=None, gt=0)
+
+    def to_dict(self) -> dict:
+        plan: dict = {
+            "aggregation": self.aggregation,
+            "filters": self.filters.model_dump(exclude_none=True),
+        }
+        if self.limit is not None:
+            plan["limit"] = self.limit
+        if self.budget is not None:
+            plan["budget"] = self.budget
+        return plan
+
+
+class PlanPeriod(BaseModel):
+    """
+    Período relativo do plano de consulta, resolvido para datas só na execução.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    kind: PeriodKind
+    days: int | None = Field(default=None, gt=0, le=3660)
+    month: int | None = Field(default=None, ge=1, le=12)
+    year: int | None = Field(default=None, ge=1900, le=2200)
+    # Só para kind="range": datas absolutas ditas pelo usuário
+    date_start: date | None = None
+    date_end: date | None = None
+
+    @model_validator(mode="after")
+    def check_arguments(self) -> "PlanPeriod":
+        if self.kind == "last_n_days" and self.days is None:
+            raise ValueError("kind 'last_n_days' exige 'days'")
+        if self.kind == "month" and self.month is None:
+            raise ValueError("kind 'month' exige 'month'")
+        if self.kind == "range" and self.date_start is None and self.date_end is None:
+            raise ValueError("kind 'range' exige 'date_start' e/ou 'date_end'")
+        return self
+
+
+class PlanFilters(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    tipo: Literal["receita", "despesa"] | None = None
+    categoria: str | None = Field(default=None, min_length=1)
+
+
+class SymbolicQueryPlan(BaseModel):
+    """
+    Plano de consulta independente da data de hoje: pode ser cacheado por pergunta.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    aggregation: Aggregation
+    filters: PlanFilters = Field(default_factory=PlanFilters)
+    period: PlanPeriod | None = None
+    limit: int | None = Field(default=None, gt=0, le=500)
+    # Só para aggregation="budget": orçamento do mês em reais
+    budget: float | None = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_budget(self) -> "SymbolicQueryPlan":
+        if self.aggregation == "budget" and self.budget is None:
+            raise ValueError("aggregation 'budget' exige 'budget'")
+        return self
+
+    def to_dict(self) -> dict:
+        return self.model_dump(mode="json", exclude_none=True)
+
+
+class MessageUnderstanding(BaseModel):
+    """
+    Resposta combinada: intenção + conteúdo estruturado correspondente.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    intent: Literal["new_transaction", "query_transactions", "unknown"]
+    transaction: TransactionDetails | None = None
+    query_plan: SymbolicQueryPlan | None = None
+
+    @model_validator(mode="after")
+    def check_payload(self) -> "MessageUnderstanding":
+        if self.intent == "new_transaction" and self.transaction is None:
+            raise ValueError("intent 'new_transaction' exige o campo 'transaction'")
+        if self.intent == "query_transactions" and self.query_plan is None:
+            raise ValueError("intent 'query_transactions' exige o campo 'query_plan'")
+        return self
+
+
+def parse_understanding(data: dict) -> MessageUnderstanding | None:
+    try:
+        return MessageUnderstanding.model_validate(data)
+    except ValidationError as error:
+        logger.warning("Resposta combinada fora do esquema: %s erro(s)", error.error_count())
+        return None
+
+
+def parse_query_plan(data: dict) -> SymbolicQueryPlan | None:
+    try:
+        return SymbolicQueryPlan.model_validate(data)
+    except ValidationError as error:
+        logger.warning("Plano de consulta fora do esquema: %s erro(s)", error.error_count())
+        return None
@@ -0,0 +1,321 @@
+"""
+Estado compartilhado entre processos: cache, deduplicação, limites de taxa e locks.
+
+Com `uvicorn --workers N` ou vários `python worker.py`, cada processo tem a
+sua memória; o que precisa valer para todos (respostas da OpenAI já pagas,
+webhooks já recebidos, limite de envios à Zenvia, quem está migrando o
+banco) passa por um SharedState. SHARED_STATE_BACKEND escolhe a implementação:
+- "memory": dicionário do próprio processo (um único processo, testes);
+- "sqlite" (padrão): tabela shared_state em SHARED_STATE_PATH (modo WAL),
+  compartilhada pelos processos da mesma máquina e que sobrevive a restarts;
+- "redis": servidor em SHARED_STATE_URL, para processos em máquinas
+  diferentes. Depende do pacote opcional redis (pip install redis); qualquer
+  cliente compatível, como o fakeredis, pode ser passado em RedisState(client=...).
+
+Os valores precisam ser serializáveis em JSON e todas as chaves expiram.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any
+
+SHARED_STATE_BACKEND = os.environ.get("SHARED_STATE_BACKEND", "sqlite")
+SHARED_STATE_PATH = os.environ.get("SHARED_STATE_PATH", "./work_queue.db")
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "redis://localhost:6379/0")
+# Prefixo das chaves no Redis, para dividir o servidor com outras aplicações
+SHARED_STATE_PREFIX = os.environ.get("SHARED_STATE_PREFIX", "assistente:")
+SHARED_STATE_PRUNE_EVERY = 1000
+
+
+class LockTimeout(Exception):
+    pass
+
+
+def _gcra(rate: float, burst: int) -> tuple[float, float]:
+    """
+    Intervalo entre envios e quanto o TAT pode estar à frente de agora (rajada).
+    """
+    interval = 1 / rate
+    return interval, interval * (max(burst, 1) - 1)
+
+
+class SharedState(ABC):
+    """
+    Operações que os backends implementam. `add` só grava se a chave não
+    existir (ou já tiver expirado) e é a base da deduplicação e dos locks;
+    `rate_limit` é um token bucket (GCRA) guardado em uma única chave.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str, value: Any = None) -> None:
+        """
+        Remove a chave; com `value`, só se ela ainda guardar esse valor.
+        """
+
+    @abstractmethod
+    def rate_limit(self, key: str, rate: float, burst: int) -> float:
+        """
+        Reserva um envio em um limite de `rate` por segundo com rajadas de até
+        `burst`. Devolve 0 se liberou, ou quantos segundos esperar antes de tentar de novo.
+        """
+
+    def close(self) -> None:
+        pass
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = 30.0, timeout: float = 10.0, poll: float = 0.05):
+        """
+        Lock exclusivo entre processos. Expira em `ttl` para não ficar preso se
+        o dono morrer; levanta LockTimeout se não conseguir em `timeout`.
+        """
+        key = f"lock:{name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not self.add(key, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(f"lock {name!r} ocupado há mais de {timeout}s")
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            self.delete(key, token)
+
+
+class MemoryState(SharedState):
+    def __init__(self):
+        self._data: dict[str, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live(self, key: str, now: float) -> tuple[float, Any] | None:
+        item = self._data.get(key)
+        if item is not None and item[0] <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def _written(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % SHARED_STATE_PRUNE_EVERY == 0:
+            for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+                del self._data[key]
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._live(key, time.time())
+        return None if item is None else item[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._data[key] = (now + ttl, value)
+            self._written(now)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._data[key] = (now + ttl, value)
+            self._written(now)
+            return True
+
+    def delete(self, key: str, value: Any = None) -> None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (value is None or item[1] == value):
+                del self._data[key]
+
+    def rate_limit(self, key: str, rate: float, burst: int) -> float:
+        interval, tolerance = _gcra(rate, burst)
+        now = time.time()
+        with self._lock:
+            item = self._live(key, now)
+            # TAT: instante teórico em que o bucket volta a ficar cheio
+            tat = max(item[1] if item is not None else now, now)
+            if tat - now > tolerance:
+                return tat - tolerance - now
+            self._data[key] = (tat + interval + tolerance, tat + interval)
+            self._written(now)
+            return 0.0
+
+
+class SQLiteState(SharedState):
+    """
+    Uma linha por chave em shared_state; cada operação é uma única instrução,
+    atômica entre processos.
+    """
+
+    def __init__(self, path: str = SHARED_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_shared_state_expires_at ON shared_state (expires_at)")
+
+    def _written(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % SHARED_STATE_PRUNE_EVERY == 0:
+            self._conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM shared_state WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl),
+            )
+            self._written(now)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            # Insere, ou ocupa uma chave já expirada; se nada mudou a chave existe
+            cursor = self._conn.execute(
+                "INSERT INTO shared_state (key, value, expires_at) VALUES (:key, :value, :expires_at)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                " WHERE shared_state.expires_at <= :now",
+                {"key": key, "value": json.dumps(value, ensure_ascii=False), "expires_at": now + ttl, "now": now},
+            )
+            self._written(now)
+            return cursor.rowcount == 1
+
+    def delete(self, key: str, value: Any = None) -> None:
+        with self._lock:
+            if value is None:
+                self._conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "DELETE FROM shared_state WHERE key = ? AND value = ?",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+
+    def rate_limit(self, key: str, rate: float, burst: int) -> float:
+        interval, tolerance = _gcra(rate, burst)
+        now = time.time()
+        params = {"key": key, "now": now, "interval": interval, "tolerance": tolerance}
+        with self._lock:
+            # Avança o TAT só se ele estiver dentro da tolerância; uma chave
+            # expirada tem o TAT no passado e conta como bucket cheio
+            cursor = self._conn.execute(
+                "INSERT INTO shared_state (key, value, expires_at)"
+                " VALUES (:key, :now + :interval, :now + :interval + :tolerance)"
+                " ON CONFLICT(key) DO UPDATE SET"
+                "  value = MAX(CAST(shared_state.value AS REAL), :now) + :interval,"
+                "  expires_at = MAX(CAST(shared_state.value AS REAL), :now) + :interval + :tolerance"
+                " WHERE MAX(CAST(shared_state.value AS REAL), :now) - :now <= :tolerance",
+                params,
+            )
+            self._written(now)
+            if cursor.rowcount == 1:
+                return 0.0
+            row = self._conn.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+        return max(0.001, float(row[0]) - tolerance - now) if row else 0.001
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# Remove a chave só se ela ainda guardar o valor esperado (liberação de lock)
+_DELETE_IF_EQUAL = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+# GCRA: ARGV = agora, intervalo, tolerância (segundos); devolve a espera
+_RATE_LIMIT = """
+local now = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or ARGV[1]), now)
+if tat - now > tolerance then return tostring(tat - tolerance - now) end
+tat = tat + tonumber(ARGV[2])
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now + tolerance) * 1000))
+return '0'
+"""
+
+
+class RedisState(SharedState):
+    def __init__(self, url: str = SHARED_STATE_URL, client=None, prefix: str = SHARED_STATE_PREFIX):
+        if client is None:
+            # Dependência opcional: só necessária com SHARED_STATE_BACKEND=redis
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Any | None:
+        raw = self._client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), px=max(1, int(ttl * 1000)))
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        return bool(
+            self._client.set(
+                self.prefix + key, json.dumps(value, ensure_ascii=False), px=max(1, int(ttl * 1000)), nx=True
+            )
+        )
+
+    def delete(self, key: str, value: Any = None) -> None:
+        if value is None:
+            self._client.delete(self.prefix + key)
+        else:
+            self._client.eval(_DELETE_IF_EQUAL, 1, self.prefix + key, json.dumps(value, ensure_ascii=False))
+
+    def rate_limit(self, key: str, rate: float, burst: int) -> float:
+        interval, tolerance = _gcra(rate, burst)
+        return float(self._client.eval(_RATE_LIMIT, 1, self.prefix + key, time.time(), interval, tolerance))
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_shared_state(backend: str = SHARED_STATE_BACKEND) -> SharedState:
+    if backend == "memory":
+        return MemoryState()
+    if backend == "sqlite":
+        return SQLiteState()
+    if backend == "redis":
+        return RedisState()
+    raise ValueError(f"SHARED_STATE_BACKEND desconhecido: {backend!r}")
+
+
+_shared_state: SharedState | None = None
+
+
+def get_shared_state() -> SharedState:
+    global _shared_state
+    if _shared_state is None:
+        _shared_state = create_shared_state()
+    return _shared_state
@@ -0,0 +1,372 @@
+"""
+Importação em massa de extratos bancários (CSV e OFX).
+
+O arquivo é lido em streaming e gravado em lotes: cada lote de
+IMPORT_CHUNK_SIZE linhas vira um único executemany dentro da sua própria
+transação, junto com a atualização do rollup. Linhas já existentes (mesmo
+dono, dia, valor e descrição; ver models.dedupe_hash) são ignoradas, então
+reimportar o mesmo extrato não duplica nada. Descrições sem categoria são
+categorizadas uma vez por descrição distinta do lote, não linha a linha.
+"""
+import csv
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Iterable, Iterator, TextIO
+
+from sqlalchemy import insert, select
+
+from database import models
+from database.database import DatabaseWriter, DirectWriter, get_writer
+from database.rollups import rollup_deltas
+from services.dates import day_start_utc
+from services.preclassifier import strip_accents
+from services.rule_parser import detect_category
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "2000"))
+# "1" manda as descrições que as palavras-chave não reconhecem para o categorizador em lote
+IMPORT_LLM_CATEGORIZE = os.environ.get("IMPORT_LLM_CATEGORIZE", "0") == "1"
+# Quantas mensagens de erro a resposta traz; as demais linhas inválidas só são contadas
+IMPORT_MAX_ERRORS = 20
+
+CSV_COLUMNS = {
+    "data": {"data", "date", "dt", "data lancamento", "data do lancamento"},
+    "valor": {"valor", "amount", "value", "quantia", "valor (r$)"},
+    "descricao": {"descricao", "description", "historico", "memo", "lancamento", "estabelecimento"},
+    "categoria": {"categoria", "category"},
+    "tipo": {"tipo", "type"},
+}
+OFX_TRANSACTION_PATTERN = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+OFX_FIELD_PATTERN = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+class ImportFormatError(ValueError):
+    """O arquivo não parece um CSV/OFX de extrato que sabemos ler."""
+
+
+@dataclass
+class StatementRow:
+    day: date
+    valor: float
+    descricao: str
+    tipo: str
+    categoria: str | None = None
+
+
+@dataclass
+class ImportResult:
+    rows_read: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows_read / self.seconds, 1) if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+def parse_date(value: str) -> date:
+    """
+    Aceita 2026-02-12, 12/02/2026, 12/02/26 e o formato do OFX (20260212[hhmmss][...]).
+    """
+    value = value.strip()
+    if re.fullmatch(r"\d{8}.*", value):
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}.*", value):
+        return date.fromisoformat(value[:10])
+    match = re.fullmatch(r"(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})", value)
+    if match:
+        day, month, year = (int(part) for part in match.groups())
+        return date(year + 2000 if year < 100 else year, month, day)
+    raise ValueError(f"data inválida: {value!r}")
+
+
+def parse_number(value: str) -> float:
+    """
+    Número de extrato em formato brasileiro ou americano. O último separador
+    ("." ou ",") é o decimal e o outro só pode agrupar milhares: "1.234,56" e
+    "1,234.56" são 1234.56. Um único separador seguido de três dígitos
+    ("1,000", "1.500") é ambíguo e vira erro da linha em vez de um palpite.
+    """
+    if not re.fullmatch(r"[\d.,]*\d[\d.,]*", value):
+        raise ValueError(f"valor inválido: {value!r}")
+    decimal = max(".,", key=value.rfind)
+    if decimal not in value:
+        return float(value)
+    thousands = "," if decimal == "." else "."
+    integer, _, fraction = value.rpartition(decimal)
+    if thousands in value:
+        # Os dois aparecem: o último é o decimal e o outro agrupa milhares
+        if decimal in integer or thousands in fraction or not re.fullmatch(rf"\d{{1,3}}(?:\{thousands}\d{{3}})+", integer):
+            raise ValueError(f"valor inválido: {value!r}")
+        return float(f"{integer.replace(thousands, '')}.{fraction}")
+    if decimal in integer:
+        # O separador se repete ("1.000.000"): só pode agrupar milhares
+        if not re.fullmatch(rf"\d{{1,3}}(?:\{decimal}\d{{3}})+", value):
+            raise ValueError(f"valor inválido: {value!r}")
+        return float(value.replace(decimal, ""))
+    if len(fraction) == 3 and re.fullmatch(r"[1-9]\d{0,2}", integer):
+        raise ValueError(f"valor ambíguo: {value!r} (separador de milhar ou decimal?)")
+    return float(f"{integer or 0}.{fraction}")
+
+
+def parse_signed_amount(value: str) -> float:
+    """
+    Valor com sinal: "-1.234,56", "(52,90)", "R$ 10,00", "-12.5", "1,234.56".
+    """
+    value = value.strip().replace("R$", "").replace(" ", "")
+    negative = value.startswith("-") or (value.startswith("(") and value.endswith(")"))
+    value = value.strip("-+()")
+    if not value:
+        raise ValueError("valor vazio")
+    amount = parse_number(value)
+    return -amount if negative else amount
+
+
+def _row(day: date, amount: float, descricao: str, tipo: str | None, categoria: str | None) -> StatementRow:
+    tipo = (tipo or "").strip().lower()
+    if tipo not in {"despesa", "receita"}:
+        tipo = "despesa" if amount < 0 else "receita"
+    return StatementRow(
+        day=day,
+        valor=abs(amount),
+        descricao=" ".join(descricao.split()) or "não identificado",
+        tipo=tipo,
+        categoria=(categoria or "").strip() or None,
+    )
+
+
+def iter_csv(lines: Iterable[str]) -> Iterator[StatementRow | ValueError]:
+    """
+    Lê um CSV com cabeçalho, separado por vírgula ou ponto e vírgula.
+    Linhas inválidas são entregues como ValueError para serem contadas, não abortam a importação.
+    """
+    lines = iter(lines)
+    header_line = next(lines, "")
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    positions = {}
+    for index, name in enumerate(header):
+        name = strip_accents(name.strip().lower())
+        for column, aliases in CSV_COLUMNS.items():
+            if name in aliases and column not in positions:
+                positions[column] = index
+    missing = {"data", "valor", "descricao"} - positions.keys()
+    if missing:
+        raise ImportFormatError(f"colunas obrigatórias ausentes no CSV: {', '.join(sorted(missing))}")
+
+    def cell(values: list[str], column: str) -> str | None:
+        index = positions.get(column)
+        return values[index] if index is not None and index < len(values) else None
+
+    for values in csv.reader(lines, delimiter=delimiter):
+        if not values or not any(value.strip() for value in values):
+            continue
+        try:
+            yield _row(
+                parse_date(cell(values, "data") or ""),
+                parse_signed_amount(cell(values, "valor") or ""),
+                cell(values, "descricao") or "",
+                cell(values, "tipo"),
+                cell(values, "categoria"),
+            )
+        except (ValueError, IndexError) as error:
+            yield ValueError(f"linha {values!r}: {error}")
+
+
+def iter_ofx(stream: TextIO, chunk_size: int = 64 * 1024) -> Iterator[StatementRow | ValueError]:
+    """
+    Lê os <STMTTRN> de um OFX (SGML ou XML) em blocos, sem carregar o arquivo inteiro.
+    """
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        last_end = 0
+        for match in OFX_TRANSACTION_PATTERN.finditer(buffer):
+            last_end = match.end()
+            fields = {name.upper(): value.strip() for name, value in OFX_FIELD_PATTERN.findall(match.group(1))}
+            try:
+                yield _row(
+                    parse_date(fields.get("DTPOSTED", "")),
+                    parse_signed_amount(fields.get("TRNAMT", "")),
+                    fields.get("MEMO") or fields.get("NAME") or "",
+                    None,
+                    None,
+                )
+            except ValueError as error:
+                yield ValueError(f"STMTTRN {fields.get('FITID', '?')}: {error}")
+        buffer = buffer[last_end:]
+        if not chunk:
+            break
+
+
+def detect_format(first_line: str) -> str:
+    head = first_line.lstrip("﻿").strip().upper()
+    return "ofx" if head.startswith(("OFXHEADER", "<?XML", "<OFX")) else "csv"
+
+
+def categorize_descriptions(descriptions: Iterable[str]) -> dict[str, str]:
+    """
+    Categoria de cada descrição distinta, pelas mesmas palavras-chave do parser de regras.
+    """
+    return {
+        descricao: detect_category(strip_accents(descricao.lower())) or "Outros"
+        for descricao in set(descriptions)
+    }
+
+
+def categorize_with_llm(descriptions: Iterable[str]) -> dict[str, str]:
+    """
+    Palavras-chave primeiro; o que sobrar vai em lotes para o BatchCategorizer.
+    Precisa rodar em uma thread do threadpool (run_in_threadpool), pois volta
+    ao event loop para usar o cliente compartilhado da OpenAI.
+    """
+    import anyio.from_thread
+
+    from services.categorizer import get_categorizer
+
+    categories = {}
+    unknown = []
+    for descricao in set(descriptions):
+        categoria = detect_category(strip_accents(descricao.lower()))
+        if categoria:
+            categories[descricao] = categoria
+        else:
+            unknown.append(descricao)
+    if unknown:
+        categories.update(anyio.from_thread.run(get_categorizer().categorize, unknown))
+    return categories
+
+
+def import_rows(
+    owner: str,
+    rows: Iterable[StatementRow | ValueError],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    categorize: Callable[[Iterable[str]], dict[str, str]] = categorize_descriptions,
+    writer: DatabaseWriter | DirectWriter | None = None,
+) -> ImportResult:
+    """
+    Grava as linhas em lotes de `chunk_size`, cada lote em uma transação do
+    escritor do banco (get_writer, se `writer` não for informado).
+    Os inserts usam o Core (executemany), então categoria_key, dedupe_hash e o
+    rollup, que no ORM vêm dos eventos do modelo, são preenchidos aqui.
+    """
+    writer = writer or get_writer()
+    result = ImportResult()
+    started = time.perf_counter()
+    occurrences: dict[tuple, int] = {}
+    table = models.Transaction.__table__
+    chunk: list[StatementRow] = []
+
+    def flush() -> None:
+        if not chunk:
+            return
+        unknown = [row.descricao for row in chunk if not row.categoria]
+        categories = categorize(unknown) if unknown else {}
+
+        records = []
+        for row in chunk:
+            identity = (row.day, round(row.valor, 2), models.category_key(row.descricao))
+            occurrence = occurrences.get(identity, 0)
+            occurrences[identity] = occurrence + 1
+            categoria = row.categoria or categories.get(row.descricao, "Outros")
+            records.append({
+                "owner": owner,
+                "tipo": row.tipo,
+                "valor": row.valor,
+                "descricao": row.descricao,
+                "categoria": categoria,
+                "categoria_key": models.category_key(categoria),
+                # Meio-dia local: a linha fica no dia certo qualquer que seja o fuso
+                "data_criacao": day_start_utc(row.day) + timedelta(hours=12),
+                "dedupe_hash": models.dedupe_hash(owner, row.day, row.valor, row.descricao, occurrence),
+            })
+
+        def insert_chunk(session) -> int:
+            connection = session.connection()
+            existing = set(
+                connection.execute(
+                    select(table.c.dedupe_hash).where(
+                        table.c.owner == owner,
+                        table.c.dedupe_hash.in_([record["dedupe_hash"] for record in records]),
+                    )
+                ).scalars()
+            )
+            new_records = [record for record in records if record["dedupe_hash"] not in existing]
+            if new_records:
+                connection.execute(insert(table), new_records)
+                models.apply_rollup_deltas(
+                    connection,
+                    rollup_deltas(
+                        (owner, record["data_criacao"], record["tipo"], record["categoria_key"], record["valor"])
+                        for record in new_records
+                    ),
+                )
+            return len(new_records)
+
+        inserted = writer.write(insert_chunk)
+        result.inserted += inserted
+        result.duplicates += len(records) - inserted
+        chunk.clear()
+
+    for row in rows:
+        result.rows_read += 1
+        if isinstance(row, ValueError):
+            result.invalid += 1
+            if len(result.errors) < IMPORT_MAX_ERRORS:
+                result.errors.append(str(row))
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def import_statement(
+    owner: str,
+    stream: TextIO,
+    file_format: str = "auto",
+    categorize: Callable[[Iterable[str]], dict[str, str]] = categorize_descriptions,
+) -> ImportResult:
+    """
+    Importa um extrato CSV ou OFX já aberto em modo texto.
+    """
+    if file_format == "auto":
+        first_line = stream.readline()
+        file_format = detect_format(first_line)
+        if file_format == "csv":
+            rows = iter_csv(_prepend(first_line, stream))
+        else:
+            stream.seek(0)
+            rows = iter_ofx(stream)
+    elif file_format == "csv":
+        rows = iter_csv(stream)
+    elif file_format == "ofx":
+        rows = iter_ofx(stream)
+    else:
+        raise ImportFormatError(f"formato desconhecido: {file_format}")
+    return import_rows(owner, rows, categorize=categorize)
+
+
+def _prepend(first_line: str, lines: Iterable[str]) -> Iterator[str]:
+    yield first_line.lstrip("﻿")
+    yield from lines
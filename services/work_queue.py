@@ -0,0 +1,331 @@
+"""
+Fila persistente (SQLite) para as mensagens recebidas pelo webhook.
+
+O webhook só grava a mensagem e responde 200; um pool de workers assíncronos
+consome a fila. Garantias:
+- mensagens de um mesmo remetente são processadas em ordem (FIFO por remetente);
+- uma mensagem reservada e não confirmada dentro do visibility timeout volta
+  para a fila (worker que caiu, deploy no meio do processamento...);
+- depois de QUEUE_MAX_ATTEMPTS tentativas a mensagem vai para a tabela de
+  dead-letter em vez de ser tentada para sempre.
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from services.observability import REGISTRY, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DB_PATH = os.environ.get("QUEUE_DB_PATH", "./work_queue.db")
+QUEUE_VISIBILITY_TIMEOUT = float(os.environ.get("QUEUE_VISIBILITY_TIMEOUT", "120"))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("QUEUE_MAX_ATTEMPTS", "5"))
+QUEUE_MAX_DEPTH = int(os.environ.get("QUEUE_MAX_DEPTH", "10000"))
+QUEUE_POLL_INTERVAL = float(os.environ.get("QUEUE_POLL_INTERVAL", "0.5"))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_until REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_message_queue_status_available ON message_queue (status, available_at);
+CREATE INDEX IF NOT EXISTS ix_message_queue_sender_id ON message_queue (sender, id);
+CREATE TABLE IF NOT EXISTS message_dead_letter (
+    id INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    last_error TEXT
+);
+"""
+
+# Reserva a mensagem mais antiga que pode ser processada agora: pendente e
+# disponível, ou em processamento com o visibility timeout vencido, e sem
+# nenhuma mensagem anterior do mesmo remetente ainda na fila.
+CLAIM_SQL = """
+UPDATE message_queue
+SET status = 'processing', locked_until = :locked_until, attempts = attempts + 1
+WHERE id = (
+    SELECT q.id FROM message_queue q
+    WHERE (
+        (q.status = 'pending' AND q.available_at <= :now)
+        OR (q.status = 'processing' AND q.locked_until <= :now)
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM message_queue earlier
+        WHERE earlier.sender = q.sender AND earlier.id < q.id
+    )
+    ORDER BY q.id
+    LIMIT 1
+)
+RETURNING id, sender, text, attempts, created_at
+"""
+
+
+class QueueFullError(Exception):
+    """A fila atingiu QUEUE_MAX_DEPTH; o webhook deve pedir para a Zenvia reenviar depois."""
+
+
+@dataclass
+class QueuedMessage:
+    id: int
+    sender: str
+    text: str
+    attempts: int
+    created_at: float
+
+    @property
+    def key(self) -> str:
+        """
+        Identidade da mensagem que se mantém entre as tentativas. O id sozinho
+        pode se repetir se o arquivo da fila for recriado; com created_at, não.
+        """
+        return f"{self.id}:{self.created_at!r}"
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str = QUEUE_DB_PATH,
+        visibility_timeout: float = QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        max_depth: int = QUEUE_MAX_DEPTH,
+    ):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _pending_count(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM message_queue WHERE status = 'pending'"
+        ).fetchone()[0]
+
+    def enqueue(self, sender: str, text: str) -> int:
+        now = time.time()
+        with self._lock:
+            if self.max_depth and self._pending_count() >= self.max_depth:
+                raise QueueFullError(f"fila com {self.max_depth} mensagens pendentes")
+            cursor = self._conn.execute(
+                "INSERT INTO message_queue (sender, text, available_at, created_at) VALUES (?, ?, ?, ?)",
+                (sender, text, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> QueuedMessage | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                CLAIM_SQL, {"now": now, "locked_until": now + self.visibility_timeout}
+            ).fetchone()
+        return None if row is None else QueuedMessage(*row)
+
+    def ack(self, message: QueuedMessage) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM message_queue WHERE id = ?", (message.id,))
+
+    def release(self, message: QueuedMessage) -> None:
+        """
+        Devolve imediatamente uma mensagem reservada, sem contar a tentativa
+        (usado no desligamento do worker).
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE message_queue SET status = 'pending', locked_until = NULL, attempts = attempts - 1"
+                " WHERE id = ?",
+                (message.id,),
+            )
+
+    def nack(self, message: QueuedMessage, error: str) -> bool:
+        """
+        Devolve a mensagem para a fila com backoff, ou manda para a dead-letter
+        se as tentativas acabaram. Retorna True se ela foi para a dead-letter.
+        """
+        if message.attempts >= self.max_attempts:
+            self.dead_letter(message, error)
+            return True
+        delay = random.uniform(0, min(60.0, 2**message.attempts))
+        with self._lock:
+            self._conn.execute(
+                "UPDATE message_queue SET status = 'pending', locked_until = NULL, available_at = ?, last_error = ?"
+                " WHERE id = ?",
+                (time.time() + delay, error, message.id),
+            )
+        return False
+
+    def dead_letter(self, message: QueuedMessage, error: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO message_dead_letter (id, sender, text, attempts, created_at, failed_at, last_error)"
+                    " SELECT id, sender, text, attempts, created_at, ?, ? FROM message_queue WHERE id = ?",
+                    (time.time(), error, message.id),
+                )
+                self._conn.execute("DELETE FROM message_queue WHERE id = ?", (message.id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.error(
+            "Mensagem %s de %s enviada para a dead-letter: %s", message.id, message.sender, error,
+            extra={"message_id": message.id, "attempts": message.attempts},
+        )
+
+    def metrics(self) -> dict[str, float]:
+        with self._lock:
+            rows = dict(
+                self._conn.execute("SELECT status, COUNT(*) FROM message_queue GROUP BY status").fetchall()
+            )
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM message_queue WHERE status = 'pending'"
+            ).fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM message_dead_letter").fetchone()[0]
+        return {
+            "pending": rows.get("pending", 0),
+            "processing": rows.get("processing", 0),
+            "dead_letter": dead,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class WorkerPool:
+    """
+    `concurrency` workers assíncronos consumindo a fila. Cada mensagem tem no
+    máximo o visibility timeout para ser processada; depois disso é devolvida.
+    O handler recebe o remetente, o texto e QueuedMessage.key: uma mensagem
+    cancelada no timeout ou no desligamento pode ter gravado parte do seu
+    trabalho antes de voltar para a fila, e a chave permite não repeti-lo.
+    Se o handler levanta uma exceção a mensagem volta para a fila com backoff;
+    quando ela vai para a dead-letter, `on_dead_letter` é chamado com o
+    remetente e o texto (para avisar o usuário).
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        handler: Callable[[str, str, str], Awaitable[None]],
+        concurrency: int = WORKER_CONCURRENCY,
+        poll_interval: float = QUEUE_POLL_INTERVAL,
+        on_dead_letter: Callable[[str, str], Awaitable[None]] | None = None,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.on_dead_letter = on_dead_letter
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stats = {"processed": 0, "failed": 0, "dead_lettered": 0}
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        """Acorda os workers ociosos logo após um enqueue neste processo."""
+        self._wakeup.set()
+
+    async def _dead_lettered(self, message: QueuedMessage) -> None:
+        self.stats["dead_lettered"] += 1
+        if self.on_dead_letter is None:
+            return
+        try:
+            await self.on_dead_letter(message.sender, message.text)
+        except Exception:
+            logger.exception("Erro ao avisar sobre a mensagem %s na dead-letter", message.id)
+
+    async def _worker(self) -> None:
+        while True:
+            message = await asyncio.to_thread(self.queue.claim)
+            if message is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if message.attempts > self.queue.max_attempts:
+                # Reservada de novo após estourar o visibility timeout em todas as tentativas
+                await asyncio.to_thread(
+                    self.queue.dead_letter, message, "visibility timeout excedido em todas as tentativas"
+                )
+                await self._dead_lettered(message)
+                continue
+
+            if message.attempts == 1:
+                STAGE_SECONDS.observe(time.time() - message.created_at, "queue")
+            try:
+                await asyncio.wait_for(
+                    self.handler(message.sender, message.text, message.key),
+                    timeout=self.queue.visibility_timeout,
+                )
+            except asyncio.CancelledError:
+                # Desligamento: devolve a mensagem para outro worker pegar
+                await asyncio.to_thread(self.queue.release, message)
+                raise
+            except Exception as error:
+                self.stats["failed"] += 1
+                logger.warning(
+                    "Erro ao processar a mensagem %s (tentativa %s): %r", message.id, message.attempts, error,
+                    extra={"message_id": message.id},
+                )
+                if await asyncio.to_thread(self.queue.nack, message, repr(error)):
+                    await self._dead_lettered(message)
+            else:
+                self.stats["processed"] += 1
+                await asyncio.to_thread(self.queue.ack, message)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+_work_queue: WorkQueue | None = None
+
+
+def get_work_queue() -> WorkQueue:
+    global _work_queue
+    if _work_queue is None:
+        _work_queue = WorkQueue()
+    return _work_queue
+
+
+def _collect_queue_metrics():
+    if _work_queue is None:
+        return
+    metrics = _work_queue.metrics()
+    yield "assistente_queue_messages", "gauge", "Mensagens na fila persistente por estado", [
+        ({"status": status}, metrics[status]) for status in ("pending", "processing", "dead_letter")
+    ]
+    yield "assistente_queue_oldest_pending_age_seconds", "gauge", "Idade da mensagem pendente mais antiga", [
+        ({}, metrics["oldest_pending_age_seconds"])
+    ]
+
+
+REGISTRY.register_collector(_collect_queue_metrics)
@@ -0,0 +1,109 @@
+"""
+Envio de respostas pela Zenvia.
+
+send_reply não chama a API: grava a resposta no outbox persistente
+(services/outbox.py) e o ReplyDispatcher entrega com limite de taxa por canal
+e retentativas. deliver é a chamada HTTP em si, usada pelo dispatcher.
+"""
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# {channel} é trocado pelo canal da resposta (whatsapp, sms...)
+ZENVIA_API_URL = os.environ.get("ZENVIA_API_URL", "https://api.zenvia.com/v2/channels/{channel}/messages")
+ZENVIA_CHANNEL = os.environ.get("ZENVIA_CHANNEL", "whatsapp")
+ZENVIA_MAX_CONNECTIONS = int(os.environ.get("ZENVIA_MAX_CONNECTIONS", "20"))
+
+# Cliente HTTP compartilhado: mantém as conexões keep-alive com a Zenvia
+# em vez de abrir uma conexão TLS nova a cada resposta.
+_http_client: httpx.AsyncClient | None = None
+
+
+class DeliveryError(Exception):
+    """
+    Falha ao entregar uma resposta. `retryable` indica falha transitória
+    (rede, 429, 5xx); `retry_after` vem do cabeçalho Retry-After, se houver.
+    """
+
+    def __init__(self, message: str, retryable: bool, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=15.0,
+            limits=httpx.Limits(
+                max_connections=ZENVIA_MAX_CONNECTIONS,
+                max_keepalive_connections=ZENVIA_MAX_CONNECTIONS,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def zenvia_configured() -> bool:
+    return bool(os.environ.get("ZENVIA_API_TOKEN") and os.environ.get("ZENVIA_SENDER_ID"))
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def deliver(to: str, message: str, channel: str = ZENVIA_CHANNEL) -> None:
+    """
+    Faz o POST na API da Zenvia. Levanta DeliveryError se a resposta não foi aceita.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "X-API-TOKEN": os.environ.get("ZENVIA_API_TOKEN", ""),
+    }
+
+    data = {
+        "from": os.environ.get("ZENVIA_SENDER_ID", ""),
+        "to": to,
+        "contents": [
+            {
+                "type": "text",
+                "text": message,
+            }
+        ],
+    }
+
+    try:
+        response = await get_http_client().post(ZENVIA_API_URL.format(channel=channel), headers=headers, json=data)
+    except httpx.HTTPError as error:
+        raise DeliveryError(f"erro de conexão: {error!r}", retryable=True)
+
+    if response.status_code == 429 or response.status_code >= 500:
+        raise DeliveryError(f"HTTP {response.status_code}", retryable=True, retry_after=_retry_after(response))
+    if response.status_code >= 400:
+        raise DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}", retryable=False)
+
+
+async def send_reply(to: str, message: str, channel: str = ZENVIA_CHANNEL) -> None:
+    """
+    Grava a resposta no outbox; o dispatcher entrega assim que o limite de taxa permitir.
+    """
+    if not zenvia_configured():
+        logger.error("Erro ao enviar resposta: variaveis ZENVIA_API_TOKEN ou ZENVIA_SENDER_ID nao configuradas.")
+        return
+
+    from services.outbox import get_dispatcher
+
+    await get_dispatcher().enqueue(to, message, channel)
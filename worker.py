@@ -0,0 +1,54 @@
+"""
+Processo dedicado de workers: consome a fila persistente sem servir HTTP.
+
+Uso: WORKER_CONCURRENCY=16 python worker.py
+(com a API rodando com WORKER_CONCURRENCY=0, intake e processamento escalam separadamente)
+WORKER_METRICS_PORT expõe as métricas deste processo em http://host:porta/metrics.
+"""
+import asyncio
+import logging
+import os
+
+from services.observability import configure_logging, start_metrics_server
+from services.work_queue import WorkerPool, get_work_queue
+
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+async def run() -> None:
+    from database.database import close_writer, engine
+    from database.migrations import schema_ready
+    from main import process_message, reply_failure
+    from services.llm_gateway import close_gateway, preload_client
+    from services.outbox import get_dispatcher
+    from services.zenvia_service import close_http_client
+
+    configure_logging()
+    if not schema_ready(engine):
+        raise SystemExit("Schema do banco desatualizado: rode `python -m database.migrations` antes do worker.")
+
+    concurrency = int(os.environ.get("WORKER_CONCURRENCY", "8")) or 8
+    await preload_client()
+    pool = WorkerPool(get_work_queue(), process_message, concurrency=concurrency, on_dead_letter=reply_failure)
+    pool.start()
+    get_dispatcher().start()
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT)
+    logger.info("Worker iniciado com %s tarefas consumindo a fila.", concurrency)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+        await get_dispatcher().stop()
+        await close_http_client()
+        await close_gateway()
+        close_writer()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass